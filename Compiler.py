@@ -1,22 +1,44 @@
 from Model import *
 from Token import *
+from dispatch import DispatchTable
+from Resolver import *
 
 from llvmlite import ir
 import llvmlite.binding as llvm
 
 
 class Compiler:
-    def __init__(self):
+    # name of the failure flag of checked code
+    FAILED = 'wabbit.failed'
+
+    # float_type: ir.DoubleType() computes floats like Python does
+    # checked: ints are i64 and a function stops, setting the global FAILED,
+    # where the interpreter would get a different int or raise dividing by
+    # zero; its result is then meaningless
+    def __init__(self, float_type: ir.Type=ir.FloatType(), checked: bool=False):
+        self.checked = checked
         self.type_map = {
-            TokenType.TYPENAME_INTEGER: ir.IntType(32),
+            TokenType.TYPENAME_INTEGER: ir.IntType(64 if checked else 32),
             TokenType.TYPENAME_BOOL: ir.IntType(1),
             TokenType.TYPENAME_CHAR: ir.IntType(8),
-            TokenType.TYPENAME_FLOAT: ir.FloatType()
+            TokenType.TYPENAME_FLOAT: float_type
             }
 
         self.module = ir.Module('main')
         self.builder = None
-        self.variables = {}
+        self.failed = None
+        if checked:
+            self.failed = ir.GlobalVariable(self.module, ir.IntType(1), Compiler.FAILED)
+            self.failed.initializer = ir.Constant(ir.IntType(1), 0)
+        self.return_type = None
+        # (value or pointer, llvm type) in the slot of each resolved symbol,
+        # for the global frame and the frame of the function being compiled
+        self.globals = []
+        self.locals = []
+        self.functions = {}
+        # (entry block, end block, condition) of the loops around the
+        # statement being compiled, innermost last
+        self.loops = []
 
         llvm.load_library_permanently('wabbit/print_char.so')
         self.define_char_printf()
@@ -30,12 +52,12 @@ class Compiler:
         return_type = ir.VoidType()
         fnty = ir.FunctionType(return_type, [ir.IntType(8)])
         func = ir.Function(self.module, fnty, 'print_char')
-        self.variables = {'print_char':(func,ir.VoidType())}
+        self.functions['print_char'] = (func,ir.VoidType())
 
     def print_char(self,arg,Type):
         if arg == '\\n':
             arg='\n'
-        print_char_func, _ = self.variables['print_char']
+        print_char_func, _ = self.functions['print_char']
 
         arg = ord(arg)
 
@@ -50,245 +72,341 @@ class Compiler:
 
 
 
+    # returns from the function being compiled, flagging the failure, when
+    # condition holds
+    def fail_if(self, condition):
+        with self.builder.if_then(condition, likely=False):
+            self.builder.store(ir.Constant(ir.IntType(1), 1), self.failed)
+            self.builder.ret(ir.Constant(self.return_type, 0))
+
     def inc(self):
         self.i += 1
         return 1
 
-    def lookup_var(self, name:str):
-        if name in self.variables:
-            return self.variables[name]
-
-
-    def _compile(self, node: Node):
-        if isinstance(node, Literal):
-            llvm_type = self.type_map[node.type_token.token_type]
-            return ir.Constant(llvm_type, node.value), llvm_type
-        elif isinstance(node, VarDeclaration):
-            llvm_type = self.type_map[node.type_token.token_type]
-            value, typ = self._compile(node.expression)
-            if self.scope_depth == 0:
-                gvar = ir.GlobalVariable(self.module, llvm_type, node.name.lexeme)
-                gvar.linkage='internal'
-                gvar.initializer = value
-                self.variables[node.name.lexeme] = gvar, llvm_type
-            else:
-                ptr = self.builder.alloca(llvm_type)
-                self.builder.store(value, ptr)
-                self.variables[node.name.lexeme] = ptr, llvm_type
-
-
-        elif isinstance(node, ConstDeclaration):
-            llvm_type = self.type_map[node.type_token.token_type]
-            value,typ = self._compile(node.expression)
-            assert isinstance(node.expression, Literal) or isinstance(value, ir.values.Constant)
-            if self.scope_depth == 0:
-                gvar = ir.GlobalVariable(self.module, llvm_type,
-                                         node.name.lexeme)
-                gvar.linkage = 'internal'
-                gvar.global_constant = True
-                gvar.initializer = value
-                self.variables[node.name.lexeme] = gvar, llvm_type
-            else:
-                self.variables[node.name.lexeme] = value, typ
-
-
-
-        elif isinstance(node, FunctionDeclaration):
-            return_type = self.type_map[node.return_type.token_type]
-            args = []
-            for p in node.params:
-                t = self.type_map[p.type_token.token_type]
-                args.append(t)
-
-            fn_type = ir.FunctionType(return_type, tuple(args))
-            func = ir.Function(self.module, fn_type, name=node.name.lexeme)
-            block = func.append_basic_block()
-            self.builder = ir.IRBuilder(block)
-            previous_variables = self.variables.copy()
-            for i,p in enumerate(node.params):
-                t = self.type_map[p.type_token.token_type]
-                ptr = self.builder.alloca(t)
-                self.builder.store(func.args[i], ptr)
+    def frame(self, symbol: Symbol) -> list:
+        return self.globals if symbol.depth == 0 else self.locals
 
-                # params_ptr.append((ptr, t))
-                self.variables[p.name.token.lexeme] = (ptr,t)
 
-            self.scope_depth += 1
-            self._compile(node.body)
-            self.scope_depth -= 1
+    # node class -> method(self, node) returning (value, llvm type) for
+    # expressions, nodes without one compile to nothing
+    Handlers = DispatchTable(default=lambda self, node: None)
 
-            self.variables = previous_variables
-            self.variables[node.name.lexeme] = func, return_type
-
-            self.builder = None
-            return func, return_type
-
-
-            # rest of function declaration will get implemented by block
-        elif isinstance(node, Block):
-            for stmt in node.statements:
-                self._compile(stmt)
-
-
-        elif isinstance(node, IfStatement):
-            cond, typ = self._compile(node.condition)
-            if node.else_branch:
-                with self.builder.if_else(cond) as (true,false):
-                    self.scope_depth += 1
-                    with true:
-                        self._compile(node.then_branch)
-                    with false:
-                        self._compile(node.else_branch)
-
-                    self.scope_depth -= 1
+    def _compile(self, node: Node):
+        return Compiler.Handlers[type(node)](self, node)
+
+    @Handlers.register(Literal)
+    def compile_literal(self, node: Literal):
+        llvm_type = self.type_map[node.type_token.token_type]
+        return ir.Constant(llvm_type, node.value), llvm_type
+
+    @Handlers.register(VarDeclaration)
+    def compile_var_declaration(self, node: VarDeclaration):
+        llvm_type = self.type_map[node.type_token.token_type]
+        value, typ = self._compile(node.expression)
+        if node.symbol.depth == 0:
+            gvar = ir.GlobalVariable(self.module, llvm_type, node.name.lexeme)
+            gvar.linkage='internal'
+            gvar.initializer = value
+            self.globals[node.symbol.index] = gvar, llvm_type
+        else:
+            ptr = self.alloca(llvm_type)
+            self.builder.store(value, ptr)
+            self.locals[node.symbol.index] = ptr, llvm_type
+
+    # stack slot in the entry block, so a declaration inside a loop does not
+    # grow the stack every iteration and mem2reg can promote it
+    def alloca(self, llvm_type):
+        entry = self.builder.function.entry_basic_block
+        if self.builder.block is entry:
+            return self.builder.alloca(llvm_type)
+        with self.builder.goto_block(entry):
+            return self.builder.alloca(llvm_type)
+
+    @Handlers.register(ConstDeclaration)
+    def compile_const_declaration(self, node: ConstDeclaration):
+        llvm_type = self.type_map[node.type_token.token_type]
+        value,typ = self._compile(node.expression)
+        assert isinstance(node.expression, Literal) or isinstance(value, ir.values.Constant)
+        if node.symbol.depth == 0:
+            gvar = ir.GlobalVariable(self.module, llvm_type,
+                                     node.name.lexeme)
+            gvar.linkage = 'internal'
+            gvar.global_constant = True
+            gvar.initializer = value
+            self.globals[node.symbol.index] = gvar, llvm_type
+        else:
+            self.locals[node.symbol.index] = value, typ
+
+    @Handlers.register(FunctionDeclaration)
+    def compile_function_declaration(self, node: FunctionDeclaration):
+        return_type = self.type_map[node.return_type.token_type]
+        args = []
+        for p in node.params:
+            t = self.type_map[p.type_token.token_type]
+            args.append(t)
+
+        fn_type = ir.FunctionType(return_type, tuple(args))
+        func = ir.Function(self.module, fn_type, name=node.name.lexeme)
+        block = func.append_basic_block()
+        self.builder = ir.IRBuilder(block)
+        # registered before the body so that it can call itself
+        self.functions[node.name.lexeme] = func, return_type
+        self.return_type = return_type
+        outer_locals = self.locals
+        self.locals = [None] * node.frame_size
+        for i,p in enumerate(node.params):
+            t = self.type_map[p.type_token.token_type]
+            ptr = self.builder.alloca(t)
+            self.builder.store(func.args[i], ptr)
+
+            # params_ptr.append((ptr, t))
+            self.locals[p.symbol.index] = (ptr,t)
+
+        self.scope_depth += 1
+        self._compile(node.body)
+        self.scope_depth -= 1
+        # falling off the end, e.g. the empty block after an if whose
+        # branches both return
+        if not self.builder.block.is_terminated:
+            self.builder.unreachable()
+
+        self.locals = outer_locals
 
-            else:
-                with self.builder.if_then(cond):
-                    self.scope_depth += 1
+        self.builder = None
+        return func, return_type
+
+    # rest of function declaration will get implemented by block
+    @Handlers.register(Block)
+    def compile_block(self, node: Block):
+        for stmt in node.statements:
+            self._compile(stmt)
+
+    @Handlers.register(IfStatement)
+    def compile_if_statement(self, node: IfStatement):
+        cond, typ = self._compile(node.condition)
+        if node.else_branch:
+            with self.builder.if_else(cond) as (true,false):
+                self.scope_depth += 1
+                with true:
                     self._compile(node.then_branch)
-                    self.scope_depth -= 1
-
-        elif isinstance(node, PrintStatement):
-            # arg, type = self._compile(node.expression)
-            ret = self.print_char(node.expression.value, type)
-            ret_type = self.type_map[TokenType.TYPENAME_INTEGER]
-            return ret, ret_type
+                with false:
+                    self._compile(node.else_branch)
+
+                self.scope_depth -= 1
+
+        else:
+            with self.builder.if_then(cond):
+                self.scope_depth += 1
+                self._compile(node.then_branch)
+                self.scope_depth -= 1
+
+    @Handlers.register(PrintStatement)
+    def compile_print_statement(self, node: PrintStatement):
+        # arg, type = self._compile(node.expression)
+        ret = self.print_char(node.expression.value, type)
+        ret_type = self.type_map[TokenType.TYPENAME_INTEGER]
+        return ret, ret_type
+
+    @Handlers.register(WhileStatement)
+    def compile_while_statement(self, node: WhileStatement):
+        cond, typ =self._compile(node.condition)
+
+        while_entry = self.builder.append_basic_block("while_entry" +
+                                                      str(self.inc()))
+
+        while_loop_end = self.builder.append_basic_block("while_end"+str(self.i))
+
+
+        self.builder.cbranch(cond, while_entry, while_loop_end)
+
+        # Setting the builder position-at-start
+        self.builder.position_at_start(while_entry)
+        self.loops.append((while_entry, while_loop_end, node.condition))
+        self._compile(node.body)
+        self.loops.pop()
+        cond, typ =self._compile(node.condition)
+        self.builder.cbranch(cond, while_entry, while_loop_end)
+        self.builder.position_at_start(while_loop_end)
+
+    # the statements after a jump are compiled into a block nothing branches to
+    def after_jump(self):
+        self.builder.position_at_start(self.builder.append_basic_block("after_jump" + str(self.inc())))
+
+    @Handlers.register(Break)
+    def compile_break(self, node: Break):
+        _, while_loop_end, _ = self.loops[-1]
+        self.builder.branch(while_loop_end)
+        self.after_jump()
+
+    @Handlers.register(Continue)
+    def compile_continue(self, node: Continue):
+        while_entry, while_loop_end, condition = self.loops[-1]
+        cond, typ = self._compile(condition)
+        self.builder.cbranch(cond, while_entry, while_loop_end)
+        self.after_jump()
+
+    @Handlers.register(Call)
+    def compile_call(self, node: Call):
+        func_name = node.callee.token.lexeme
+        func,ret_type = self.functions[func_name]
+        args = []
+        types = []
+        for arg in node.arguments:
+            a, t = self._compile(arg)
+            args.append(a)
+            types.append(t)
+
+        ret = self.builder.call(func,args)
+        if self.checked:
+            self.fail_if(self.builder.load(self.failed))
+
+        return ret, ret_type
+
+    @Handlers.register(Parameter)
+    def compile_parameter(self, node: Parameter):
+        pass
+
+    @Handlers.register(Grouping)
+    def compile_grouping(self, node: Grouping):
+        return self._compile(node.expression)
+
+    @Handlers.register(UnaryOp)
+    def compile_unary_op(self, node: UnaryOp):
+        assert isinstance(node.expression, Literal)
+        assert node.op.token_type ==TokenType.MINUS
+        # yeesh
+        llvm_type = self.type_map[node.expression.type_token.token_type]
+        return ir.Constant(llvm_type, -node.expression.value), llvm_type
+
+    @Handlers.register(Return)
+    def compile_return(self, node: Return):
+        value, typ = self._compile(node.expression)
+        self.builder.ret(value)
+
+    @Handlers.register(BinaryOp)
+    def compile_binary_op(self, node: BinaryOp):
+        lhs, lhs_type  = self._compile(node.left_expression)
+        rhs, rhs_type  = self._compile(node.right_expression)
+
+        if self.checked and lhs_type == self.type_map[TokenType.TYPENAME_INTEGER]:
+            return self.checked_int_op(node, lhs, rhs), lhs_type
+        elif self.checked and node.op.token_type == TokenType.SLASH:
+            self.fail_if(self.builder.fcmp_ordered('==', rhs, ir.Constant(rhs_type, 0)))
+            return self.builder.fdiv(lhs, rhs), lhs_type
+        elif isinstance(lhs_type, ir.types.IntType) and lhs_type.width == 32:
+            if node.op.token_type == TokenType.PLUS:
+                return self.builder.add(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.MINUS:
+                return self.builder.sub(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.STAR:
+                return self.builder.mul(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.SLASH:
+                return self.builder.sdiv(lhs, rhs), lhs_type
+        else:
+            if node.op.token_type == TokenType.PLUS:
+                return self.builder.fadd(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.MINUS:
+                return self.builder.fsub(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.STAR:
+                return self.builder.fmul(lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.SLASH:
+                return self.builder.fdiv(lhs, rhs), lhs_type
 
-        elif isinstance(node, WhileStatement):
-            cond, typ =self._compile(node.condition)
-
-            while_entry = self.builder.append_basic_block("while_entry" +
-                                                          str(self.inc()))
-
-            while_loop_end = self.builder.append_basic_block("while_end"+str(self.i))
-
-
-            self.builder.cbranch(cond, while_entry, while_loop_end)
-
-            # Setting the builder position-at-start
-            self.builder.position_at_start(while_entry)
-            self._compile(node.body)
-            cond, typ =self._compile(node.condition)
-            self.builder.cbranch(cond, while_entry, while_loop_end)
-            self.builder.position_at_start(while_loop_end)
-
-
-        elif isinstance(node, Call):
-            func_name = node.callee.token.lexeme
-            func,ret_type = self.variables[func_name]
-            args = []
-            types = []
-            for arg in node.arguments:
-                a, t = self._compile(arg)
-                args.append(a)
-                types.append(t)
-
-            ret = self.builder.call(func,args)
-
-            return ret, ret_type
-
-        elif isinstance(node, Parameter):
-            pass
-        elif isinstance(node, Grouping):
-            return self._compile(node.expression)
-        elif isinstance(node, UnaryOp):
-            assert isinstance(node.expression, Literal)
-            assert node.op.token_type ==TokenType.MINUS
-            # yeesh
-            llvm_type = self.type_map[node.expression.type_token.token_type]
-            return ir.Constant(llvm_type, -node.expression.value), llvm_type
-
-
-
-
-        elif isinstance(node, Return):
-            value, typ = self._compile(node.expression)
-            self.builder.ret(value)
-
-        elif isinstance(node, BinaryOp):
-            lhs, lhs_type  = self._compile(node.left_expression)
-            rhs, rhs_type  = self._compile(node.right_expression)
-
-            if isinstance(lhs_type, ir.types.IntType) and lhs_type.width == 32:
-                if node.op.token_type == TokenType.PLUS:
-                    return self.builder.add(lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.MINUS:
-                    return self.builder.sub(lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.STAR:
-                    return self.builder.mul(lhs, rhs), lhs_type
-            else:
-                if node.op.token_type == TokenType.PLUS:
-                    return self.builder.fadd(lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.MINUS:
-                    return self.builder.fsub(lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.STAR:
-                    return self.builder.fmul(lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.SLASH:
-                    return self.builder.fdiv(lhs, rhs), lhs_type
-
-                else:
-                    raise ValueError(f"Unsupported binary operator {node.op}")
-
-        elif isinstance(node, LogicalExpression):
-            lhs, lhs_type  = self._compile(node.left_expression)
-            rhs, rhs_type  = self._compile(node.right_expression)
-
-            if isinstance(lhs_type, ir.types.IntType) and lhs_type.width == 32:
-                if node.op.token_type == TokenType.LESS:
-                    return self.builder.icmp_signed('<', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.LESS_EQUAL:
-                    return self.builder.icmp_signed('<=', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.GREATER:
-                    return self.builder.icmp_signed('>', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.GREATER_EQUAL:
-                    return self.builder.icmp_signed('>=', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.EQUAL_EQUAL:
-                    return self.builder.icmp_signed('==', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.BANG_EQUAL:
-                    return self.builder.icmp_signed('!=', lhs, rhs), lhs_type
-                else:
-                    raise ValueError(f"Unsupported logical operator {node.op}")
             else:
-                if node.op.token_type == TokenType.LESS:
-                    return self.builder.fcmp_ordered('<', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.LESS_EQUAL:
-                    return self.builder.fcmp_ordered('<=', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.GREATER:
-                    return self.builder.fcmp_ordered('>', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.GREATER_EQUAL:
-                    return self.builder.fcmp_ordered('>=', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.EQUAL_EQUAL:
-                    return self.builder.fcmp_ordered('==', lhs, rhs), lhs_type
-                elif node.op.token_type == TokenType.BANG_EQUAL:
-                    return self.builder.fcmp_ordered('!=', lhs, rhs), lhs_type
-                else:
-                    raise ValueError(f"Unsupported logical operator {node.op}")
-
-
-
-
-        elif isinstance(node, Name):
-            if node.token.lexeme not in self.variables:
-                raise ValueError(f"Could not find '{node.token.lexeme}' in allocated variables")
-
-            ptr, typ = self.variables[node.token.lexeme]
-            if isinstance(ptr, ir.instructions.AllocaInstr):
-                return self.builder.load(ptr), typ
+                raise ValueError(f"Unsupported binary operator {node.op}")
+
+    # Python ints do not overflow and dividing one by zero raises
+    def checked_int_op(self, node: BinaryOp, lhs, rhs):
+        op = node.op.token_type
+        if op == TokenType.SLASH:
+            int_type = lhs.type
+            minimum = ir.Constant(int_type, -2**(int_type.width - 1))
+            overflow = self.builder.and_(self.builder.icmp_signed('==', lhs, minimum),
+                                         self.builder.icmp_signed('==', rhs, ir.Constant(int_type, -1)))
+            self.fail_if(self.builder.or_(self.builder.icmp_signed('==', rhs, ir.Constant(int_type, 0)), overflow))
+            return self.builder.sdiv(lhs, rhs)
+        if op == TokenType.PLUS:
+            result = self.builder.sadd_with_overflow(lhs, rhs)
+        elif op == TokenType.MINUS:
+            result = self.builder.ssub_with_overflow(lhs, rhs)
+        elif op == TokenType.STAR:
+            result = self.builder.smul_with_overflow(lhs, rhs)
+        else:
+            raise ValueError(f"Unsupported binary operator {node.op}")
+        self.fail_if(self.builder.extract_value(result, 1))
+        return self.builder.extract_value(result, 0)
+
+    @Handlers.register(LogicalExpression)
+    def compile_logical_expression(self, node: LogicalExpression):
+        lhs, lhs_type  = self._compile(node.left_expression)
+        rhs, rhs_type  = self._compile(node.right_expression)
+
+        # int and bool
+        if isinstance(lhs_type, ir.types.IntType):
+            if node.op.token_type == TokenType.LESS:
+                return self.builder.icmp_signed('<', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.LESS_EQUAL:
+                return self.builder.icmp_signed('<=', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.GREATER:
+                return self.builder.icmp_signed('>', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.GREATER_EQUAL:
+                return self.builder.icmp_signed('>=', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.EQUAL_EQUAL:
+                return self.builder.icmp_signed('==', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.BANG_EQUAL:
+                return self.builder.icmp_signed('!=', lhs, rhs), lhs_type
             else:
-                return ptr, typ
-        elif isinstance(node, Assignment):
-            value, typ = self._compile(node.expression)
-            if node.name.lexeme in self.variables:
-                ptr, typ = self.variables[node.name.lexeme]
-                self.builder.store(value, ptr)
+                raise ValueError(f"Unsupported logical operator {node.op}")
+        else:
+            if node.op.token_type == TokenType.LESS:
+                return self.builder.fcmp_ordered('<', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.LESS_EQUAL:
+                return self.builder.fcmp_ordered('<=', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.GREATER:
+                return self.builder.fcmp_ordered('>', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.GREATER_EQUAL:
+                return self.builder.fcmp_ordered('>=', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.EQUAL_EQUAL:
+                return self.builder.fcmp_ordered('==', lhs, rhs), lhs_type
+            elif node.op.token_type == TokenType.BANG_EQUAL:
+                return self.builder.fcmp_ordered('!=', lhs, rhs), lhs_type
             else:
-                ptr = self.builder.alloca(typ)
-                self.builder.store(value, ptr)
-                self.variables[name] = ptr,typ
-
+                raise ValueError(f"Unsupported logical operator {node.op}")
+
+    @Handlers.register(Name)
+    def compile_name(self, node: Name):
+        symbol = node.symbol
+        if symbol is None or self.frame(symbol)[symbol.index] is None:
+            raise ValueError(f"Could not find '{node.token.lexeme}' in allocated variables")
+
+        ptr, typ = self.frame(symbol)[symbol.index]
+        # globals read inside a function are loaded like locals
+        if isinstance(ptr, ir.instructions.AllocaInstr) or \
+                (isinstance(ptr, ir.GlobalVariable) and self.builder is not None):
+            return self.builder.load(ptr), typ
+        else:
+            return ptr, typ
+
+    @Handlers.register(Assignment)
+    def compile_assignment(self, node: Assignment):
+        value, typ = self._compile(node.expression)
+        symbol = node.symbol
+        if symbol is None or self.frame(symbol)[symbol.index] is None:
+            raise ValueError(f"Could not find '{node.name.lexeme}' in allocated variables")
+
+        ptr, typ = self.frame(symbol)[symbol.index]
+        self.builder.store(value, ptr)
+
+
+    # LLVM IR for the program in self.module
+    def build(self, block: Block):
+        if not is_resolved(block):
+            resolve(block)
+        self.globals = [None] * block.frame_size
+        self._compile(block)
 
     def compile(self, block: Block):
-        self._compile(block)
+        self.build(block)
         llvm.initialize()
         llvm.initialize_native_target()
         llvm.initialize_native_asmprinter()
@@ -0,0 +1,113 @@
+from typing import List, Tuple
+from bisect import bisect_right
+from Token import *
+from Model import *
+from Scanner import *
+from Parser import *
+
+
+# Tokens of one top-level statement and the offset of its first token
+class Segment:
+    __slots__ = ('start', 'tokens')
+
+    def __init__(self, start: int, tokens: List[Token]):
+        self.start = start
+        self.tokens = tokens
+
+
+# Keeps the source, the top-level statements of the parsed Block and their
+# tokens so an edit only re-scans from the top-level statement containing it
+# until the token stream lines up with an untouched statement again, and only
+# the statements in between are re-parsed and spliced into the Block.
+class IncrementalFrontEnd:
+    def __init__(self, source: str, parser_class=Parser):
+        self.source = source
+        self.parser_class = parser_class
+        self.segments: List[Segment] = []
+
+        tokens, starts, _, _ = self.scan(source, 0, 1, 0)
+        statements, self.segments = self.parse_segments(tokens, starts)
+        self.block = Block(statements)
+
+    # Scan source from pos until the first token at which an old segment
+    # (from index `resync` on, shifted by delta) starts again. A segment only
+    # counts once it lies past edit_end and the tokens scanned so far end a
+    # complete statement. Returns the tokens before that point, their offsets,
+    # the index of the segment found and the line its first token now has.
+    def scan(self, source: str, pos: int, line: int, resync: int, delta: int=0,
+             edit_end: int=0) -> Tuple[List[Token], List[int], int, int]:
+        scanner = RegexScanner(source)
+        segments = self.segments
+        count = len(segments)
+        statement_ends = (TokenType.SEMICOLON, TokenType.RIGHT_BRACE)
+        tokens = []
+        starts = []
+        depth = 0
+        k = resync
+        for token in scanner.iter_tokens(pos, line):
+            start = scanner.start
+            while k < count and segments[k].start + delta < start:
+                k += 1
+            if (k < count and segments[k].start + delta == start and segments[k].start >= edit_end
+                    and depth == 0 and (not tokens or tokens[-1].token_type in statement_ends)):
+                return tokens, starts, k, token.line
+
+            tt = token.token_type
+            if tt == TokenType.LEFT_BRACE or tt == TokenType.LEFT_PAREN:
+                depth += 1
+            elif tt == TokenType.RIGHT_BRACE or tt == TokenType.RIGHT_PAREN:
+                depth -= 1
+            tokens.append(token)
+            starts.append(start)
+
+        return tokens, starts, count, scanner.line
+
+    def parse_segments(self, tokens: List[Token], starts: List[int]) -> Tuple[List[Statement], List[Segment]]:
+        line = tokens[-1].line if tokens else 1
+        parser = self.parser_class(tokens + [Token(TokenType.EOF, "", line)])
+        statements = []
+        segments = []
+        while not parser.is_at_end():
+            first = parser.current
+            statements.append(parser.statement())
+            segments.append(Segment(starts[first], tokens[first:parser.current]))
+
+        return statements, segments
+
+    # Replace `deleted` characters at `offset` with `inserted`. Returns the
+    # index of the first replaced top-level statement, the statements removed
+    # from the Block and the ones that took their place. A syntax error in the
+    # re-parsed region rejects the edit and leaves the front end unchanged.
+    def edit(self, offset: int, deleted: int, inserted: str) -> Tuple[int, List[Statement], List[Statement]]:
+        segments = self.segments
+        source = self.source[:offset] + inserted + self.source[offset + deleted:]
+        delta = len(inserted) - deleted
+
+        # restart at the statement holding the character before the edit, so
+        # a token ending right where the edit starts can still grow
+        first = bisect_right([s.start for s in segments], offset - 1) - 1
+        if first < 0:
+            first, resync = 0, 0
+            pos, line = 0, 1
+        else:
+            resync = first + 1
+            pos, line = segments[first].start, segments[first].tokens[0].line
+
+        tokens, starts, resync, resync_line = self.scan(source, pos, line, resync, delta, offset + deleted)
+        statements, new_segments = self.parse_segments(tokens, starts)
+
+        # untouched tail: shift the offsets and, when lines were added or
+        # removed, the line of every token the AST holds on to
+        if resync < len(segments):
+            line_delta = resync_line - segments[resync].tokens[0].line
+            for segment in segments[resync:]:
+                segment.start += delta
+                if line_delta:
+                    for token in segment.tokens:
+                        token.line += line_delta
+
+        self.source = source
+        removed = self.block.statements[first:resync]
+        self.block.statements[first:resync] = statements
+        segments[first:resync] = new_segments
+        return first, removed, statements
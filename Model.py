@@ -2,58 +2,86 @@
 from typing import Union, List
 from typing import TypeVar, Generic
 from Token import *
+# All nodes declare __slots__, including the attributes the Resolver and the
+# TypeChecker annotate them with, so no node carries a per-instance __dict__.
 class Node:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
 class Expression(Node):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
 class Statement(Node):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
 
+# One shared type token per type name, used by literals and by the
+# TypeChecker for inferred declaration types. Never mutate these.
+TypeTokens = {
+    TokenType.TYPENAME_INTEGER: Token(TokenType.TYPENAME_INTEGER, 'int'),
+    TokenType.TYPENAME_FLOAT: Token(TokenType.TYPENAME_FLOAT, 'float'),
+    TokenType.TYPENAME_BOOL: Token(TokenType.TYPENAME_BOOL, 'bool'),
+    TokenType.TYPENAME_CHAR: Token(TokenType.TYPENAME_CHAR, 'char'),
+}
+
+
+# Wabbit division: true division for floats, ints truncate toward zero like C
+def divide(lhs, rhs):
+    if isinstance(lhs, float):
+        return lhs / rhs
+    quotient = abs(lhs) // abs(rhs)
+    return quotient if (lhs < 0) == (rhs < 0) else -quotient
+
+
 class Literal:
+    __slots__ = ('value', 'type_token')
+
     def __init__(self, value: str):
         assert(len(value) > 0)
         if value[0].isdigit():
             if value.isdigit():
                 self.value = int(value)
-                self.type_token = Token(TokenType.TYPENAME_INTEGER, 'int')
+                self.type_token = TypeTokens[TokenType.TYPENAME_INTEGER]
             else:
                 self.value = float(value)
-                self.type_token = Token(TokenType.TYPENAME_FLOAT, 'float')
+                self.type_token = TypeTokens[TokenType.TYPENAME_FLOAT]
         elif value == 'true':
             self.value = True
-            self.type_token = Token(TokenType.TYPENAME_BOOL, 'bool')
+            self.type_token = TypeTokens[TokenType.TYPENAME_BOOL]
         elif value == 'false':
             self.value = False
-            self.type_token = Token(TokenType.TYPENAME_BOOL, 'bool')
+            self.type_token = TypeTokens[TokenType.TYPENAME_BOOL]
         else:
             # char
             self.value = value
-            self.type_token = Token(TokenType.TYPENAME_CHAR, 'char')
+            self.type_token = TypeTokens[TokenType.TYPENAME_CHAR]
 
     def __add__(self, other):
         assert isinstance(self.value, (int,float))
-        return Literal(self.value + other.value)
+        return literal(self.value + other.value)
 
     def __sub__(self, other):
         assert isinstance(self.value, (int,float))
-        return Literal(self.value - other.value)
+        return literal(self.value - other.value)
 
     def __mul__(self, other):
         assert isinstance(self.value, (int,float))
-        return Literal(self.value * other.value)
+        return literal(self.value * other.value)
 
     def __truediv__(self, other):
         assert isinstance(self.value, (int,float))
-        return Literal(self.value // other.value)
+        return literal(divide(self.value, other.value))
 
     def __mod__(self, other):
-        return Literal(self.value % other.value)
+        return literal(self.value % other.value)
 
     def __lt__(self, other):
         assert isinstance(self.value, (int,float,str))
@@ -84,24 +112,47 @@ class Literal:
 
 
 class Float(Literal):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(value)
 
 class Integer(Literal):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(value)
 
 class Char(Literal):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(value)
 
 class Bool(Literal):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(value)
 
 
+LiteralClasses = {bool: Bool, int: Integer, float: Float, str: Char}
+LiteralTypes = {bool: TokenType.TYPENAME_BOOL, int: TokenType.TYPENAME_INTEGER,
+                float: TokenType.TYPENAME_FLOAT, str: TokenType.TYPENAME_CHAR}
+
+
+# Literal node for a computed value, the constructors take source lexemes
+def literal(value) -> Literal:
+    node = LiteralClasses[type(value)].__new__(LiteralClasses[type(value)])
+    node.value = value
+    node.type_token = TypeTokens[LiteralTypes[type(value)]]
+    return node
+
+
 
 class Name(Expression):
+    __slots__ = ('token', 'token_type', 'symbol')
+
     def __init__(self, token: "Token"):
         self.token = token
 
@@ -110,6 +161,8 @@ class Name(Expression):
 
 
 class Block(Statement):
+    __slots__ = ('statements', 'frame_size')
+
     def __init__(self, statements: List[Statement]):
         self.statements = statements
 
@@ -125,6 +178,8 @@ class Block(Statement):
         return s
 
 class PrintStatement(Statement):
+    __slots__ = ('expression',)
+
     def __init__(self, expression: Expression):
         self.expression = expression
 
@@ -132,6 +187,8 @@ class PrintStatement(Statement):
         return f"Print({self.expression})"
 
 class BinaryOp(Expression):
+    __slots__ = ('left_expression', 'op', 'right_expression')
+
     def __init__(self, left_expression: Expression, op: "Token", right_expression: Expression):
         self.left_expression = left_expression
         self.op = op
@@ -142,6 +199,8 @@ class BinaryOp(Expression):
 
 
 class LogicalExpression(Expression):
+    __slots__ = ('left_expression', 'op', 'right_expression')
+
     def __init__(self, left_expression: Expression, op: "Token", right_expression: Expression):
         # TODO: check that op is logical token type
         self.left_expression = left_expression
@@ -152,6 +211,8 @@ class LogicalExpression(Expression):
         return f"LogicalExpression: {self.left_expression} {self.op.lexeme} {self.right_expression}"
 
 class UnaryOp(Expression):
+    __slots__ = ('op', 'expression', 'token_type')
+
     def __init__(self, op: "Token", expression: Expression):
         self.op = op
         self.expression = expression
@@ -161,6 +222,8 @@ class UnaryOp(Expression):
 
 
 class VarDeclaration(Statement):
+    __slots__ = ('name', 'expression', 'type_token', 'symbol')
+
     def __init__(self, name: "Token", expression: Expression=None, type_token: "Token"=None):
         self.name = name
         self.expression = expression
@@ -178,6 +241,8 @@ class VarDeclaration(Statement):
 
 
 class ConstDeclaration(Statement):
+    __slots__ = ('name', 'expression', 'type_token', 'symbol')
+
     def __init__(self, name: "Token", expression: Expression, type_token: "Token"=None):
         self.name = name
         self.expression = expression
@@ -193,6 +258,8 @@ class ConstDeclaration(Statement):
 
 
 class Assignment(Statement):
+    __slots__ = ('name', 'expression', 'type_token', 'symbol')
+
     def __init__(self, name: "Token", expression: Expression):
         self.name = name
         self.expression = expression
@@ -203,6 +270,8 @@ class Assignment(Statement):
 
 
 class IfStatement(Statement):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+
     def __init__(self, condition: Expression, then_branch: Block, else_branch: Block=None):
         self.condition = condition
         self.then_branch = then_branch
@@ -221,6 +290,8 @@ class IfStatement(Statement):
 
 
 class WhileStatement(Statement):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition: Expression, body: Block=None):
         self.condition = condition
         self.body = body
@@ -233,6 +304,8 @@ class WhileStatement(Statement):
 
 
 class Parameter(Expression):
+    __slots__ = ('name', 'type_token', 'symbol')
+
     def __init__(self, name: Name, type_token: "Token"):
         self.name = name
         self.type_token = type_token
@@ -243,6 +316,8 @@ class Parameter(Expression):
 
 
 class FunctionDeclaration(Statement):
+    __slots__ = ('name', 'params', 'body', 'return_type', 'arity', 'frame_size')
+
     def __init__(self, name: Name, body: Block, return_type: "Token", params: List[Parameter]=None):
         self.name = name
         self.params = params if params is not None else []
@@ -263,7 +338,33 @@ class FunctionDeclaration(Statement):
         return s
 
 
+# FunctionDeclaration whose body is only parsed the first time it is accessed.
+# parse_body() returns the body Block; syntax errors in the body surface then.
+class LazyFunctionDeclaration(FunctionDeclaration):
+    __slots__ = ('_body', 'parse_body')
+
+    def __init__(self, name: "Token", parse_body, return_type: "Token", params: List[Parameter]=None):
+        self.parse_body = parse_body
+        super().__init__(name, None, return_type, params)
+
+    @property
+    def body(self) -> Block:
+        if self._body is None:
+            self._body = self.parse_body()
+            self.parse_body = None
+        return self._body
+
+    @body.setter
+    def body(self, body: Block):
+        self._body = body
+
+    def is_parsed(self) -> bool:
+        return self._body is not None
+
+
 class Call(Expression):
+    __slots__ = ('callee', 'paren', 'arguments', 'arity', 'type_token')
+
     def __init__(self, callee: Expression, paren: "Token", arguments: List[Expression]=None):
         self.callee = callee
         self.paren = paren
@@ -280,6 +381,8 @@ class Call(Expression):
         return s
 
 class Grouping(Expression):
+    __slots__ = ('expression',)
+
     def __init__(self, expression):
         self.expression = expression
 
@@ -288,6 +391,8 @@ class Grouping(Expression):
 
 
 class Return(Statement):
+    __slots__ = ('expression', 'token_type')
+
     def __init__(self, token: "Token", expression: Expression):
         self.expression = expression
 
@@ -295,6 +400,8 @@ class Return(Statement):
         return f"Return {self.expression}"
 
 class Break(Statement):
+    __slots__ = ('token',)
+
     def __init__(self, token: "Token"):
         self.token = token
 
@@ -303,6 +410,8 @@ class Break(Statement):
 
 
 class Continue(Statement):
+    __slots__ = ('token',)
+
     def __init__(self, token: "Token"):
         self.token = token
 
@@ -1,4 +1,4 @@
-from typing import Union, List, Iterable
+from typing import Union, List, Iterable, Iterator
 from Token import *
 from Model import *
 
@@ -7,9 +7,12 @@ class Parser:
     VAR_TOKEN_TYPES = (TokenType.TYPENAME_INTEGER, TokenType.TYPENAME_FLOAT, TokenType.TYPENAME_CHAR, TokenType.TYPENAME_BOOL)
     LOGICAL_TOKEN_TYPES = (TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL, TokenType.GREATER,
                            TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL)
-    def __init__(self, tokens: List[Token]):
+    # lazy: function bodies are skipped over and only parsed on first access
+    # (see LazyFunctionDeclaration), tokens must stay indexable for that
+    def __init__(self, tokens: List[Token], lazy: bool=False):
         self.tokens = tokens
         self.current = 0
+        self.lazy = lazy
 
     def parse(self) -> Block:
         statements = []
@@ -134,6 +137,11 @@ class Parser:
         self.consume(TokenType.RIGHT_PAREN, "Expected right paren after function arguments in declaration")
         return_type = self.consume(Parser.VAR_TOKEN_TYPES, "Expected return type annotation after function arguments")
         self.consume(TokenType.LEFT_BRACE, 'Expected left brace after function arguments for function body')
+        if self.lazy:
+            parser_class, tokens, body_start = type(self), self.tokens, self.current
+            self.skip_block()
+            return LazyFunctionDeclaration(name, lambda: parser_class(tokens).block_at(body_start), return_type, params)
+
         body = self.block()
 
         return FunctionDeclaration(name, body, return_type, params)
@@ -189,6 +197,26 @@ class Parser:
         self.consume(TokenType.RIGHT_BRACE, "")
         return Block(statements)
 
+    # parse the block whose first token (after its '{') is at index
+    def block_at(self, index: int) -> Block:
+        self.current = index
+        return self.block()
+
+    # move past the '}' matching an already consumed '{' without building nodes
+    def skip_block(self):
+        depth = 1
+        while not self.is_at_end():
+            token_type = self.peek().token_type
+            if token_type == TokenType.LEFT_BRACE:
+                depth += 1
+            elif token_type == TokenType.RIGHT_BRACE:
+                depth -= 1
+                if depth == 0:
+                    break
+            self.current += 1
+
+        self.consume(TokenType.RIGHT_BRACE, "")
+
 
     def if_statement(self):
         condition = self.expression()
@@ -303,3 +331,235 @@ class Parser:
                 return self.advance()
 
         raise ValueError(f"ParseError on token: {self.peek()} {error_message}")
+
+
+
+# Parser over a lazily produced token stream (e.g. StreamScanner.stream_tokens).
+# Only the current and the previous token are held instead of a token list,
+# so scanning and parsing interleave and consumed tokens can be freed.
+class StreamingParser(Parser):
+    def __init__(self, tokens: Iterable[Token]):
+        super().__init__([])
+        self.stream: Iterator[Token] = iter(tokens)
+        self.current_token = next(self.stream)
+        self.previous_token = None
+
+    def peek(self) -> Token:
+        return self.current_token
+
+    def previous(self) -> Token:
+        return self.previous_token
+
+    def advance(self) -> Token:
+        if not self.is_at_end():
+            self.previous_token = self.current_token
+            self.current_token = next(self.stream)
+            self.current += 1
+
+        return self.previous_token
+
+
+# Parser reading a TokenBuffer directly. Token types are compared through
+# their codes and a Token is only materialized when the grammar actually
+# looks at one (previous()/peek()/consume() results).
+class CompactParser(Parser):
+    def __init__(self, tokens: TokenBuffer, lazy: bool=False):
+        super().__init__(tokens, lazy)
+        self.types = tokens.types
+
+    def is_at_end(self) -> bool:
+        return TokenTypes[self.types[self.current]] is TokenType.EOF
+
+    def peek(self) -> Token:
+        return self.tokens.token(self.current)
+
+    def previous(self) -> Token:
+        return self.tokens.token(self.current - 1)
+
+    def check(self, token_type: TokenType) -> bool:
+        tt = TokenTypes[self.types[self.current]]
+        return tt is token_type and tt is not TokenType.EOF
+
+    def match(self, token_types: Union[Iterable[TokenType],TokenType]) -> bool:
+        tt = TokenTypes[self.types[self.current]]
+        if tt is TokenType.EOF:
+            return False
+
+        if tt is token_types or (not isinstance(token_types, TokenType) and tt in token_types):
+            self.current += 1
+            return True
+        return False
+
+    def advance(self) -> Token:
+        if not self.is_at_end():
+            self.current += 1
+
+        return self.previous()
+
+    def consume(self, token_types: Union[Iterable[TokenType], TokenType],
+                error_message: str) -> Token:
+        if self.match(token_types):
+            return self.previous()
+
+        raise ValueError(f"ParseError on token: {self.peek()} {error_message}")
+
+    def skip_block(self):
+        types = self.types
+        left_brace = TokenType.LEFT_BRACE.value
+        right_brace = TokenType.RIGHT_BRACE.value
+        eof = TokenType.EOF.value
+        depth = 1
+        current = self.current
+        while True:
+            code = types[current]
+            if code == right_brace:
+                depth -= 1
+                if depth == 0:
+                    break
+            elif code == left_brace:
+                depth += 1
+            elif code == eof:
+                break
+            current += 1
+
+        self.current = current
+        self.consume(TokenType.RIGHT_BRACE, "")
+
+
+# Expression parsing by precedence climbing over an explicit stack instead of
+# one recursive method per precedence level, plus table dispatch for
+# statements. Builds the same AST as Parser, and long operator chains or deeply
+# nested parentheses and calls no longer hit the Python recursion limit.
+class PrattParser(Parser):
+    ASSIGNMENT_PRECEDENCE = 1
+
+    # token type -> (precedence, node class) for binary operators
+    InfixOperators = {
+        TokenType.EQUAL:         (ASSIGNMENT_PRECEDENCE, Assignment),
+        TokenType.LOGICAL_OR:    (2, LogicalExpression),
+        TokenType.LOGICAL_AND:   (3, LogicalExpression),
+        **dict.fromkeys(Parser.LOGICAL_TOKEN_TYPES, (4, LogicalExpression)),
+        TokenType.PLUS:          (5, BinaryOp),
+        TokenType.MINUS:         (5, BinaryOp),
+        TokenType.STAR:          (6, BinaryOp),
+        TokenType.SLASH:         (6, BinaryOp),
+    }
+
+    # token type -> node for a primary expression made of a single token
+    Primaries = {
+        TokenType.TRUE:    lambda token: Bool(token.lexeme),
+        TokenType.FALSE:   lambda token: Bool(token.lexeme),
+        TokenType.INTEGER: lambda token: Integer(token.lexeme),
+        TokenType.FLOAT:   lambda token: Float(token.lexeme),
+        TokenType.CHAR:    lambda token: Char(token.lexeme.replace("'", "")),
+        TokenType.IDENTIFIER: Name,
+        **dict.fromkeys(Parser.VAR_TOKEN_TYPES, Name),
+    }
+
+    Statements = {
+        TokenType.IF:         Parser.if_statement,
+        TokenType.PRINT:      Parser.print_statement,
+        TokenType.RETURN:     Parser.return_statement,
+        TokenType.WHILE:      Parser.while_statement,
+        TokenType.VAR:        Parser.var_declaration,
+        TokenType.CONST:      Parser.const_declaration,
+        TokenType.BREAK:      Parser.break_statement,
+        TokenType.CONTINUE:   Parser.continue_statement,
+        TokenType.FUNC:       Parser.function_declaration,
+        TokenType.LEFT_BRACE: Parser.block,
+    }
+
+    # explicit stack entries
+    BINARY, UNARY, GROUPING, CALL = range(4)
+
+    def statement(self) -> Union[Statement, Expression]:
+        handler = PrattParser.Statements.get(self.peek().token_type)
+        if handler is not None:
+            self.advance()
+            return handler(self)
+
+        return self.expression_statement()
+
+    def expression(self):
+        BINARY, UNARY, GROUPING, CALL = PrattParser.BINARY, PrattParser.UNARY, PrattParser.GROUPING, PrattParser.CALL
+        infix_operators = PrattParser.InfixOperators
+        primaries = PrattParser.Primaries
+        stack = []
+
+        while True:
+            # prefix position: unary operators and opening parens stack up
+            # until a primary token is found
+            token_type = self.peek().token_type
+            if token_type == TokenType.BANG or token_type == TokenType.MINUS:
+                stack.append((UNARY, self.advance()))
+                continue
+            elif token_type == TokenType.LEFT_PAREN:
+                self.advance()
+                stack.append((GROUPING,))
+                continue
+
+            primary = primaries.get(token_type)
+            if primary is None:
+                raise ValueError(f"Expected expression")
+            expr = primary(self.advance())
+            callable_expr = True
+
+            # infix position: returns to the prefix position once an operator
+            # or a call argument needs an operand
+            while True:
+                if callable_expr and self.match(TokenType.LEFT_PAREN):
+                    paren = self.previous()
+                    if not self.match(TokenType.RIGHT_PAREN):
+                        stack.append((CALL, expr, paren, []))
+                        break
+                    expr = Call(expr, paren, [])
+                callable_expr = False
+
+                while stack and stack[-1][0] == UNARY:
+                    expr = UnaryOp(stack.pop()[1], expr)
+
+                operator = infix_operators.get(self.peek().token_type)
+                if operator is not None:
+                    precedence, _ = operator
+                    # left associative, except for right associative assignment
+                    if precedence == PrattParser.ASSIGNMENT_PRECEDENCE:
+                        precedence += 1
+                    while stack and stack[-1][0] == BINARY and stack[-1][3][0] >= precedence:
+                        expr = self.reduce(stack.pop(), expr)
+                    stack.append((BINARY, expr, self.advance(), operator))
+                    break
+
+                while stack and stack[-1][0] == BINARY:
+                    expr = self.reduce(stack.pop(), expr)
+
+                if not stack:
+                    return expr
+
+                frame = stack[-1]
+                if frame[0] == GROUPING:
+                    self.consume(TokenType.RIGHT_PAREN, "Expected right paren after grouping")
+                    stack.pop()
+                    expr = Grouping(expr)
+                    callable_expr = True
+                else:
+                    _, callee, paren, arguments = frame
+                    arguments.append(expr)
+                    if self.check(TokenType.COMMA):
+                        self.advance()
+                    if not self.match(TokenType.RIGHT_PAREN):
+                        break
+                    stack.pop()
+                    expr = Call(callee, paren, arguments)
+
+    def reduce(self, frame, rhs):
+        _, lhs, operator, (_, node_class) = frame
+        if node_class is Assignment:
+            assert(isinstance(lhs, Name))
+            return Assignment(lhs.token, rhs)
+        return node_class(lhs, operator, rhs)
+
+
+Parsers = {
+    'default': Parser,
+    'pratt': PrattParser,
+}
@@ -0,0 +1,168 @@
+from typing import Dict, Iterable, List, Tuple, Union
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+
+
+# What a name resolves to. depth is the frame the storage lives in (0 for
+# the global frame, 1 for a function's frame) and index its slot there.
+class Symbol:
+    __slots__ = ('name', 'depth', 'index', 'is_const', 'declaration')
+
+    def __init__(self, name: str, depth: int, index: int, is_const: bool, declaration: Node):
+        self.name = name
+        self.depth = depth
+        self.index = index
+        self.is_const = is_const
+        self.declaration = declaration
+
+    # declared (or, once the TypeChecker ran, inferred) type of the symbol
+    @property
+    def token_type(self) -> TokenType:
+        return self.declaration.type_token.token_type
+
+    def __repr__(self):
+        return f"Symbol {self.name} [{self.depth}:{self.index}]"
+
+
+class ResolverContext:
+    def __init__(self, functions: Iterable[str]=None):
+        # every visible name maps to its innermost declaration. Each scope
+        # records what its declarations shadowed so leaving it restores them,
+        # a lookup is a single dict probe however deep the nesting is.
+        self.names: Dict[str, Symbol] = {}
+        self.scopes: List[List[Tuple[str, Symbol]]] = [[]]
+        self.depth = 0
+        self.frame_size = 0
+        self.functions = set(functions) if functions is not None else None
+
+    def declare(self, name: str, is_const: bool, declaration: Node) -> Symbol:
+        symbol = Symbol(name, self.depth, self.frame_size, is_const, declaration)
+        self.frame_size += 1
+        self.scopes[-1].append((name, self.names.get(name)))
+        self.names[name] = symbol
+        return symbol
+
+    def lookup(self, name: str) -> Symbol:
+        return self.names.get(name)
+
+    def push_scope(self):
+        self.scopes.append([])
+
+    # a name is visible from its declaration to the end of the enclosing block
+    def pop_scope(self):
+        names = self.names
+        for name, shadowed in reversed(self.scopes.pop()):
+            if shadowed is None:
+                del names[name]
+            else:
+                names[name] = shadowed
+
+
+# node class -> handler(node, context), nodes without one have nothing to
+# resolve
+Resolvers = DispatchTable(default=lambda node, context: None)
+
+
+def _resolve(node: Node, context: ResolverContext):
+    Resolvers[type(node)](node, context)
+
+
+@Resolvers.register(Block)
+def resolve_block(node: Block, context: ResolverContext):
+    context.push_scope()
+    for stmt in node.statements:
+        _resolve(stmt, context)
+    context.pop_scope()
+
+
+@Resolvers.register(VarDeclaration)
+def resolve_var_declaration(node: VarDeclaration, context: ResolverContext):
+    _resolve(node.expression, context)
+    node.symbol = context.declare(node.name.lexeme, False, node)
+
+
+@Resolvers.register(ConstDeclaration)
+def resolve_const_declaration(node: ConstDeclaration, context: ResolverContext):
+    _resolve(node.expression, context)
+    node.symbol = context.declare(node.name.lexeme, True, node)
+
+
+@Resolvers.register(FunctionDeclaration)
+def resolve_function_declaration(node: FunctionDeclaration, context: ResolverContext):
+    if context.functions is not None and node.name.lexeme not in context.functions:
+        return
+
+    outer_frame_size = context.frame_size
+    context.depth += 1
+    context.frame_size = 0
+    context.push_scope()
+    for p in node.params:
+        p.symbol = context.declare(p.name.token.lexeme, False, p)
+
+    _resolve(node.body, context)
+
+    node.frame_size = context.frame_size
+    context.pop_scope()
+    context.frame_size = outer_frame_size
+    context.depth -= 1
+
+
+@Resolvers.register(Name)
+def resolve_name(node: Name, context: ResolverContext):
+    node.symbol = context.lookup(node.token.lexeme)
+
+
+@Resolvers.register(Assignment)
+def resolve_assignment(node: Assignment, context: ResolverContext):
+    _resolve(node.expression, context)
+    node.symbol = context.lookup(node.name.lexeme)
+
+
+@Resolvers.register(BinaryOp, LogicalExpression)
+def resolve_binary_op(node: Union[BinaryOp, LogicalExpression], context: ResolverContext):
+    _resolve(node.left_expression, context)
+    _resolve(node.right_expression, context)
+
+
+@Resolvers.register(UnaryOp, Grouping, PrintStatement, Return)
+def resolve_expression(node: Union[UnaryOp, Grouping, PrintStatement, Return], context: ResolverContext):
+    _resolve(node.expression, context)
+
+
+# functions are looked up by name, only the arguments hold variables
+@Resolvers.register(Call)
+def resolve_call(node: Call, context: ResolverContext):
+    for arg in node.arguments:
+        _resolve(arg, context)
+
+
+@Resolvers.register(IfStatement)
+def resolve_if_statement(node: IfStatement, context: ResolverContext):
+    _resolve(node.condition, context)
+    _resolve(node.then_branch, context)
+    if node.else_branch:
+        _resolve(node.else_branch, context)
+
+
+@Resolvers.register(WhileStatement)
+def resolve_while_statement(node: WhileStatement, context: ResolverContext):
+    _resolve(node.condition, context)
+    _resolve(node.body, context)
+
+
+# Bind every Name and Assignment to the Symbol of the declaration it refers
+# to (None when there is none, the passes report that where they used to) and
+# give every declaration a slot in its frame. The number of slots is stored in
+# frame_size of each FunctionDeclaration and of the top-level block.
+# functions: only resolve the bodies of these functions
+def resolve(block: Block, functions: Iterable[str]=None):
+    context = ResolverContext(functions)
+    # top-level statements declare into the global scope
+    for stmt in block.statements:
+        _resolve(stmt, context)
+    block.frame_size = context.frame_size
+
+
+def is_resolved(block: Block) -> bool:
+    return getattr(block, 'frame_size', None) is not None
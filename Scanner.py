@@ -1,6 +1,9 @@
 from Token import *
-from typing import Union, List
+from typing import Union, List, Iterator, TextIO
+import mmap
 import os
+import re
+import string
 
 class Scanner:
     Keywords = {
@@ -15,6 +18,7 @@ class Scanner:
     "while":  TokenType.WHILE,
     "const":  TokenType.CONST,
     "break":  TokenType.BREAK,
+    "continue": TokenType.CONTINUE,
     "int":    TokenType.TYPENAME_INTEGER,
     "float":  TokenType.TYPENAME_FLOAT,
     "bool":   TokenType.TYPENAME_BOOL,
@@ -223,3 +227,341 @@ class Scanner:
     def print_tokens(self):
         for t in self.tokens:
             print(t)
+
+
+# Same tokens as Scanner, but whole identifiers, numbers, comments and
+# whitespace runs are consumed in one step by a single master pattern and
+# classified through a first-character dispatch table. Anything the fast path
+# doesn't recognise goes through Scanner.scan_token so the error messages stay
+# identical.
+class RegexScanner(Scanner):
+    Operators = {
+    "(":  TokenType.LEFT_PAREN,
+    ")":  TokenType.RIGHT_PAREN,
+    "{":  TokenType.LEFT_BRACE,
+    "}":  TokenType.RIGHT_BRACE,
+    ",":  TokenType.COMMA,
+    "-":  TokenType.MINUS,
+    "+":  TokenType.PLUS,
+    ";":  TokenType.SEMICOLON,
+    "*":  TokenType.STAR,
+    "/":  TokenType.SLASH,
+    "!":  TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=":  TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "<":  TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+    ">":  TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+    "&&": TokenType.LOGICAL_AND,
+    "||": TokenType.LOGICAL_OR,
+    }
+
+    # Lexemes whose token type is known from the text alone
+    FixedLexemes = {**Operators, **Scanner.Keywords}
+
+    # Leading blanks are folded into every match so whitespace never costs a
+    # separate iteration. The multiline comment body follows Scanner.scan_token:
+    # it stops at the first '*' or before the first '/' and must end in '*/'.
+    # The final '.' catches everything else for the slow path.
+    LexemePattern = re.compile(r"""
+        [ \t\r]*
+        (
+            [^\W\d]\w*
+          | //[^\n]*
+          | /\*(?:[^*](?!/))*\*/
+          | /\*
+          | [=!<>]=|&&|\|\||[(){},;+\-*/!=<>]
+          | \n[\n \t\r]*
+          | \d+(?:\.\d+)?
+          | '(?:\\[^\W\d_]'|[^\n]')
+          | .
+        )
+    """, re.VERBOSE)
+
+    IDENTIFIER, NUMBER, NEWLINE, COMMENT, CHAR = range(1, 6)
+    FirstCharKinds = {
+        **dict.fromkeys(string.ascii_letters + '_', IDENTIFIER),
+        **dict.fromkeys(string.digits, NUMBER),
+        '\n': NEWLINE,
+        '/': COMMENT,
+        "'": CHAR,
+    }
+
+    def __init__(self, source: str):
+        super().__init__(source)
+        self.exhausted = True
+
+    # Whether Scanner.number would go on past a number the pattern ended at
+    # pos: str.isdigit accepts digits like '²' that \d does not
+    @staticmethod
+    def number_continues(source: str, pos: int) -> bool:
+        c = source[pos:pos + 1]
+        if c == '.':
+            c = source[pos + 1:pos + 2]
+        return c.isdigit()
+
+    def scan_fallback(self, pos: int, line: int) -> Scanner:
+        scanner = Scanner(self.source)
+        scanner.start = scanner.current = pos
+        scanner.line = line
+        scanner.scan_token()
+        return scanner
+
+    # Fast path for whole sources. Returns None as soon as it meets a lexeme
+    # it can't classify so the caller can redo the scan with iter_tokens,
+    # and for non-ASCII sources, where a number may go on with digits the
+    # pattern does not match.
+    def scan_lexemes(self) -> Union[List[Token], None]:
+        if not self.source.isascii():
+            return None
+        tokens = []
+        append = tokens.append
+        fixed = RegexScanner.FixedLexemes.get
+        kinds = RegexScanner.FirstCharKinds.get
+        identifier = TokenType.IDENTIFIER
+        line = 1
+
+        for text in RegexScanner.LexemePattern.findall(self.source):
+            token_type = fixed(text)
+            if token_type is not None:
+                append(Token(token_type, text, line))
+                continue
+
+            kind = kinds(text[0])
+            if kind == RegexScanner.IDENTIFIER:
+                append(Token(identifier, text, line))
+            elif kind == RegexScanner.NEWLINE:
+                line += text.count('\n')
+            elif kind == RegexScanner.NUMBER:
+                append(Token(TokenType.FLOAT if '.' in text else TokenType.INTEGER, text, line))
+            elif kind == RegexScanner.COMMENT and text != '/*':
+                pass
+            elif kind == RegexScanner.CHAR and len(text) > 1:
+                append(Token(TokenType.CHAR, text, line))
+            else:
+                return None
+
+        self.line = line
+        return tokens
+
+    # Called when a match runs too close to the end of self.source to be sure
+    # it is complete. Scanners over a whole source have nothing more to read.
+    def refill(self, pos: int) -> int:
+        self.exhausted = True
+        return pos
+
+    # Positional scan starting at offset pos. self.start/self.current hold the
+    # span of the token being yielded within self.source.
+    def iter_tokens(self, pos: int=0, line: int=1) -> Iterator[Token]:
+        source = self.source
+        end = len(source)
+        exhausted = self.exhausted
+        finditer = RegexScanner.LexemePattern.finditer
+        fixed = RegexScanner.FixedLexemes.get
+        kinds = RegexScanner.FirstCharKinds.get
+        identifier = TokenType.IDENTIFIER
+
+        while pos < end or not exhausted:
+            for m in finditer(source, pos):
+                text = m.group(1)
+                # a lexeme this close to the end of a partial buffer may go
+                # on in the next chunk (longest lookahead is a '\x' char)
+                if not exhausted and (m.end() + 4 > end or text == '/*'):
+                    pos = self.refill(m.start())
+                    break
+
+                token_type = fixed(text)
+                if token_type is None:
+                    kind = kinds(text[0])
+                    if kind == RegexScanner.IDENTIFIER:
+                        token_type = identifier
+                    elif kind == RegexScanner.NEWLINE:
+                        line += text.count('\n')
+                        pos = m.end()
+                        continue
+                    elif kind == RegexScanner.NUMBER and not self.number_continues(source, m.end()):
+                        token_type = TokenType.FLOAT if '.' in text else TokenType.INTEGER
+                    elif kind == RegexScanner.COMMENT and text != '/*':
+                        pos = m.end()
+                        continue
+                    elif kind == RegexScanner.CHAR and len(text) > 1:
+                        token_type = TokenType.CHAR
+                    else:
+                        # let Scanner.scan_token produce the token or the error
+                        pos = m.start(1)
+                        scanner = self.scan_fallback(pos, line)
+                        line = scanner.line
+                        if scanner.tokens:
+                            self.start = pos
+                            self.current = scanner.current
+                            pos = scanner.current
+                            yield scanner.tokens[0]
+                        else:
+                            pos = scanner.current
+                        break
+
+                self.start = m.start(1)
+                self.current = pos = m.end()
+                yield Token(token_type, text, line)
+            else:
+                # only trailing blanks are left
+                pos = end if exhausted else self.refill(end)
+
+            source = self.source
+            end = len(source)
+            exhausted = self.exhausted
+
+        self.start = self.current = pos
+        self.line = line
+
+    def scan_tokens(self) -> List[Token]:
+        if len(self.tokens) > 0:
+            return self.tokens
+
+        tokens = self.scan_lexemes()
+        if tokens is None:
+            tokens = list(self.iter_tokens())
+
+        self.tokens.extend(tokens)
+        self.tokens.append(Token(TokenType.EOF, "", self.line))
+        return self.tokens
+
+
+# Scans a file object chunk by chunk and yields tokens as they are found, so
+# only the unscanned part of the current chunk is ever held in memory.
+class StreamScanner(RegexScanner):
+    def __init__(self, stream: TextIO, chunk_size: int=1 << 16):
+        super().__init__('')
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.exhausted = False
+
+    def refill(self, pos: int) -> int:
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.exhausted = True
+        self.source = self.source[pos:] + chunk
+        return 0
+
+    def stream_tokens(self) -> Iterator[Token]:
+        yield from self.iter_tokens()
+        yield Token(TokenType.EOF, "", self.line)
+
+    def scan_tokens(self) -> List[Token]:
+        if len(self.tokens) > 0:
+            return self.tokens
+
+        self.tokens.extend(self.stream_tokens())
+        return self.tokens
+
+
+# Scans an encoded source (bytes or a memory mapped file) straight into a
+# TokenBuffer without creating Token objects or lexeme strings. Offsets in the
+# buffer are byte offsets into the source.
+class CompactScanner:
+    FixedLexemes = {lexeme.encode(): tt for lexeme, tt in RegexScanner.FixedLexemes.items()}
+
+    # RegexScanner.LexemePattern over bytes, with the leading blanks captured
+    # so token offsets can be recovered from findall's output
+    LexemePattern = re.compile(
+        RegexScanner.LexemePattern.pattern.replace('[ \\t\\r]*', '([ \\t\\r]*)', 1).encode(),
+        re.VERBOSE)
+
+    FirstCharKinds = {ord(c): kind for c, kind in RegexScanner.FirstCharKinds.items()}
+
+    def __init__(self, source: bytes):
+        self.source = source
+        self.tokens = TokenBuffer(source)
+        self.line = 1
+
+    @staticmethod
+    def from_file(path: str) -> "CompactScanner":
+        with open(path, 'rb') as fid:
+            try:
+                source = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                source = b''
+        return CompactScanner(source)
+
+    def scan_tokens(self) -> TokenBuffer:
+        if len(self.tokens) > 0:
+            return self.tokens
+
+        fixed = CompactScanner.FixedLexemes.get
+        kinds = CompactScanner.FirstCharKinds.get
+        types = self.tokens.types
+        starts = self.tokens.starts
+        ends = self.tokens.ends
+        lines = self.tokens.lines
+        identifier = TokenType.IDENTIFIER.value
+        integer = TokenType.INTEGER.value
+        float_ = TokenType.FLOAT.value
+        char = TokenType.CHAR.value
+        pos = 0
+        line = 1
+
+        for blanks, text in CompactScanner.LexemePattern.findall(self.source):
+            start = pos + len(blanks)
+            pos = start + len(text)
+            token_type = fixed(text)
+            if token_type is not None:
+                code = token_type.value
+            else:
+                kind = kinds(text[0])
+                if kind == RegexScanner.IDENTIFIER:
+                    code = identifier
+                elif kind == RegexScanner.NEWLINE:
+                    line += text.count(b'\n')
+                    continue
+                elif kind == RegexScanner.NUMBER:
+                    code = float_ if b'.' in text else integer
+                elif kind == RegexScanner.COMMENT and text != b'/*':
+                    continue
+                elif kind == RegexScanner.CHAR and len(text) > 1:
+                    code = char
+                else:
+                    self.scan_remainder(start, line)
+                    return self.tokens
+
+            types.append(code)
+            starts.append(start)
+            ends.append(pos)
+            lines.append(line)
+
+        self.line = line
+        self.tokens.append(TokenType.EOF, len(self.source), len(self.source), line)
+        return self.tokens
+
+    # Non-ASCII text and errors: decode the rest of the source and let
+    # RegexScanner handle it, translating its offsets back to bytes. A word
+    # or number token right before pos may go on with the non-ASCII text,
+    # like 'y1x' in 'y1xé', so it is scanned again.
+    def scan_remainder(self, pos: int, line: int):
+        tokens = self.tokens
+        first = chr(self.source[tokens.starts[-1]]) if len(tokens) and tokens.ends[-1] == pos else ''
+        if first.isalnum() or first == '_':
+            pos = tokens.starts[-1]
+            line = tokens.lines[-1]
+            tokens.pop()
+        text = bytes(self.source[pos:]).decode()
+        scanner = RegexScanner(text)
+        last = 0
+        for token in scanner.iter_tokens(0, line):
+            pos += len(text[last:scanner.start].encode())
+            end = pos + len(token.lexeme.encode())
+            self.tokens.append(token.token_type, pos, end, token.line)
+            last = scanner.current
+            pos = end
+
+        self.line = scanner.line
+        end = len(self.source)
+        self.tokens.append(TokenType.EOF, end, end, self.line)
+
+
+Scanners = {
+    'default': Scanner,
+    'regex': RegexScanner,
+}
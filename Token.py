@@ -1,5 +1,6 @@
 from enum import Enum, auto
 from dataclasses import dataclass
+from array import array
 
 class TokenType(Enum):
     LEFT_PAREN = auto()
@@ -47,12 +48,60 @@ class TokenType(Enum):
 
 @dataclass
 class Token:
+    __slots__ = ('token_type', 'lexeme', 'line')
     token_type: TokenType
     lexeme: str
-    line: int=-1
+    line: int
 
     def __init__(self, token_type: TokenType, lexeme: str, line: int=-1):
         self.token_type = token_type
         self.lexeme = lexeme
         self.line = line
 
+
+
+# TokenType indexed by its value, used to decode compact type codes
+TokenTypes = [None] * (max(tt.value for tt in TokenType) + 1)
+for tt in TokenType:
+    TokenTypes[tt.value] = tt
+
+
+# Struct-of-arrays alternative to List[Token]: one type code byte and three
+# 32 bit columns (start offset, end offset, line) per token over an encoded
+# source, which may be a memory mapped file. Lexemes are only decoded when a
+# Token is materialized.
+class TokenBuffer:
+    def __init__(self, source: bytes):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def pop(self):
+        for column in (self.types, self.starts, self.ends, self.lines):
+            column.pop()
+
+    def append(self, token_type: TokenType, start: int, end: int, line: int):
+        self.types.append(token_type.value)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def token_type(self, index: int) -> TokenType:
+        return TokenTypes[self.types[index]]
+
+    def lexeme(self, index: int) -> str:
+        return bytes(self.source[self.starts[index]:self.ends[index]]).decode()
+
+    def token(self, index: int) -> Token:
+        return Token(TokenTypes[self.types[index]], self.lexeme(index), self.lines[index])
+
+    def __getitem__(self, index: int) -> Token:
+        return self.token(index)
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.types, self.starts, self.ends, self.lines))
@@ -1,8 +1,11 @@
-from typing import Union, List, Iterable
+from typing import Union, List, Iterable, Dict, Tuple, Optional
 from Token import *
 from Model import *
 from Parser import *
 from Compiler import *
+from dispatch import DispatchTable
+from Resolver import *
+from Resolver import _resolve
 
 # TODO: check that function declarations include a return statement
 
@@ -10,193 +13,385 @@ from Compiler import *
 class TypeCheckerContext:
     def __init__(self, compiler: Compiler=None):
         self.functions = {}
-        self.function_args = {}
-
-        # Only one level of nesting is allowed and no support for closures
-        self.global_vars = {}
-        self.global_consts = {}
-        self.scope_depth = -1
-        self.scope_vars = []
-        self.scope_consts = []
+
+        # Only one level of nesting is allowed and no support for closures.
+        # Variables are bound to their declarations by the Resolver.
         self.expected_return_type = None
 
-# Bool flag indicates whether or not variable is const
-def lookup_var(name: str, context: TypeCheckerContext) -> (Expression, bool):
+        # names of the functions whose bodies get checked, None checks all.
+        # The signatures of the others are still registered for calls.
+        self.check_functions = None
+
+    def function(self, name: str) -> FunctionDeclaration:
+        return self.functions.get(name)
 
-    if name in context.global_vars:
-        return (context.global_vars[name], False)
-    elif name in context.global_consts:
-        return (context.global_consts[name], True)
-    if context.scope_depth > 0:
-        for sv in context.scope_vars:
-            if name in sv:
-                return (sv[name], False)
-        for sc in context.scope_consts:
-            if name in sc:
-                return (sc[name], False)
 
-        if name in context.function_args:
-            return context.function_args[name], False
+def unresolved(name: str) -> ValueError:
+    return ValueError(f"Could not find variable '{name}' in any scope")
 
-    raise ValueError(f"Could not find variable '{name}' in any scope")
+
+# node class -> handler(node, context) returning the node's TokenType, None
+# for statements and nodes without a type
+TypeCheckers = DispatchTable(default=lambda node, context: None)
 
 
 def _run_type_checker(node: Node, context: TypeCheckerContext) -> TokenType:
-    if isinstance(node, BinaryOp):
-        lhs = node.left_expression
-        rhs = node.right_expression
+    return TypeCheckers[type(node)](node, context)
 
-        lhs_token_type = _run_type_checker(lhs, context)
-        rhs_token_type = _run_type_checker(rhs, context)
-        if lhs_token_type != rhs_token_type:
-            raise ValueError(f"Op '{node.op.lexeme}' type mismatch {lhs_token_type} != {rhs_token_type} in {node!r}")
 
-        return lhs_token_type
-    elif isinstance(node, VarDeclaration):
-        if node.type_token is None:
-            node.type_token = Token(_run_type_checker(node.expression, context), '')
+@TypeCheckers.register(BinaryOp)
+def check_binary_op(node: BinaryOp, context: TypeCheckerContext) -> TokenType:
+    lhs = node.left_expression
+    rhs = node.right_expression
 
-        if context.scope_depth == 0:
-            context.global_vars[node.name.lexeme] = node
-        else:
-            context.scope_vars[-1][node.name.lexeme] = node
+    lhs_token_type = _run_type_checker(lhs, context)
+    rhs_token_type = _run_type_checker(rhs, context)
+    if lhs_token_type != rhs_token_type:
+        raise ValueError(f"Op '{node.op.lexeme}' type mismatch {lhs_token_type} != {rhs_token_type} in {node!r}")
 
-        return node.type_token.token_type
+    return lhs_token_type
 
-    elif isinstance(node, ConstDeclaration):
-        if node.type_token is None:
-            node.type_token = Token(_run_type_checker(node.expression, context), '')
 
-        if context.scope_depth == 0:
-            context.global_consts[node.name.lexeme] = node
-        else:
-            context.scope_consts[-1][node.name.lexeme] = node
+@TypeCheckers.register(VarDeclaration)
+def check_var_declaration(node: VarDeclaration, context: TypeCheckerContext) -> TokenType:
+    if node.type_token is None:
+        node.type_token = TypeTokens[_run_type_checker(node.expression, context)]
 
-        return node.type_token.token_type
+    return node.type_token.token_type
 
-    elif isinstance(node, FunctionDeclaration):
-        context.functions[node.name.lexeme] = node
-        for p in node.params:
-            context.function_args[p.name.token.lexeme] = p
 
-        context.expected_return_type = node.return_type.token_type
+@TypeCheckers.register(ConstDeclaration)
+def check_const_declaration(node: ConstDeclaration, context: TypeCheckerContext) -> TokenType:
+    if node.type_token is None:
+        node.type_token = TypeTokens[_run_type_checker(node.expression, context)]
 
-        _run_type_checker(node.body, context)
+    return node.type_token.token_type
 
-        context.expected_return_type = None
-        context.function_args = {}
 
+@TypeCheckers.register(FunctionDeclaration)
+def check_function_declaration(node: FunctionDeclaration, context: TypeCheckerContext) -> TokenType:
+    context.functions[node.name.lexeme] = node
+    if context.check_functions is not None and node.name.lexeme not in context.check_functions:
         return node.return_type.token_type
 
-    elif isinstance(node, LogicalExpression):
-        if not node.op.token_type in Parser.LOGICAL_TOKEN_TYPES:
-            raise ValueError(f"{node!r} ")
+    context.expected_return_type = node.return_type.token_type
 
-        lhs = node.left_expression
-        rhs = node.right_expression
+    _run_type_checker(node.body, context)
 
-        lhs_token_type = _run_type_checker(lhs, context)
-        rhs_token_type = _run_type_checker(rhs, context)
+    context.expected_return_type = None
 
-        if lhs_token_type != rhs_token_type:
-            raise ValueError(f"Op '{node.op.lexeme}' type mismatch {lhs_token_type} != {rhs_token_type} in {node!r}")
+    return node.return_type.token_type
 
 
-        # if not hasattr(node.left_expression, 'type_token'):
-        #     node.left_expression.type_token = lhs_token_type
+@TypeCheckers.register(LogicalExpression)
+def check_logical_expression(node: LogicalExpression, context: TypeCheckerContext) -> TokenType:
+    if not node.op.token_type in Parser.LOGICAL_TOKEN_TYPES:
+        raise ValueError(f"{node!r} ")
 
-        # if not hasattr(node.right_expression, 'type_token'):
-        #     node.right_expression.type_token = rhs_token_type
+    lhs = node.left_expression
+    rhs = node.right_expression
 
-        return lhs_token_type
+    lhs_token_type = _run_type_checker(lhs, context)
+    rhs_token_type = _run_type_checker(rhs, context)
 
-    elif isinstance(node, Assignment):
-        var, is_const = lookup_var(node.name.lexeme, context)
-        if is_const:
-            raise ValueError(f"Tried to assign to constant variable '{var.name.lexeme}'")
-        expr_type = _run_type_checker(node.expression, context)
+    if lhs_token_type != rhs_token_type:
+        raise ValueError(f"Op '{node.op.lexeme}' type mismatch {lhs_token_type} != {rhs_token_type} in {node!r}")
 
-        if var.type_token.token_type != expr_type:
-            raise ValueError(f"Tried to assign {expr_type}, but {node.name.lexeme} was previously declared with type {var.type_token.token_type}")
 
-        node.type_token = expr_type
-        return expr_type
+    # if not hasattr(node.left_expression, 'type_token'):
+    #     node.left_expression.type_token = lhs_token_type
 
-    elif isinstance(node, Call):
-        assert(isinstance(node.callee, Name))
-        func_name = node.callee.token.lexeme
-        if func_name not in context.functions:
-            raise ValueError(f"Tried calling undefined function '{func_name}'")
+    # if not hasattr(node.right_expression, 'type_token'):
+    #     node.right_expression.type_token = rhs_token_type
 
-        func_decl = context.functions[func_name]
+    return lhs_token_type
 
-        if node.arity != func_decl.arity:
-            raise ValueError(f"Tried calling function '{func_name}' with {node.arity} arguments but function takes {func_decl.arity}")
 
-        for i,(param,arg) in enumerate(zip(func_decl.params,node.arguments)):
-            param_token_type = _run_type_checker(param, context)
-            arg_token_type = _run_type_checker(arg, context)
-            if param_token_type != arg_token_type:
-                raise ValueError(f"Expected {arg_token_type} on parameter {i} in function {func_decl!r}, but got {param_token_type} at {node!r}")
+@TypeCheckers.register(Assignment)
+def check_assignment(node: Assignment, context: TypeCheckerContext) -> TokenType:
+    symbol = node.symbol
+    if symbol is None:
+        raise unresolved(node.name.lexeme)
+    if symbol.is_const:
+        raise ValueError(f"Tried to assign to constant variable '{symbol.name}'")
+    expr_type = _run_type_checker(node.expression, context)
 
-        node.type_token = func_decl.return_type.token_type
-        return func_decl.return_type.token_type
+    if symbol.token_type != expr_type:
+        raise ValueError(f"Tried to assign {expr_type}, but {node.name.lexeme} was previously declared with type {symbol.token_type}")
 
-    elif isinstance(node, PrintStatement):
-        _run_type_checker(node.expression, context)
-    elif isinstance(node, IfStatement):
-        _run_type_checker(node.condition, context)
-        _run_type_checker(node.then_branch, context)
-        if node.else_branch:
-            _run_type_checker(node.else_branch, context)
+    node.type_token = expr_type
+    return expr_type
 
 
-    elif isinstance(node, WhileStatement):
-        _run_type_checker(node.condition, context)
-        _run_type_checker(node.body, context)
+@TypeCheckers.register(Call)
+def check_call(node: Call, context: TypeCheckerContext) -> TokenType:
+    assert(isinstance(node.callee, Name))
+    func_name = node.callee.token.lexeme
+    func_decl = context.function(func_name)
+    if func_decl is None:
+        raise ValueError(f"Tried calling undefined function '{func_name}'")
 
-    elif isinstance(node, Return):
-        token_type = _run_type_checker(node.expression, context)
+    if node.arity != func_decl.arity:
+        raise ValueError(f"Tried calling function '{func_name}' with {node.arity} arguments but function takes {func_decl.arity}")
 
-        if token_type != context.expected_return_type:
-            raise ValueError(f"function returned type {token_type}, but the declared return type is {context.expected_return_type}")
+    for i,(param,arg) in enumerate(zip(func_decl.params,node.arguments)):
+        param_token_type = _run_type_checker(param, context)
+        arg_token_type = _run_type_checker(arg, context)
+        if param_token_type != arg_token_type:
+            raise ValueError(f"Expected {arg_token_type} on parameter {i} in function {func_decl!r}, but got {param_token_type} at {node!r}")
 
-        node.token_type = token_type
-        return token_type
+    node.type_token = func_decl.return_type.token_type
+    return func_decl.return_type.token_type
 
 
-    elif isinstance(node, Block):
-        context.scope_depth += 1
-        if context.scope_depth > 0 :
-            context.scope_consts.append({})
-            context.scope_vars.append({})
+@TypeCheckers.register(PrintStatement)
+def check_print_statement(node: PrintStatement, context: TypeCheckerContext):
+    _run_type_checker(node.expression, context)
 
-        for stmt in node.statements:
-            _run_type_checker(stmt, context)
 
-        if context.scope_depth > 0 :
-            context.scope_vars.pop()
-            context.scope_consts.pop()
+@TypeCheckers.register(IfStatement)
+def check_if_statement(node: IfStatement, context: TypeCheckerContext):
+    _run_type_checker(node.condition, context)
+    _run_type_checker(node.then_branch, context)
+    if node.else_branch:
+        _run_type_checker(node.else_branch, context)
+
+
+@TypeCheckers.register(WhileStatement)
+def check_while_statement(node: WhileStatement, context: TypeCheckerContext):
+    _run_type_checker(node.condition, context)
+    _run_type_checker(node.body, context)
+
+
+@TypeCheckers.register(Return)
+def check_return(node: Return, context: TypeCheckerContext) -> TokenType:
+    token_type = _run_type_checker(node.expression, context)
+
+    if token_type != context.expected_return_type:
+        raise ValueError(f"function returned type {token_type}, but the declared return type is {context.expected_return_type}")
+
+    node.token_type = token_type
+    return token_type
+
+
+@TypeCheckers.register(Block)
+def check_block(node: Block, context: TypeCheckerContext):
+    for stmt in node.statements:
+        _run_type_checker(stmt, context)
+
 
-        context.scope_depth -= 1
+@TypeCheckers.register(Literal)
+def check_literal(node: Literal, context: TypeCheckerContext) -> TokenType:
+    return node.type_token.token_type
 
-    elif isinstance(node, Literal):
-        return node.type_token.token_type
-    elif isinstance(node, Name):
-        var, is_const = lookup_var(node.token.lexeme, context)
-        token_type = _run_type_checker(var, context)
-        node.token_type = token_type
-        return token_type
-    elif isinstance(node, Parameter):
-        return node.type_token.token_type
-    elif isinstance(node, UnaryOp):
-        assert node.op.token_type == TokenType.MINUS
-        token_type = _run_type_checker(node.expression, context)
-        node.token_type = token_type
-        return token_type
 
+@TypeCheckers.register(Name)
+def check_name(node: Name, context: TypeCheckerContext) -> TokenType:
+    symbol = node.symbol
+    if symbol is None:
+        raise unresolved(node.token.lexeme)
+    token_type = symbol.token_type
+    node.token_type = token_type
+    return token_type
 
 
-def run_type_checker(block: Block):
+@TypeCheckers.register(Grouping)
+def check_grouping(node: Grouping, context: TypeCheckerContext) -> TokenType:
+    return _run_type_checker(node.expression, context)
+
+
+@TypeCheckers.register(Parameter)
+def check_parameter(node: Parameter, context: TypeCheckerContext) -> TokenType:
+    return node.type_token.token_type
+
+
+@TypeCheckers.register(UnaryOp)
+def check_unary_op(node: UnaryOp, context: TypeCheckerContext) -> TokenType:
+    assert node.op.token_type == TokenType.MINUS
+    token_type = _run_type_checker(node.expression, context)
+    node.token_type = token_type
+    return token_type
+
+
+
+# functions: only type check the bodies of these functions (and all top-level
+# statements), with lazy parsing the other bodies are never parsed
+def run_type_checker(block: Block, functions: Iterable[str]=None):
+    resolve(block, functions)
     context = TypeCheckerContext()
+    if functions is not None:
+        context.check_functions = set(functions)
     _run_type_checker(block, context)
+
+
+# First phase of a parallel check: resolve and check the top-level statements
+# and register the function signatures without looking into function bodies.
+# Returns the index of the first statement that failed and its error.
+def check_signatures(block: Block) -> Tuple[Optional[int], Optional[Exception]]:
+    resolver = ResolverContext(functions=())
+    context = TypeCheckerContext()
+    context.check_functions = set()
+    try:
+        for i, stmt in enumerate(block.statements):
+            _resolve(stmt, resolver)
+            _run_type_checker(stmt, context)
+    except Exception as e:
+        return i, e
+    finally:
+        block.frame_size = resolver.frame_size
+    return None, None
+
+
+# Second phase: resolve and check the bodies of the functions at `indices` of
+# block.statements (in increasing order) after check_signatures, each with
+# the globals and functions declared before it in scope. Stops at the first
+# error. Returns the functions checked and the index and error of the failure.
+def check_function_bodies(block: Block, indices: List[int]) -> Tuple[List[FunctionDeclaration], Optional[int], Optional[Exception]]:
+    resolver = ResolverContext()
+    context = TypeCheckerContext()
+    checked = []
+    statements = block.statements
+    position = 0
+    for index in indices:
+        # replay the top-level declarations up to the function
+        for stmt in statements[position:index]:
+            if isinstance(stmt, (VarDeclaration, ConstDeclaration)):
+                resolver.names[stmt.name.lexeme] = stmt.symbol
+            elif isinstance(stmt, FunctionDeclaration):
+                context.functions[stmt.name.lexeme] = stmt
+        position = index
+
+        try:
+            _resolve(statements[index], resolver)
+            _run_type_checker(statements[index], context)
+        except Exception as e:
+            return checked, index, e
+        checked.append(statements[index])
+
+    return checked, None, None
+
+
+# parameter types and return type, what a call site gets checked against
+def signature(node: FunctionDeclaration) -> Tuple:
+    return tuple(p.type_token.token_type for p in node.params), node.return_type.token_type
+
+
+# Resolver and checker contexts that note the globals and the functions a
+# function body looks up
+class RecordingResolverContext(ResolverContext):
+    def __init__(self):
+        super().__init__()
+        self.references: Dict[str, Optional[Symbol]] = {}
+
+    def lookup(self, name: str) -> Symbol:
+        symbol = self.names.get(name)
+        if symbol is None or symbol.depth == 0:
+            self.references[name] = symbol
+        return symbol
+
+
+class RecordingTypeCheckerContext(TypeCheckerContext):
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, Optional[Tuple]] = {}
+
+    def function(self, name: str) -> FunctionDeclaration:
+        func_decl = self.functions.get(name)
+        self.calls[name] = signature(func_decl) if func_decl is not None else None
+        return func_decl
+
+
+# What a function body was checked against: the global symbol each name
+# resolved to (None for unresolved ones) and the signature of each callee
+class FunctionRecord:
+    __slots__ = ('references', 'calls')
+
+    def __init__(self, references: Dict[str, Optional[Symbol]], calls: Dict[str, Optional[Tuple]]):
+        self.references = references
+        self.calls = calls
+
+    def is_current(self, names: Dict[str, Symbol], functions: Dict[str, FunctionDeclaration]) -> bool:
+        for name, symbol in self.references.items():
+            if names.get(name) is not symbol:
+                return False
+        for name, sig in self.calls.items():
+            func_decl = functions.get(name)
+            if (signature(func_decl) if func_decl is not None else None) != sig:
+                return False
+        return True
+
+
+# Long-lived checker for a Block that is edited in place, e.g. by an
+# IncrementalFrontEnd. Each function body is checked once and only checked
+# again when its node changes or when a global or callee signature it was
+# checked against changes. Top-level statements other than functions are
+# cheap and re-checked every time. Global symbols are kept across rechecks
+# while their name, type and constness stay the same, with their slot
+# renumbered, so unchanged bodies keep valid annotations for the later passes.
+class IncrementalTypeChecker:
+    def __init__(self, block: Block):
+        self.block = block
+        self.records: Dict[FunctionDeclaration, FunctionRecord] = {}
+        self.symbols: Dict[str, Symbol] = {}
+
+    # changed_nodes: functions whose bodies were edited in place. Statements
+    # spliced into the block are new nodes and always get checked. Raises the
+    # first type error found, like run_type_checker. Returns the functions
+    # whose bodies were checked.
+    def recheck(self, changed_nodes: Iterable[Node]=()) -> List[FunctionDeclaration]:
+        for node in changed_nodes:
+            self.records.pop(node, None)
+
+        resolver = ResolverContext()
+        context = TypeCheckerContext()
+        records = {}
+        symbols = {}
+        checked = []
+        for stmt in self.block.statements:
+            if isinstance(stmt, FunctionDeclaration):
+                context.functions[stmt.name.lexeme] = stmt
+                record = self.records.get(stmt)
+                if record is None or not record.is_current(resolver.names, context.functions):
+                    # a body that fails to check may be left half annotated
+                    self.records.pop(stmt, None)
+                    record = self.check_function(stmt, resolver, context)
+                    self.records[stmt] = record
+                    checked.append(stmt)
+                records[stmt] = record
+                continue
+
+            _resolve(stmt, resolver)
+            _run_type_checker(stmt, context)
+            if isinstance(stmt, (VarDeclaration, ConstDeclaration)):
+                symbols[stmt.name.lexeme] = self.keep_symbol(stmt, resolver)
+
+        self.block.frame_size = resolver.frame_size
+        self.records = records
+        self.symbols = symbols
+        return checked
+
+    # carry the previous Symbol of a redeclared global over to its new
+    # declaration unless its type or constness changed
+    def keep_symbol(self, node: Union[VarDeclaration, ConstDeclaration], resolver: ResolverContext) -> Symbol:
+        symbol = node.symbol
+        previous = self.symbols.get(symbol.name)
+        if previous is None or previous is symbol or previous.is_const != symbol.is_const \
+                or previous.token_type != symbol.token_type:
+            return symbol
+
+        previous.index = symbol.index
+        previous.declaration = node
+        node.symbol = previous
+        resolver.names[symbol.name] = previous
+        return previous
+
+    def check_function(self, node: FunctionDeclaration, resolver: ResolverContext,
+                       context: TypeCheckerContext) -> FunctionRecord:
+        recording_resolver = RecordingResolverContext()
+        recording_resolver.names = resolver.names
+        recording_context = RecordingTypeCheckerContext()
+        recording_context.functions = context.functions
+
+        _resolve(node, recording_resolver)
+        _run_type_checker(node, recording_context)
+        return FunctionRecord(recording_resolver.references, recording_context.calls)
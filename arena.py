@@ -0,0 +1,425 @@
+from typing import List
+from array import array
+from operator import attrgetter
+import marshal
+import struct
+from Token import *
+from Model import *
+
+NO_NODE = -1
+
+# nodes, list entries, pool bytes, root
+ARENA_HEADER = struct.Struct('<IIIi')
+
+
+# Flat AST: one entry per node in parallel typed arrays instead of a tree of
+# objects. Every node has a kind (index into ArenaViews), an operator/type code
+# (TokenType value), a line, three int fields a, b, c holding child node
+# indices, pool indices or list references, and a type annotation code written
+# by the TypeChecker. Statement lists, call arguments and parameters are stored
+# length-prefixed in `lists`; names, operator lexemes and literal values are
+# interned in `pool`.
+class NodeArena:
+    def __init__(self):
+        self.kinds = array('B')
+        self.ops = array('B')
+        self.annotations = array('B')
+        self.lines = array('i')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.lists = array('i')
+        self.pool = []
+        self.pool_index = {}
+        self.root = NO_NODE
+        # node index -> Resolver result (symbol or frame_size), not serialized
+        self.resolved = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @staticmethod
+    def from_tree(block: Block) -> "NodeArena":
+        arena = NodeArena()
+        arena.root = arena.add_node(block)
+        return arena
+
+    def block(self) -> Block:
+        return self.node(self.root)
+
+    # view of node i, None for NO_NODE
+    def node(self, i: int) -> Node:
+        if i < 0:
+            return None
+        return ArenaViews[self.kinds[i]](self, i)
+
+    def nodes(self, ref: int) -> List[Node]:
+        lists = self.lists
+        return [self.node(i) for i in lists[ref + 1:ref + 1 + lists[ref]]]
+
+    # indices of all nodes of a Model class, by a pass over kinds rather than
+    # a walk of the tree
+    def find(self, cls) -> List[int]:
+        kind = ArenaKinds[cls]
+        return [i for i, k in enumerate(self.kinds) if k == kind]
+
+    def intern(self, value) -> int:
+        # keyed by type too, True == 1 == 1.0 would share an entry otherwise
+        key = (type(value), value)
+        if self.pool_index is None:
+            self.pool_index = {(type(v), v): i for i, v in enumerate(self.pool)}
+        index = self.pool_index.get(key)
+        if index is None:
+            index = self.pool_index[key] = len(self.pool)
+            self.pool.append(value)
+        return index
+
+    def add(self, kind: int, op: int=0, line: int=-1, a: int=NO_NODE, b: int=NO_NODE, c: int=NO_NODE) -> int:
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.annotations.append(0)
+        self.lines.append(line)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.kinds) - 1
+
+    def add_list(self, nodes: List[Node]) -> int:
+        indices = [self.add_node(node) for node in nodes]
+        ref = len(self.lists)
+        self.lists.append(len(indices))
+        self.lists.extend(indices)
+        return ref
+
+    def add_node(self, node: Node) -> int:
+        if node is None:
+            return NO_NODE
+        for cls in type(node).__mro__:
+            encode = ArenaEncoders.get(cls)
+            if encode is not None:
+                index = encode(self, node, ArenaKinds[cls])
+                annotation = ArenaAnnotations.get(cls)
+                if annotation is not None and getattr(node, annotation, None) is not None:
+                    self.annotations[index] = getattr(node, annotation).value
+                return index
+        raise ValueError(f"Unknown node {node!r}")
+
+    # A single buffer holding the whole arena, see from_bytes
+    def to_bytes(self) -> bytes:
+        pool = marshal.dumps(self.pool)
+        header = ARENA_HEADER.pack(len(self.kinds), len(self.lists), len(pool), self.root)
+        columns = (self.lines, self.a, self.b, self.c, self.lists, self.kinds, self.ops, self.annotations)
+        return b''.join([header] + [column.tobytes() for column in columns] + [pool])
+
+    # The int columns are memoryviews into data (no copy, data may be a
+    # shared memory buffer); the columns the TypeChecker writes are copied.
+    @staticmethod
+    def from_bytes(data) -> "NodeArena":
+        view = memoryview(data).cast('B')
+        if len(view) < ARENA_HEADER.size:
+            raise ValueError("Truncated arena buffer")
+        count, list_count, pool_size, root = ARENA_HEADER.unpack_from(view)
+        offset = ARENA_HEADER.size
+        if len(view) != offset + 4 * (4 * count + list_count) + 3 * count + pool_size:
+            raise ValueError("Truncated arena buffer")
+
+        def column(code, length):
+            nonlocal offset
+            size = length * struct.calcsize(code)
+            values = view[offset:offset + size].cast(code)
+            offset += size
+            return values
+
+        arena = NodeArena.__new__(NodeArena)
+        arena.lines = column('i', count)
+        arena.a = column('i', count)
+        arena.b = column('i', count)
+        arena.c = column('i', count)
+        arena.lists = column('i', list_count)
+        arena.kinds = column('B', count)
+        arena.ops = array('B', column('B', count).tobytes())
+        arena.annotations = array('B', column('B', count).tobytes())
+        arena.pool = marshal.loads(view[offset:offset + pool_size])
+        arena.pool_index = None
+        arena.root = root
+        arena.resolved = {}
+        return arena
+
+    def nbytes(self) -> int:
+        columns = (self.lines, self.a, self.b, self.c, self.lists, self.kinds, self.ops, self.annotations)
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+# Views present an arena node through the interface of its Model class, so
+# code written against the object tree (isinstance checks, attribute access,
+# TypeChecker annotations) walks the arena unchanged. A view is two words and
+# is created on access; children are views again.
+class ArenaView:
+    __slots__ = ()
+
+    def __init__(self, arena: NodeArena, index: int):
+        self.arena = arena
+        self.index = index
+
+
+def child(column: str) -> property:
+    get_column = attrgetter(column)
+    return property(lambda self: self.arena.node(get_column(self.arena)[self.index]))
+
+def node_list(column: str) -> property:
+    get_column = attrgetter(column)
+    return property(lambda self: self.arena.nodes(get_column(self.arena)[self.index]))
+
+def list_length(column: str) -> property:
+    get_column = attrgetter(column)
+    return property(lambda self: self.arena.lists[get_column(self.arena)[self.index]])
+
+# Token for a name interned in column
+def name_token(column: str, token_type: TokenType=TokenType.IDENTIFIER) -> property:
+    get_column = attrgetter(column)
+    return property(lambda self: Token(token_type, self.arena.pool[get_column(self.arena)[self.index]],
+                                       self.arena.lines[self.index]))
+
+def fixed_token(token_type: TokenType, lexeme: str) -> property:
+    return property(lambda self: Token(token_type, lexeme, self.arena.lines[self.index]))
+
+# Operator token: type in ops, lexeme interned in c
+op_token = property(lambda self: Token(TokenTypes[self.arena.ops[self.index]],
+                                       self.arena.pool[self.arena.c[self.index]], self.arena.lines[self.index]))
+
+# Shared type token stored as its code in ops, None when there is none
+def get_type_token(self) -> Token:
+    code = self.arena.ops[self.index]
+    return TypeTokens[TokenTypes[code]] if code else None
+
+def set_type_token(self, token: Token):
+    self.arena.ops[self.index] = token.token_type.value
+
+type_token = property(get_type_token, set_type_token)
+
+# TokenType annotation added by the TypeChecker, unset until then
+def get_annotation(self) -> TokenType:
+    code = self.arena.annotations[self.index]
+    if not code:
+        raise AttributeError('annotation')
+    return TokenTypes[code]
+
+def set_annotation(self, token_type: TokenType):
+    self.arena.annotations[self.index] = token_type.value
+
+annotation = property(get_annotation, set_annotation)
+
+# symbol or frame_size the Resolver sets, a node has at most one of them
+def resolved(name: str) -> property:
+    def get(self):
+        try:
+            return self.arena.resolved[self.index]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def set(self, value):
+        self.arena.resolved[self.index] = value
+
+    return property(get, set)
+
+
+class BlockView(ArenaView, Block):
+    __slots__ = ('arena', 'index')
+    statements = node_list('a')
+    frame_size = resolved('frame_size')
+
+class PrintStatementView(ArenaView, PrintStatement):
+    __slots__ = ('arena', 'index')
+    expression = child('a')
+
+class BinaryOpView(ArenaView, BinaryOp):
+    __slots__ = ('arena', 'index')
+    left_expression = child('a')
+    right_expression = child('b')
+    op = op_token
+
+class LogicalExpressionView(ArenaView, LogicalExpression):
+    __slots__ = ('arena', 'index')
+    left_expression = child('a')
+    right_expression = child('b')
+    op = op_token
+
+class UnaryOpView(ArenaView, UnaryOp):
+    __slots__ = ('arena', 'index')
+    expression = child('a')
+    op = op_token
+    token_type = annotation
+
+class VarDeclarationView(ArenaView, VarDeclaration):
+    __slots__ = ('arena', 'index')
+    name = name_token('a')
+    expression = child('b')
+    type_token = type_token
+    symbol = resolved('symbol')
+
+class ConstDeclarationView(ArenaView, ConstDeclaration):
+    __slots__ = ('arena', 'index')
+    name = name_token('a')
+    expression = child('b')
+    type_token = type_token
+    symbol = resolved('symbol')
+
+class AssignmentView(ArenaView, Assignment):
+    __slots__ = ('arena', 'index')
+    name = name_token('a')
+    expression = child('b')
+    type_token = annotation
+    symbol = resolved('symbol')
+
+class IfStatementView(ArenaView, IfStatement):
+    __slots__ = ('arena', 'index')
+    condition = child('a')
+    then_branch = child('b')
+    else_branch = child('c')
+
+class WhileStatementView(ArenaView, WhileStatement):
+    __slots__ = ('arena', 'index')
+    condition = child('a')
+    body = child('b')
+
+class ParameterView(ArenaView, Parameter):
+    __slots__ = ('arena', 'index')
+    name = child('a')
+    type_token = type_token
+    symbol = resolved('symbol')
+
+class FunctionDeclarationView(ArenaView, FunctionDeclaration):
+    __slots__ = ('arena', 'index')
+    name = name_token('a')
+    body = child('b')
+    params = node_list('c')
+    arity = list_length('c')
+    return_type = type_token
+    frame_size = resolved('frame_size')
+
+class CallView(ArenaView, Call):
+    __slots__ = ('arena', 'index')
+    callee = child('a')
+    arguments = node_list('b')
+    arity = list_length('b')
+    paren = fixed_token(TokenType.LEFT_PAREN, '(')
+    type_token = annotation
+
+class GroupingView(ArenaView, Grouping):
+    __slots__ = ('arena', 'index')
+    expression = child('a')
+
+class ReturnView(ArenaView, Return):
+    __slots__ = ('arena', 'index')
+    expression = child('a')
+    token_type = annotation
+
+class BreakView(ArenaView, Break):
+    __slots__ = ('arena', 'index')
+    token = fixed_token(TokenType.BREAK, 'break')
+
+class ContinueView(ArenaView, Continue):
+    __slots__ = ('arena', 'index')
+    token = fixed_token(TokenType.CONTINUE, 'continue')
+
+class NameView(ArenaView, Name):
+    __slots__ = ('arena', 'index')
+    token = property(lambda self: Token(TokenTypes[self.arena.ops[self.index]], self.arena.pool[self.arena.a[self.index]],
+                                        self.arena.lines[self.index]))
+    token_type = annotation
+    symbol = resolved('symbol')
+
+# Literal value interned in a, its type code in ops
+literal_value = property(lambda self: self.arena.pool[self.arena.a[self.index]])
+
+class IntegerView(ArenaView, Integer):
+    __slots__ = ('arena', 'index')
+    value = literal_value
+    type_token = type_token
+
+class FloatView(ArenaView, Float):
+    __slots__ = ('arena', 'index')
+    value = literal_value
+    type_token = type_token
+
+class CharView(ArenaView, Char):
+    __slots__ = ('arena', 'index')
+    value = literal_value
+    type_token = type_token
+
+class BoolView(ArenaView, Bool):
+    __slots__ = ('arena', 'index')
+    value = literal_value
+    type_token = type_token
+
+
+# kind code -> view class
+ArenaViews = [
+    BlockView, PrintStatementView, BinaryOpView, LogicalExpressionView, UnaryOpView,
+    VarDeclarationView, ConstDeclarationView, AssignmentView, IfStatementView, WhileStatementView,
+    ParameterView, FunctionDeclarationView, CallView, GroupingView, ReturnView, BreakView,
+    ContinueView, NameView, IntegerView, FloatView, CharView, BoolView,
+]
+ArenaKinds = {view.__mro__[2]: kind for kind, view in enumerate(ArenaViews)}
+
+
+# Model class -> attribute holding the TokenType the TypeChecker annotates it
+# with, kept in the annotations column
+ArenaAnnotations = {
+    Name: 'token_type',
+    UnaryOp: 'token_type',
+    Return: 'token_type',
+    Assignment: 'type_token',
+    Call: 'type_token',
+}
+
+
+def type_code(token: Token) -> int:
+    return token.token_type.value if token is not None else 0
+
+def encode_operator(arena: NodeArena, node, kind: int) -> int:
+    return arena.add(kind, node.op.token_type.value, node.op.line,
+                     arena.add_node(node.left_expression), arena.add_node(node.right_expression),
+                     arena.intern(node.op.lexeme))
+
+def encode_declaration(arena: NodeArena, node, kind: int) -> int:
+    return arena.add(kind, type_code(node.type_token), node.name.line,
+                     arena.intern(node.name.lexeme), arena.add_node(node.expression))
+
+def encode_literal(arena: NodeArena, node: Literal, kind: int) -> int:
+    return arena.add(kind, type_code(node.type_token), a=arena.intern(node.value))
+
+# Model class -> function adding a node of that class (and its children) with
+# the given kind code
+ArenaEncoders = {
+    Block: lambda arena, node, kind: arena.add(kind, a=arena.add_list(node.statements)),
+    PrintStatement: lambda arena, node, kind: arena.add(kind, a=arena.add_node(node.expression)),
+    BinaryOp: encode_operator,
+    LogicalExpression: encode_operator,
+    UnaryOp: lambda arena, node, kind: arena.add(kind, node.op.token_type.value, node.op.line,
+                                           arena.add_node(node.expression), c=arena.intern(node.op.lexeme)),
+    VarDeclaration: encode_declaration,
+    ConstDeclaration: encode_declaration,
+    Assignment: lambda arena, node, kind: arena.add(kind, 0, node.name.line,
+                                              arena.intern(node.name.lexeme), arena.add_node(node.expression)),
+    IfStatement: lambda arena, node, kind: arena.add(kind, a=arena.add_node(node.condition),
+                                               b=arena.add_node(node.then_branch), c=arena.add_node(node.else_branch)),
+    WhileStatement: lambda arena, node, kind: arena.add(kind, a=arena.add_node(node.condition),
+                                                  b=arena.add_node(node.body)),
+    Parameter: lambda arena, node, kind: arena.add(kind, type_code(node.type_token), a=arena.add_node(node.name)),
+    FunctionDeclaration: lambda arena, node, kind: arena.add(kind, type_code(node.return_type),
+                                                       node.name.line, arena.intern(node.name.lexeme),
+                                                       arena.add_node(node.body), arena.add_list(node.params)),
+    Call: lambda arena, node, kind: arena.add(kind, 0, node.paren.line, arena.add_node(node.callee),
+                                        arena.add_list(node.arguments)),
+    Grouping: lambda arena, node, kind: arena.add(kind, a=arena.add_node(node.expression)),
+    Return: lambda arena, node, kind: arena.add(kind, a=arena.add_node(node.expression)),
+    Break: lambda arena, node, kind: arena.add(kind, line=node.token.line),
+    Continue: lambda arena, node, kind: arena.add(kind, line=node.token.line),
+    Name: lambda arena, node, kind: arena.add(kind, node.token.token_type.value, node.token.line,
+                                        arena.intern(node.token.lexeme)),
+    Integer: encode_literal,
+    Float: encode_literal,
+    Char: encode_literal,
+    Bool: encode_literal,
+}
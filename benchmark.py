@@ -0,0 +1,1222 @@
+from Token import *
+from Scanner import *
+from Parser import *
+from Incremental import *
+from parallel import parse_parallel, check_parallel
+from TypeChecker import run_type_checker, IncrementalTypeChecker
+from format import format_wabbit, FormatContext
+from arena import NodeArena
+from cache import ParseCache
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+parser = argparse.ArgumentParser(
+                    prog='Wabbit benchmarks')
+
+parser.add_argument('--functions', type=int, default=10000)
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--scanner', action='store_true')
+parser.add_argument('--stream', action='store_true')
+parser.add_argument('--compact', action='store_true')
+parser.add_argument('--incremental', action='store_true')
+parser.add_argument('--parser', action='store_true')
+parser.add_argument('--parallel', action='store_true')
+parser.add_argument('--lazy', action='store_true')
+parser.add_argument('--memory', action='store_true')
+parser.add_argument('--arena', action='store_true')
+parser.add_argument('--cache', action='store_true')
+parser.add_argument('--passes', action='store_true')
+parser.add_argument('--scopes', action='store_true')
+parser.add_argument('--recheck', action='store_true')
+parser.add_argument('--parallel_check', action='store_true')
+parser.add_argument('--fold', action='store_true')
+parser.add_argument('--dce', action='store_true')
+parser.add_argument('--callgraph', action='store_true')
+parser.add_argument('--inline', action='store_true')
+parser.add_argument('--memoize', action='store_true')
+parser.add_argument('--evaluate', action='store_true')
+parser.add_argument('--closures', action='store_true')
+parser.add_argument('--bytecode', action='store_true')
+parser.add_argument('--calls', action='store_true')
+parser.add_argument('--transpile', action='store_true')
+parser.add_argument('--tiered', action='store_true')
+
+
+# Mandelbrot-style program with `functions` copies of the kernel and its driver
+def generate_program(functions: int) -> str:
+    template = """
+func in_mandelbrot_{i}(x0 float, y0 float, n int) bool {{
+    var x float = 0.0;
+    var y float = 0.0;
+    var xtemp float = 0.0;
+    while n > 0 {{
+        xtemp = x*x - y*y + x0;
+        y = 2.0*x*y + y0;
+        x = xtemp;
+        n = n - 1;
+        if x*x + y*y > 4.0 {{
+            return false;
+        }}
+    }}
+    return true;
+}}
+
+// driver for kernel {i}
+func mandel_{i}() int {{
+    const xmin = -2.0;
+    const xmax = 1.0;
+    const ymin = -1.5;
+    const ymax = 1.5;
+    const width = 80.0;
+    const height = 40.0;
+    const threshhold = 1000;
+
+    var dx float = (xmax - xmin)/width;
+    var dy float = (ymax - ymin)/height;
+
+    var y float = ymax;
+    var x float = 0.0;
+    /* scan the plane */
+    while y >= ymin {{
+        x = xmin;
+        while x < xmax {{
+            if in_mandelbrot_{i}(x, y, threshhold) {{
+                print '*';
+            }} else {{
+                print '.';
+            }}
+            x = x + dx;
+        }}
+        print '\\n';
+        y = y - dy;
+    }}
+    return 0;
+}}
+"""
+    return ''.join(template.format(i=i) for i in range(functions))
+
+
+def best_time(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_scanner(source: str, repeat: int):
+    megabytes = len(source.encode()) / 1e6
+    print(f"scanner: {megabytes:.1f} MB of source")
+    for name, scanner_class in Scanners.items():
+        tokens = scanner_class(source).scan_tokens()
+        elapsed = best_time(lambda: scanner_class(source).scan_tokens(), repeat)
+        print(f"    {name:>8}: {elapsed:.3f}s {megabytes / elapsed:8.2f} MB/s {len(tokens) / elapsed:12,.0f} tokens/s")
+
+
+# Returns (result, peak bytes, bytes still allocated afterwards)
+def measure_memory(func):
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, current
+
+
+def benchmark_stream(source: str):
+    with tempfile.NamedTemporaryFile('w', suffix='.wb', delete=False) as fid:
+        fid.write(source)
+        path = fid.name
+
+    def parse_list():
+        with open(path) as fid:
+            return Parser(RegexScanner(fid.read()).scan_tokens()).parse()
+
+    def parse_stream():
+        with open(path) as fid:
+            return StreamingParser(StreamScanner(fid).stream_tokens()).parse()
+
+    try:
+        megabytes = os.path.getsize(path) / 1e6
+        print(f"stream: {megabytes:.1f} MB of source")
+        for name, func in (('list', parse_list), ('stream', parse_stream)):
+            start = time.perf_counter()
+            block, peak, ast = measure_memory(func)
+            elapsed = time.perf_counter() - start
+            print(f"    {name:>8}: peak {peak / 1e6:8.1f} MB, AST {ast / 1e6:8.1f} MB, {elapsed:.2f}s (traced)")
+            del block
+    finally:
+        os.remove(path)
+
+
+def benchmark_compact(source: str, repeat: int):
+    with tempfile.NamedTemporaryFile('w', suffix='.wb', delete=False) as fid:
+        fid.write(source)
+        path = fid.name
+
+    def read_source():
+        with open(path) as fid:
+            return fid.read()
+
+    try:
+        text = read_source()
+        tokens, _, token_list_bytes = measure_memory(lambda: RegexScanner(text).scan_tokens())
+        count = len(tokens)
+        del tokens
+        scanner, _, buffer_bytes = measure_memory(lambda: CompactScanner.from_file(path).scan_tokens())
+        del scanner
+
+        print(f"compact: {count:,} tokens")
+        print(f"    List[Token]: {token_list_bytes / count:6.1f} bytes/token")
+        print(f"    TokenBuffer: {buffer_bytes / count:6.1f} bytes/token (source mapped, not counted)")
+
+        list_time = best_time(lambda: Parser(RegexScanner(read_source()).scan_tokens()).parse(), repeat)
+        compact_time = best_time(lambda: CompactParser(CompactScanner.from_file(path).scan_tokens()).parse(), repeat)
+        print(f"    scan+parse: list {list_time:.2f}s, compact {compact_time:.2f}s")
+    finally:
+        os.remove(path)
+
+
+def benchmark_incremental(lines: int, repeat: int):
+    # a generated kernel/driver pair is 48 lines long
+    source = generate_program(max(lines // 48, 1))
+    print(f"incremental: {source.count(chr(10)):,} lines")
+    full = best_time(lambda: Parser(RegexScanner(source).scan_tokens()).parse(), 1)
+    print(f"    full scan+parse: {full * 1000:9.2f} ms")
+
+    front_end = IncrementalFrontEnd(source)
+    middle = source.index('var y float = 0.0;', len(source) // 2) + len('var y float = ')
+    edits = (
+        ('replace digit', lambda: front_end.edit(middle, 1, '1')),
+        ('insert space', lambda: front_end.edit(middle, 0, ' ')),
+        ('delete space', lambda: front_end.edit(middle, 1, '')),
+        ('insert newline', lambda: front_end.edit(middle, 0, '\n')),
+        ('delete newline', lambda: front_end.edit(middle, 1, '')),
+    )
+    for name, edit in edits:
+        elapsed = best_time(edit, 1)
+        print(f"    {name:>15}: {elapsed * 1000:9.2f} ms")
+
+
+# Edit-to-diagnostic latency: apply an edit through the incremental front end
+# and type check, rechecking only what the edit affects vs the whole program
+def benchmark_recheck(lines: int, repeat: int):
+    source = generate_program(max(lines // 48, 1))
+    block = Parser(RegexScanner(source).scan_tokens()).parse()
+    print(f"recheck: {source.count(chr(10)):,} lines, {len(block.statements):,} functions")
+    full = best_time(lambda: run_type_checker(block), repeat)
+    print(f"    {'full check':>16}: {full * 1000:9.2f} ms")
+
+    front_end = IncrementalFrontEnd(source)
+    checker = IncrementalTypeChecker(front_end.block)
+    checker.recheck()
+    body = source.index('var y float = 0.0;', len(source) // 2) + len('var y float = ')
+    params = source.index('n int) bool', len(source) // 2) + len('n int')
+    edits = (
+        # only the edited kernel
+        ('edit body', lambda: front_end.edit(body, 1, '1')),
+        # the kernel and its driver, which no longer passes enough arguments
+        ('add parameter', lambda: front_end.edit(params, 0, ', m int')),
+        ('remove parameter', lambda: front_end.edit(params, 7, '')),
+    )
+    for name, edit in edits:
+        start = time.perf_counter()
+        _, _, statements = edit()
+        try:
+            checked = len(checker.recheck(statements))
+            diagnostic = 'ok'
+        except ValueError as e:
+            checked = '-'
+            diagnostic = str(e)[:40]
+        elapsed = time.perf_counter() - start
+        print(f"    {name:>16}: {elapsed * 1000:9.2f} ms, {checked} checked, {diagnostic}")
+
+
+def benchmark_parser(source: str, repeat: int):
+    tokens = RegexScanner(source).scan_tokens()
+    print(f"parser: {len(tokens):,} tokens")
+    for name, parser_class in Parsers.items():
+        elapsed = best_time(lambda: parser_class(tokens).parse(), repeat)
+        print(f"    {name:>8}: {elapsed:.3f}s {len(tokens) / elapsed:12,.0f} tokens/s")
+
+
+def benchmark_parallel(source: str, repeat: int):
+    print(f"parallel: {args.functions * 2:,} functions, {os.cpu_count()} cores")
+    serial = best_time(lambda: PrattParser(RegexScanner(source).scan_tokens()).parse(), repeat)
+    print(f"    serial   : {serial:.3f}s")
+    for workers in (1, 2, 4, 8):
+        elapsed = best_time(lambda: parse_parallel(source, workers, min_source_bytes=0), repeat)
+        print(f"    {workers} workers: {elapsed:.3f}s speedup {serial / elapsed:.2f}x")
+
+
+# Cold start: scan, parse and type check a single function out of the whole
+# program, then format it, with eager and with lazily parsed function bodies
+def benchmark_lazy(source: str, repeat: int):
+    with tempfile.NamedTemporaryFile('w', suffix='.wb', delete=False) as fid:
+        fid.write(source)
+        path = fid.name
+
+    function = f'mandel_{args.functions // 2}'
+
+    def find(block: Block) -> FunctionDeclaration:
+        return next(s for s in block.statements if isinstance(s, FunctionDeclaration) and s.name.lexeme == function)
+
+    def list_tokens(lazy: bool):
+        with open(path) as fid:
+            block = Parser(RegexScanner(fid.read()).scan_tokens(), lazy).parse()
+        run_type_checker(block, [function])
+        return format_wabbit(find(block), FormatContext())
+
+    def compact_tokens(lazy: bool):
+        block = CompactParser(CompactScanner.from_file(path).scan_tokens(), lazy).parse()
+        run_type_checker(block, [function])
+        return format_wabbit(find(block), FormatContext())
+
+    try:
+        print(f"lazy: {args.functions * 2:,} functions, check and format {function}")
+        for name, func in (('list', list_tokens), ('compact', compact_tokens)):
+            assert func(False) == func(True)
+            eager = best_time(lambda: func(False), repeat)
+            lazy = best_time(lambda: func(True), repeat)
+            print(f"    {name:>8}: eager {eager:.3f}s, lazy {lazy:.3f}s, speedup {eager / lazy:.2f}x")
+    finally:
+        os.remove(path)
+
+
+# AST nodes reachable from node, through attributes and lists
+def count_nodes(node) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, (Node, Literal)):
+            count += 1
+            if hasattr(node, '__dict__'):
+                stack.extend(vars(node).values())
+            else:
+                stack.extend(getattr(node, name, None) for cls in type(node).__mro__
+                             for name in getattr(cls, '__slots__', ()))
+    return count
+
+
+def benchmark_memory(source: str):
+    tokens, _, token_bytes = measure_memory(lambda: RegexScanner(source).scan_tokens())
+    block, _, ast_bytes = measure_memory(lambda: Parser(tokens).parse())
+    nodes = count_nodes(block)
+    # the annotations the type checker adds to the nodes
+    _, _, checked_bytes = measure_memory(lambda: run_type_checker(block))
+
+    print(f"memory: {len(tokens):,} tokens, {nodes:,} AST nodes")
+    print(f"    tokens:      {token_bytes / 1e6:8.1f} MB {token_bytes / len(tokens):6.1f} bytes/token")
+    print(f"    AST:         {ast_bytes / 1e6:8.1f} MB {ast_bytes / nodes:6.1f} bytes/node")
+    print(f"    typechecked: {(ast_bytes + checked_bytes) / 1e6:8.1f} MB {(ast_bytes + checked_bytes) / nodes:6.1f} bytes/node")
+
+
+# Identifiers referenced by Name nodes, walking the object tree
+def referenced_names(node) -> set:
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Name):
+            names.add(node.token.lexeme)
+        elif isinstance(node, Node):
+            stack.extend(getattr(node, name, None) for cls in type(node).__mro__
+                         for name in getattr(cls, '__slots__', ()))
+    return names
+
+
+# Object tree against NodeArena: memory, walking it through the type checker
+# and the formatter or directly over the columns, and shipping it to another
+# process (serialize and load)
+def benchmark_arena(source: str, repeat: int):
+    import pickle
+
+    tokens = RegexScanner(source).scan_tokens()
+    block, _, tree_bytes = measure_memory(lambda: Parser(tokens).parse())
+    arena, _, arena_bytes = measure_memory(lambda: NodeArena.from_tree(block))
+    print(f"arena: {len(arena):,} nodes")
+    print(f"    memory: tree {tree_bytes / 1e6:.1f} MB, arena {arena_bytes / 1e6:.1f} MB "
+          f"({arena.nbytes() / len(arena):.1f} bytes/node in columns)")
+
+    for name, walk in (('type check', lambda root: run_type_checker(root)),
+                       ('format', lambda root: format_wabbit(root, FormatContext()))):
+        tree_time = best_time(lambda: walk(block), repeat)
+        arena_time = best_time(lambda: walk(arena.block()), repeat)
+        print(f"    {name:>10}: tree {tree_time:.3f}s, arena views {arena_time:.3f}s")
+
+    def arena_names():
+        pool, a = arena.pool, arena.a
+        return {pool[a[i]] for i in arena.find(Name)}
+
+    assert referenced_names(block) == arena_names()
+    tree_time = best_time(lambda: referenced_names(block), repeat)
+    arena_time = best_time(arena_names, repeat)
+    print(f"         names: tree walk {tree_time:.3f}s, arena columns {arena_time:.3f}s")
+
+    data = pickle.dumps(block)
+    pickle_time = best_time(lambda: pickle.loads(pickle.dumps(block)), repeat)
+    buffer = arena.to_bytes()
+    buffer_time = best_time(lambda: NodeArena.from_bytes(arena.to_bytes()), repeat)
+    print(f"    transfer: pickle {len(data) / 1e6:.1f} MB {pickle_time:.3f}s, "
+          f"to_bytes {len(buffer) / 1e6:.1f} MB {buffer_time:.3f}s")
+
+
+# Front-end latency with the parse cache: cold (scan, parse, type check and
+# store) against warm (load the stored arena)
+def benchmark_cache(source: str, repeat: int):
+    import shutil
+
+    directory = tempfile.mkdtemp()
+    data = source.encode()
+    cache = ParseCache(directory)
+
+    def cold():
+        shutil.rmtree(cache.directory, ignore_errors=True)
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        cache.store(data, NodeArena.from_tree(block))
+
+    def warm():
+        return cache.load(data).block()
+
+    try:
+        print(f"cache: {len(data) / 1e6:.1f} MB of source")
+        cold_time = best_time(cold, repeat)
+        warm_time = best_time(warm, repeat)
+        size = os.path.getsize(cache.path(data))
+        print(f"    cold {cold_time:.3f}s, warm {warm_time * 1000:.1f} ms, entry {size / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+# Top-level loop for the interpreter
+def generate_loop(iterations: int) -> str:
+    return f"""
+var i int = 0;
+var total int = 0;
+var x float = 0.0;
+while i < {iterations} {{
+    total = total + i * 2 - 1;
+    if total > 1000000 {{
+        total = total - 1000000;
+    }} else {{
+        x = x + 1.5;
+    }}
+    i = i + 1;
+}}
+"""
+
+
+# Time of every pass over the generated program: type checking, formatting,
+# compiling to LLVM IR and interpreting a loop
+def benchmark_passes(source: str, repeat: int):
+    from interpreter import interpret
+
+    block = Parser(RegexScanner(source).scan_tokens()).parse()
+    print(f"passes: {count_nodes(block):,} nodes")
+    elapsed = best_time(lambda: run_type_checker(block), repeat)
+    print(f"    {'type check':>10}: {elapsed:.3f}s")
+    elapsed = best_time(lambda: format_wabbit(block, FormatContext()), repeat)
+    print(f"    {'format':>10}: {elapsed:.3f}s")
+
+    try:
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    {'compile':>10}: skipped ({e})")
+    else:
+        elapsed = best_time(lambda: Compiler().build(block), repeat)
+        print(f"    {'compile':>10}: {elapsed:.3f}s")
+
+    loop = Parser(RegexScanner(generate_loop(args.functions * 20)).scan_tokens()).parse()
+    elapsed = best_time(lambda: interpret(loop), repeat)
+    print(f"    {'interpret':>10}: {elapsed:.3f}s ({args.functions * 20:,} iterations)")
+
+
+# Top-level loop over expressions of constants
+def generate_constant_loop(iterations: int) -> str:
+    return f"""
+const scale = 2.0;
+const offset = 0.5;
+const limit = 1000000;
+const debug = false;
+var i int = 0;
+var total int = 0;
+var x float = 0.0;
+while i < {iterations} {{
+    x = x + scale * (offset + 1.0) / (scale * 4.0);
+    total = total + (limit / 1000) * 2 - 1;
+    if total > limit {{
+        total = total - limit;
+    }}
+    if debug == true {{
+        print 'd';
+    }}
+    i = i + 1;
+}}
+"""
+
+
+def count_instructions(module) -> int:
+    return sum(len(block.instructions) for function in module.functions for block in function.blocks)
+
+
+# Constant folding: nodes folded in the benchmark programs, LLVM instructions
+# emitted with and without it and interpreter time on a loop over constants
+def benchmark_fold(source: str, repeat: int):
+    from interpreter import interpret
+    from optimize import fold_constants
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        programs = (('testfile.wb', fid.read()), (f'{args.functions * 2:,} functions', source))
+    for name, program in programs:
+        block = Parser(RegexScanner(program).scan_tokens()).parse()
+        run_type_checker(block)
+        instructions = []
+        try:
+            from Compiler import Compiler
+            Compiler()
+        except (ImportError, RuntimeError):
+            Compiler = None
+        if Compiler is not None:
+            compiler = Compiler()
+            compiler.build(block)
+            instructions.append(count_instructions(compiler.module))
+        stats = fold_constants(block)
+        if Compiler is not None:
+            compiler = Compiler()
+            compiler.build(block)
+            instructions.append(count_instructions(compiler.module))
+        print(f"fold {name}: {stats}")
+        if instructions:
+            print(f"    {'LLVM instructions':>18}: {instructions[0]:,} -> {instructions[1]:,}")
+
+    iterations = args.functions * 20
+    loop = generate_constant_loop(iterations)
+    block = Parser(RegexScanner(loop).scan_tokens()).parse()
+    run_type_checker(block)
+    before = best_time(lambda: interpret(block), repeat)
+    stats = fold_constants(block)
+    after = best_time(lambda: interpret(block), repeat)
+    print(f"fold constant loop: {stats}")
+    print(f"    {'interpret':>18}: {before:.3f}s -> {after:.3f}s ({iterations:,} iterations, {before / after:.2f}x)")
+
+
+# `functions` functions with debug code behind a constant, unused locals and a
+# statement after the return
+def generate_dead_code(functions: int) -> str:
+    template = """
+func work_{i}(n int) int {{
+    var total int = 0;
+    var scale float = 1.5 * 2.0;
+    var trace int = n * 3;
+    while n > 0 {{
+        total = total + n;
+        if debug {{
+            print 'd';
+            total = total + 1;
+        }}
+        n = n - 1;
+    }}
+    return total;
+    total = total * 2;
+}}
+"""
+    return 'const debug = false;\n' + ''.join(template.format(i=i) for i in range(functions))
+
+
+# Dead code elimination after folding: statements and nodes removed from a
+# generated program and the time Compiler.build takes with and without it
+def benchmark_dce(repeat: int):
+    from optimize import fold_constants, eliminate_dead_code
+
+    source = generate_dead_code(args.functions)
+    blocks = []
+    for _ in range(2):
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        fold_constants(block)
+        blocks.append(block)
+    nodes = count_nodes(blocks[1])
+    stats = eliminate_dead_code(blocks[1])
+    print(f"dce: {stats}, {nodes:,} -> {count_nodes(blocks[1]):,} nodes")
+
+    try:
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    {'compile':>10}: skipped ({e})")
+        return
+    before = best_time(lambda: Compiler().build(blocks[0]), repeat)
+    after = best_time(lambda: Compiler().build(blocks[1]), repeat)
+    instructions = []
+    for block in blocks:
+        compiler = Compiler()
+        compiler.build(block)
+        instructions.append(count_instructions(compiler.module))
+    print(f"    {'compile':>10}: {before:.3f}s -> {after:.3f}s, {instructions[0]:,} -> {instructions[1]:,} LLVM instructions")
+
+
+# `functions` helpers in 8 distinct variants and an entry function calling
+# every 50th of them, the rest is never used
+def generate_helpers(functions: int) -> str:
+    template = """
+func helper_{i}(a int, b int) int {{
+    var t int = a * {k};
+    while b > 0 {{
+        t = t + a * {k};
+        b = b - 1;
+    }}
+    return t;
+}}
+"""
+    helpers = ''.join(template.format(i=i, k=i % 8 + 1) for i in range(functions))
+    calls = ''.join(f'    total = total + helper_{i}(total, 2);\n' for i in range(0, functions, 50))
+    return helpers + f'func entry() int {{\n    var total int = 1;\n{calls}    return total;\n}}\n'
+
+
+def object_size(module) -> int:
+    import llvmlite.binding as llvm
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    target_machine = llvm.Target.from_default_triple().create_target_machine()
+    return len(target_machine.emit_object(llvm.parse_assembly(str(module))))
+
+
+# Compile time (type check, LLVM IR and object code) and object size of a
+# module of mostly unused helpers, as is, with the functions that entry does
+# not reach dropped and with the identical ones merged too
+def benchmark_callgraph(repeat: int):
+    from callgraph import eliminate_dead_functions, merge_identical_functions
+    try:
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"callgraph: skipped ({e})")
+        return
+
+    source = generate_helpers(args.functions)
+    print(f"callgraph: {args.functions:,} helpers, entry calls {len(range(0, args.functions, 50)):,}")
+
+    def run(eliminate: bool, merge: bool):
+        block = Parser(RegexScanner(source).scan_tokens(), lazy=True).parse()
+        start = time.perf_counter()
+        if eliminate:
+            eliminate_dead_functions(block, ['entry'])
+        run_type_checker(block)
+        if merge:
+            merge_identical_functions(block, ['entry'])
+        compiler = Compiler()
+        compiler.build(block)
+        size = object_size(compiler.module)
+        return time.perf_counter() - start, len(block.statements), size
+
+    for name, eliminate, merge in (('all', False, False), ('reachable', True, False), ('merged', True, True)):
+        elapsed, functions, size = min(run(eliminate, merge) for _ in range(repeat))
+        print(f"    {name:>10}: {elapsed:.3f}s, {functions:,} functions, {size:,} bytes of object code")
+
+
+# A loop calling two small helpers every iteration, one of them returning
+# early, called from outside as run(n)
+def generate_calls() -> str:
+    return """
+func square(x int) int {
+    return x * x;
+}
+func clamp(x int, hi int) int {
+    if x > hi {
+        return x - hi;
+    }
+    return x;
+}
+func run(n int) int {
+    var total int = 0;
+    var i int = 0;
+    while i < n {
+        total = clamp(total + square(i - i / 7 * 7), 1000000);
+        i = i + 1;
+    }
+    return total;
+}
+"""
+
+
+# Interpreting and compiling a call heavy loop with and without the helpers
+# inlined into it; compiled code runs through the JIT and ctypes
+def benchmark_inline(repeat: int):
+    import contextlib
+    import io
+    from inline import inline_functions
+    from interpreter import interpret
+    iterations = 200000
+    source = generate_calls()
+    print(f"inline: run({iterations:,}) calling 2 helpers per iteration")
+
+    def checked(source: str, inline: bool) -> Block:
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        if inline:
+            inline_functions(block)
+        return block
+
+    print(f"    {inline_functions(checked(source, False))}")
+    for inline in (False, True):
+        block = checked(source + f"print run({iterations});\n", inline)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            elapsed = best_time(lambda: interpret(block), repeat)
+        print(f"    {'inlined' if inline else 'calls':>8} interpreter: {elapsed:.3f}s -> {output.getvalue().split()[0]}")
+
+    try:
+        import ctypes
+        import llvmlite.binding as llvm
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    compile: skipped ({e})")
+        return
+
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    for inline in (False, True):
+        block = checked(source, inline)
+        elapsed = best_time(lambda: Compiler().build(checked(source, inline)), repeat)
+        compiler = Compiler()
+        compiler.build(block)
+        # the engine owns the target machine
+        target_machine = llvm.Target.from_default_triple().create_target_machine()
+        with llvm.create_mcjit_compiler(llvm.parse_assembly(str(compiler.module)), target_machine) as engine:
+            engine.finalize_object()
+            run = ctypes.CFUNCTYPE(ctypes.c_int32, ctypes.c_int32)(engine.get_function_address('run'))
+            result = run(iterations)
+            jit = best_time(lambda: run(iterations), repeat)
+        print(f"    {'inlined' if inline else 'calls':>8} compiler: {elapsed:.3f}s (parse and check included), "
+              f"{count_instructions(compiler.module):,} instructions, run {jit * 1000:.2f}ms -> {result}")
+
+
+def generate_fibonacci(n: int) -> str:
+    return f"""
+func fib(n int) int {{
+    if n < 2 {{
+        return n;
+    }}
+    return fib(n - 1) + fib(n - 2);
+}}
+print fib({n});
+"""
+
+
+# mandel and fib(24) interpreted, transpiled to Python and compiled through
+# the JIT, whose print_char output goes to /dev/null
+def benchmark_transpile(repeat: int):
+    import contextlib
+    import ctypes
+    import io
+    import sys
+    import tempfile
+    from interpreter import interpret
+    from transpile import CodeCache, compile_python, run_python
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        mandel = fid.read()
+    fibonacci = generate_fibonacci(24).replace('print fib(24);', '')
+    # name, program, its entry point with the arguments, how interpreting
+    # runs it
+    programs = (('mandel', mandel, 'mandel', (), 'print mandel();\n'),
+                ('fib(24)', fibonacci, 'fib', (24,), 'print fib(24);\n'))
+    print("transpile: interpreter, transpiled to Python and JIT")
+
+    for name, source, entry, arguments, run in programs:
+        def checked() -> Block:
+            block = Parser(RegexScanner(source + run).scan_tokens()).parse()
+            run_type_checker(block)
+            return block
+
+        block = checked()
+        code = compile_python(block)
+        outputs = []
+
+        def run_engine(engine):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                engine()
+            outputs.append(output.getvalue())
+
+        tree = best_time(lambda: run_engine(lambda: interpret(block)), 1)
+        python = best_time(lambda: run_engine(lambda: run_python(code)), repeat)
+        same = 'same output' if len(set(outputs)) == 1 else 'OUTPUT DIFFERS'
+        print(f"    {name:>8}: interpreter {tree:.3f}s, python {python * 1000:.2f}ms ({tree / python:.1f}x, {same})")
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CodeCache(os.path.join(directory, 'program.wb'))
+            data = (source + run).encode()
+            cache.store(data, code)
+            front_end = best_time(lambda: compile_python(checked()), repeat)
+            load = best_time(lambda: cache.load(data), repeat)
+        print(f"    {'':>8}  scan, parse, check and transpile {front_end * 1000:.2f}ms, load .wbpy {load * 1000:.3f}ms")
+
+        try:
+            import llvmlite.binding as llvm
+            from Compiler import Compiler
+            compiler = Compiler()
+        except (ImportError, RuntimeError) as e:
+            print(f"    {'':>8}  jit: skipped ({e})")
+            continue
+        llvm.initialize()
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+        compiled = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(compiled)
+        compiler.build(compiled)
+        # the engine owns the target machine
+        target_machine = llvm.Target.from_default_triple().create_target_machine()
+        with llvm.create_mcjit_compiler(llvm.parse_assembly(str(compiler.module)), target_machine) as engine:
+            engine.finalize_object()
+            types = (ctypes.c_int32,) + (ctypes.c_int32,) * len(arguments)
+            function = ctypes.CFUNCTYPE(*types)(engine.get_function_address(entry))
+            sys.stdout.flush()
+            stdout = os.dup(1)
+            with open(os.devnull, 'w') as devnull:
+                os.dup2(devnull.fileno(), 1)
+            try:
+                jit = best_time(lambda: function(*arguments), repeat)
+            finally:
+                # print_char writes through C stdio
+                ctypes.CDLL(None).fflush(None)
+                os.dup2(stdout, 1)
+                os.close(stdout)
+        print(f"    {'':>8}  jit {jit * 1000:.2f}ms ({tree / jit:.0f}x, python {python / jit:.1f}x slower)")
+
+
+# mandel from the source to its first printed point and to its end, then
+# again once warm: interpreted, tiered and compiled through the JIT, whose
+# print_char output goes to /dev/null and whose first output is taken as
+# the moment mandel starts
+def benchmark_tiered(repeat: int):
+    import contextlib
+    import ctypes
+    import io
+    import sys
+    from interpreter import interpret
+    from tiered import TieredRuntime
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        source = fid.read()
+    print("tiered: mandel interpreted, tiered and compiled")
+
+    # stdout remembering when it was first written
+    class Output(io.StringIO):
+        first = None
+
+        def write(self, text: str) -> int:
+            if self.first is None:
+                self.first = time.perf_counter()
+            return super().write(text)
+
+    def checked(text: str) -> Block:
+        block = Parser(RegexScanner(text).scan_tokens()).parse()
+        run_type_checker(block)
+        return block
+
+    outputs = []
+    for tiered in (False, True):
+        output = Output()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            block = checked(source + 'print mandel();\n')
+            tiers = TieredRuntime(block) if tiered else None
+            interpret(block, tiers=tiers)
+        first, total = output.first - start, time.perf_counter() - start
+        outputs.append(output.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()):
+            warm = best_time(lambda: interpret(block, tiers=tiers), repeat if tiered else 1)
+        print(f"    {'tiered' if tiered else 'interpreted':>11}: first output {first * 1000:.2f}ms, "
+              f"end {total:.3f}s, warm {warm:.3f}s")
+        if tiered:
+            print(f"    {'':>11}  {tiers}, {'same output' if outputs[0] == outputs[1] else 'OUTPUT DIFFERS'}")
+
+    try:
+        import llvmlite.binding as llvm
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    compiled: skipped ({e})")
+        return
+    start = time.perf_counter()
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    compiler = Compiler()
+    compiler.build(checked(source))
+    # the engine owns the target machine
+    target_machine = llvm.Target.from_default_triple().create_target_machine()
+    with llvm.create_mcjit_compiler(llvm.parse_assembly(str(compiler.module)), target_machine) as engine:
+        engine.finalize_object()
+        mandel = ctypes.CFUNCTYPE(ctypes.c_int32)(engine.get_function_address('mandel'))
+        first = time.perf_counter() - start
+        sys.stdout.flush()
+        stdout = os.dup(1)
+        with open(os.devnull, 'w') as devnull:
+            os.dup2(devnull.fileno(), 1)
+        try:
+            mandel()
+            total = time.perf_counter() - start
+            warm = best_time(mandel, repeat)
+        finally:
+            # print_char writes through C stdio
+            ctypes.CDLL(None).fflush(None)
+            os.dup2(stdout, 1)
+            os.close(stdout)
+    print(f"    {'compiled':>11}: first output {first * 1000:.2f}ms, end {total:.3f}s, warm {warm:.3f}s")
+
+
+# Interpreting call heavy programs: naive fibonacci, deep recursion, and
+# mandel calling in_mandelbrot for every point
+def benchmark_calls(repeat: int):
+    import contextlib
+    import io
+    from interpreter import interpret
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        mandel = fid.read() + 'print mandel();\n'
+    print("calls: interpreting function calls")
+
+    for n in (18, 22):
+        block = Parser(RegexScanner(generate_fibonacci(n)).scan_tokens()).parse()
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = best_time(lambda: interpret(block), repeat)
+        # fib(n) makes 2 fib(n + 1) - 1 calls
+        a, b = 0, 1
+        for _ in range(n + 1):
+            a, b = b, a + b
+        calls = 2 * a - 1
+        print(f"    fib({n}): {elapsed:.3f}s, {calls:,} calls, {elapsed / calls * 1e6:.2f}us per call")
+
+    block = Parser(RegexScanner(mandel).scan_tokens()).parse()
+    run_type_checker(block)
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = best_time(lambda: interpret(block), repeat)
+    print(f"    mandel: {elapsed:.3f}s")
+
+
+# Which functions of the mandel program are pure, and interpreting naive
+# fibonacci with and without the results of pure calls memoized
+def benchmark_memoize(source: str, repeat: int):
+    import contextlib
+    import io
+    from Resolver import resolve
+    from interpreter import interpret
+    from purity import MemoCache, pure_functions
+
+    block = Parser(RegexScanner(source).scan_tokens()).parse()
+    resolve(block)
+    functions = sum(isinstance(stmt, FunctionDeclaration) for stmt in block.statements)
+    print(f"memoize: {len(pure_functions(block)):,} of {functions:,} functions pure")
+
+    for n in (16, 20, 24):
+        block = Parser(RegexScanner(generate_fibonacci(n)).scan_tokens()).parse()
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain = best_time(lambda: interpret(block), repeat)
+            memoized = best_time(lambda: interpret(block, MemoCache()), repeat)
+            memo = MemoCache()
+            interpret(block, memo)
+        print(f"    fib({n}): {plain:.3f}s -> {memoized * 1000:.2f}ms memoized ({memo})")
+
+
+# Folding with and without evaluating the pure calls of a program whose
+# results are known at compile time: time spent folding, then the run time
+# of the compiled run() and of interpreting it
+def benchmark_evaluate(repeat: int):
+    import contextlib
+    import ctypes
+    import io
+    from interpreter import interpret
+    from optimize import fold_constants
+    source = generate_fibonacci(24).replace('print fib(24);', """
+func run() int {
+    var limit int = fib(20);
+    var total int = 0;
+    var i int = 0;
+    while i < 10 {
+        total = total + fib(24) + limit;
+        i = i + 1;
+    }
+    return total;
+}
+""")
+    print("evaluate: run() sums fib(24) ten times")
+
+    try:
+        import llvmlite.binding as llvm
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    compile: skipped ({e})")
+        return
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+
+    for budget in (0, 100000):
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        start = time.perf_counter()
+        context = fold_constants(block, budget)
+        folding = time.perf_counter() - start
+
+        compiler = Compiler()
+        compiler.build(block)
+        # the engine owns the target machine
+        target_machine = llvm.Target.from_default_triple().create_target_machine()
+        with llvm.create_mcjit_compiler(llvm.parse_assembly(str(compiler.module)), target_machine) as engine:
+            engine.finalize_object()
+            run = ctypes.CFUNCTYPE(ctypes.c_int32)(engine.get_function_address('run'))
+            result = run()
+            jit = best_time(run, repeat)
+
+        block.statements.append(PrintStatement(Call(Name(Token(TokenType.IDENTIFIER, 'run')), None)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            interpreted = best_time(lambda: interpret(block), 1)
+        print(f"    budget {budget:>6}: fold {folding * 1000:.2f}ms ({context}), "
+              f"run {jit * 1e6:.1f}us, interpret {interpreted:.3f}s -> {result}")
+
+
+# Interpreting testfile.wb style programs by walking the tree and by running
+# the closures translated from it, type checked so the closures specialize
+def benchmark_closures(repeat: int):
+    import contextlib
+    import io
+    from closures import execute
+    from interpreter import interpret
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        mandel = fid.read() + 'print mandel();\n'
+    programs = (('mandel', mandel),
+                ('loop', generate_loop(100000) + 'print total; print x;\n'),
+                ('constant loop', generate_constant_loop(100000) + 'print total; print x;\n'),
+                ('calls', generate_calls() + 'print run(50000);\n'),
+                ('fib(20)', generate_fibonacci(20)))
+    print("closures: tree walking interpreter against closures")
+
+    for name, source in programs:
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        outputs = []
+
+        def run(engine):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                engine(block)
+            outputs.append(output.getvalue())
+
+        tree = best_time(lambda: run(interpret), repeat)
+        closures = best_time(lambda: run(execute), repeat)
+        same = 'same output' if len(set(outputs)) == 1 else 'OUTPUT DIFFERS'
+        print(f"    {name:>14}: {tree:.3f}s -> {closures:.3f}s ({tree / closures:.2f}x, {same})")
+
+
+# factorials of 1 to n, recursive and computed in a loop, `rounds` times
+def generate_factorial(n: int, rounds: int) -> str:
+    return f'''
+func fact(n int) int {{
+    if n < 2 {{
+        return 1;
+    }}
+    return n * fact(n - 1);
+}}
+func fact_loop(n int) int {{
+    var result int = 1;
+    while n > 1 {{
+        result = result * n;
+        n = n - 1;
+    }}
+    return result;
+}}
+var round int = 0;
+var total int = 0;
+while round < {rounds} {{
+    var i int = 1;
+    while i <= {n} {{
+        total = total + fact(i) - fact_loop(i);
+        i = i + 1;
+    }}
+    round = round + 1;
+}}
+print total;
+print fact({n});
+'''
+
+
+def benchmark_bytecode(repeat: int):
+    import contextlib
+    import io
+    import tempfile
+    from bytecode import BytecodeCache, compile_bytecode, run_bytecode
+    from closures import execute
+    from interpreter import interpret
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testfile.wb')) as fid:
+        mandel = fid.read() + 'print mandel();\n'
+    programs = (('mandel', mandel),
+                ('factorial', generate_factorial(12, 2000)))
+    print("bytecode: tree walking interpreter, closures and the bytecode vm")
+
+    for name, source in programs:
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        run_type_checker(block)
+        program = compile_bytecode(block)
+        outputs = []
+
+        def run(engine):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                engine()
+            outputs.append(output.getvalue())
+
+        tree = best_time(lambda: run(lambda: interpret(block)), repeat)
+        closures = best_time(lambda: run(lambda: execute(block)), repeat)
+        vm = best_time(lambda: run(lambda: run_bytecode(program)), repeat)
+        same = 'same output' if len(set(outputs)) == 1 else 'OUTPUT DIFFERS'
+        print(f"    {name:>10}: tree {tree:.3f}s, closures {closures:.3f}s ({tree / closures:.2f}x), "
+              f"vm {vm:.3f}s ({tree / vm:.2f}x, {same})")
+
+        # front end against loading the .wbc file
+        with tempfile.TemporaryDirectory() as directory:
+            cache = BytecodeCache(os.path.join(directory, name + '.wb'))
+            data = source.encode()
+
+            def front_end():
+                checked = Parser(RegexScanner(source).scan_tokens()).parse()
+                run_type_checker(checked)
+                return compile_bytecode(checked)
+
+            cache.store(data, front_end())
+            compile_time = best_time(front_end, repeat)
+            load_time = best_time(lambda: cache.load(data), repeat)
+            print(f"    {'':>10}  scan, parse, check and lower {compile_time * 1000:.2f}ms, "
+                  f"load {cache.path[len(directory) + 1:]} {load_time * 1000:.2f}ms")
+
+
+# `globals_count` globals and `functions` functions, each nesting `depth` if
+# blocks that declare a local and read the locals around them and the globals
+def generate_scopes(globals_count: int, functions: int, depth: int) -> str:
+    lines = [f'var g{i} int = {i};' for i in range(globals_count)]
+    for f in range(functions):
+        lines.append(f'func f{f}(a int) int {{')
+        lines.append(f'    var l0 int = a + g{f % globals_count};')
+        for d in range(1, depth + 1):
+            indent = '    ' * d
+            lines.append(f'{indent}if l{d - 1} > 0 {{')
+            lines.append(f'{indent}    var l{d} int = l{d - 1} + l0 + g{(f + d) % globals_count};')
+        lines.append('    ' * (depth + 1) + f'l0 = l{depth} + g{(f * 7) % globals_count};')
+        for d in range(depth, 0, -1):
+            lines.append('    ' * d + '}')
+        lines.append('    return l0;')
+        lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+# Type checking 10,000 functions serially and with the bodies spread over a
+# process pool, each run on a freshly parsed program
+def benchmark_parallel_check(repeat: int):
+    source = generate_program(5000)
+    print(f"parallel check: 10,000 functions, {os.cpu_count()} cores")
+
+    def run(check):
+        block = Parser(RegexScanner(source).scan_tokens()).parse()
+        start = time.perf_counter()
+        check(block)
+        return time.perf_counter() - start
+
+    serial = min(run(run_type_checker) for _ in range(repeat))
+    print(f"    serial   : {serial:.3f}s")
+    for workers in (2, 4, 8):
+        elapsed = min(run(lambda block: check_parallel(block, workers)) for _ in range(repeat))
+        print(f"    {workers} workers: {elapsed:.3f}s speedup {serial / elapsed:.2f}x")
+
+
+# Name resolution heavy passes: many globals and deeply nested locals
+def benchmark_scopes(repeat: int):
+    from Resolver import resolve
+
+    source = generate_scopes(5000, 1000, 20)
+    block = Parser(RegexScanner(source).scan_tokens()).parse()
+    print(f"scopes: 5,000 globals, 1,000 functions nesting 20 blocks, {count_nodes(block):,} nodes")
+    elapsed = best_time(lambda: resolve(block), repeat)
+    print(f"    {'resolve':>10}: {elapsed:.3f}s")
+    elapsed = best_time(lambda: run_type_checker(block), repeat)
+    print(f"    {'type check':>10}: {elapsed:.3f}s (resolve included)")
+
+    try:
+        from Compiler import Compiler
+        Compiler()
+    except (ImportError, RuntimeError) as e:
+        print(f"    {'compile':>10}: skipped ({e})")
+    else:
+        elapsed = best_time(lambda: Compiler().build(block), repeat)
+        print(f"    {'compile':>10}: {elapsed:.3f}s")
+
+
+args = parser.parse_args()
+def main():
+    source = generate_program(args.functions)
+    if args.scanner:
+        benchmark_scanner(source, args.repeat)
+    if args.stream:
+        benchmark_stream(source)
+    if args.compact:
+        benchmark_compact(source, args.repeat)
+    if args.incremental:
+        benchmark_incremental(50000, args.repeat)
+    if args.parser:
+        benchmark_parser(source, args.repeat)
+    if args.parallel:
+        benchmark_parallel(source, args.repeat)
+    if args.lazy:
+        benchmark_lazy(source, args.repeat)
+    if args.memory:
+        benchmark_memory(source)
+    if args.arena:
+        benchmark_arena(source, args.repeat)
+    if args.cache:
+        benchmark_cache(source, args.repeat)
+    if args.passes:
+        benchmark_passes(source, args.repeat)
+    if args.recheck:
+        benchmark_recheck(50000, args.repeat)
+    if args.parallel_check:
+        benchmark_parallel_check(args.repeat)
+    if args.fold:
+        benchmark_fold(source, args.repeat)
+    if args.dce:
+        benchmark_dce(args.repeat)
+    if args.callgraph:
+        benchmark_callgraph(args.repeat)
+    if args.scopes:
+        benchmark_scopes(args.repeat)
+    if args.inline:
+        benchmark_inline(args.repeat)
+    if args.memoize:
+        benchmark_memoize(source, args.repeat)
+    if args.evaluate:
+        benchmark_evaluate(args.repeat)
+    if args.closures:
+        benchmark_closures(args.repeat)
+    if args.bytecode:
+        benchmark_bytecode(args.repeat)
+    if args.calls:
+        benchmark_calls(args.repeat)
+    if args.transpile:
+        benchmark_transpile(args.repeat)
+    if args.tiered:
+        benchmark_tiered(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
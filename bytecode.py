@@ -0,0 +1,630 @@
+from typing import Dict, List, Optional, Tuple, Union
+from array import array
+from enum import IntEnum
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from Resolver import *
+from closures import static_type
+from callgraph import callees
+
+
+# Register bytecode. Every instruction is four ints, the opcode and three
+# operands: registers of the frame of the function being run, indices into
+# the constant pool, into the functions or jump targets (instruction
+# indices). The top-level code runs in the global frame, its registers are
+# the globals and functions reach them through GETGLOBAL and SETGLOBAL.
+class Op(IntEnum):
+    MOVE = 0        # a = b
+    LOADK = 1       # a = K[b]
+    GETGLOBAL = 2   # a = G[b]
+    SETGLOBAL = 3   # G[a] = b
+    ADD = 4         # a = b + c
+    SUB = 5
+    MUL = 6
+    DIV_I = 7       # ints truncate toward zero
+    DIV_F = 8
+    ADDK = 9        # a = b + K[c], x = x + 1 is one of these
+    SUBK = 10
+    MULK = 11
+    NEG = 12        # a = -b
+    NOT = 13        # a = not b
+    EQ = 14         # a = b == c
+    NE = 15
+    LT = 16
+    LE = 17
+    GT = 18
+    GE = 19
+    JUMP = 20       # to a
+    JUMPIFNOT = 21  # to b unless a
+    # compare and branch: to c unless a op b
+    JNEQ = 22
+    JNNE = 23
+    JNLT = 24
+    JNLE = 25
+    JNGT = 26
+    JNGE = 27
+    # compare with a constant and branch: to c unless a op K[b]
+    JNEQK = 28
+    JNNEK = 29
+    JNLTK = 30
+    JNLEK = 31
+    JNGTK = 32
+    JNGEK = 33
+    CALL = 34       # a = F[b](registers c up to c + arity)
+    RETURN = 35     # return a
+    RETURNNONE = 36
+    PRINT = 37      # print a
+    FAIL = 38       # raise RuntimeError(K[a])
+
+
+Arithmetic = {TokenType.PLUS: Op.ADD, TokenType.MINUS: Op.SUB, TokenType.STAR: Op.MUL}
+ArithmeticK = {Op.ADD: Op.ADDK, Op.SUB: Op.SUBK, Op.MUL: Op.MULK}
+Comparisons = {
+    TokenType.EQUAL_EQUAL: Op.EQ, TokenType.BANG_EQUAL: Op.NE, TokenType.LESS: Op.LT,
+    TokenType.LESS_EQUAL: Op.LE, TokenType.GREATER: Op.GT, TokenType.GREATER_EQUAL: Op.GE,
+}
+Branches = {
+    TokenType.EQUAL_EQUAL: (Op.JNEQ, Op.JNEQK), TokenType.BANG_EQUAL: (Op.JNNE, Op.JNNEK),
+    TokenType.LESS: (Op.JNLT, Op.JNLTK), TokenType.LESS_EQUAL: (Op.JNLE, Op.JNLEK),
+    TokenType.GREATER: (Op.JNGT, Op.JNGTK), TokenType.GREATER_EQUAL: (Op.JNGE, Op.JNGEK),
+}
+
+
+# Code and frame layout of a function: the parameters go to their registers
+# of a fresh frame of frame_size registers, locals first and temporaries after
+class Function:
+    def __init__(self, name: str, params: Tuple[int, ...], frame_size: int, code: array):
+        self.name = name
+        self.params = params
+        self.frame_size = frame_size
+        self.code = code
+
+    def __repr__(self):
+        return f"Function {self.name}({len(self.params)}) {self.frame_size} registers, {len(self.code) // 4} instructions"
+
+
+class Program:
+    def __init__(self, constants: List, functions: List[Function], main: Function):
+        self.constants = constants
+        self.functions = functions
+        self.main = main
+
+    def disassemble(self) -> str:
+        lines = []
+        for function in self.functions + [self.main]:
+            lines.append(f"{function!r}")
+            code = function.code
+            for pc in range(0, len(code), 4):
+                lines.append(f"    {pc // 4:4} {Op(code[pc]).name:<10} {code[pc + 1]} {code[pc + 2]} {code[pc + 3]}")
+        return '\n'.join(lines)
+
+
+class LoweringContext:
+    def __init__(self, constants: List, constant_indices: Dict, function_indices: Dict[str, int]):
+        # the pool is shared by all functions, equal values share an entry
+        self.constants = constants
+        self.constant_indices = constant_indices
+        self.function_indices = function_indices
+        self.code: List[int] = []
+        # registers from first_temp up are temporaries of the statement
+        # being lowered, max_temp is the frame size needed so far
+        self.first_temp = 0
+        self.next_temp = 0
+        self.max_temp = 0
+        # whether the code runs in the global frame
+        self.top_level = True
+        # per loop, the instruction its continue goes to and the jumps of
+        # its breaks to patch
+        self.loops: List[Tuple[int, List[int]]] = []
+        self.functions: List[FunctionDeclaration] = []
+
+    def constant(self, value) -> int:
+        # repr keeps 0.0 and -0.0 apart
+        key = (type(value), repr(value))
+        index = self.constant_indices.get(key)
+        if index is None:
+            index = self.constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def temp(self) -> int:
+        register = self.next_temp
+        self.next_temp += 1
+        self.max_temp = max(self.max_temp, self.next_temp)
+        return register
+
+    def emit(self, op: Op, a: int=0, b: int=0, c: int=0) -> int:
+        self.code.extend((op, a, b, c))
+        return len(self.code) // 4 - 1
+
+    def here(self) -> int:
+        return len(self.code) // 4
+
+    # point the jump at instruction to target, operand is where the target goes
+    def patch(self, instruction: int, operand: int, target: int):
+        self.code[instruction * 4 + operand] = target
+
+    def fail(self, message: str):
+        self.emit(Op.FAIL, self.constant(message))
+
+
+# jump target operand of each branch
+TargetOperand = {Op.JUMP: 1, Op.JUMPIFNOT: 2, **{op: 3 for pair in Branches.values() for op in pair}}
+
+
+# node class -> handler(node, context, target) lowering an expression into
+# code leaving its value in a register, which is returned. target is the
+# register the value should go to, None for any.
+Expressions = DispatchTable()
+
+
+def expression(node: Expression, context: LoweringContext, target: int=None) -> int:
+    register = Expressions[type(node)](node, context, target)
+    if target is not None and register != target:
+        context.emit(Op.MOVE, target, register)
+        return target
+    return register
+
+
+def destination(context: LoweringContext, target: Optional[int]) -> int:
+    return context.temp() if target is None else target
+
+
+@Expressions.register(Literal)
+def expression_literal(node: Literal, context: LoweringContext, target: int) -> int:
+    register = destination(context, target)
+    context.emit(Op.LOADK, register, context.constant(node.value))
+    return register
+
+
+# a local's register, or the global copied into one inside a function
+@Expressions.register(Name)
+def expression_name(node: Name, context: LoweringContext, target: int) -> int:
+    symbol = node.symbol
+    if symbol is None:
+        register = destination(context, target)
+        context.emit(Op.LOADK, register, context.constant(None))
+        return register
+    if symbol.depth == 0 and not context.top_level:
+        register = destination(context, target)
+        context.emit(Op.GETGLOBAL, register, symbol.index)
+        return register
+    return symbol.index
+
+
+@Expressions.register(Grouping)
+def expression_grouping(node: Grouping, context: LoweringContext, target: int) -> int:
+    return expression(node.expression, context, target)
+
+
+# Register of the left operand. A global of the top-level code is read in
+# place, so it is copied first when a call on the right may assign it.
+def left_operand(node: Union[BinaryOp, LogicalExpression], context: LoweringContext) -> int:
+    register = expression(node.left_expression, context)
+    if context.top_level and register < context.first_temp:
+        calls = set()
+        callees(node.right_expression, calls)
+        if calls:
+            temp = context.temp()
+            context.emit(Op.MOVE, temp, register)
+            return temp
+    return register
+
+
+@Expressions.register(BinaryOp)
+def expression_binary_op(node: BinaryOp, context: LoweringContext, target: int) -> int:
+    op = node.op.token_type
+    lhs = left_operand(node, context)
+    if op == TokenType.SLASH:
+        rhs = expression(node.right_expression, context)
+        register = destination(context, target)
+        float_division = static_type(node) == TokenType.TYPENAME_FLOAT
+        context.emit(Op.DIV_F if float_division else Op.DIV_I, register, lhs, rhs)
+        return register
+    if op not in Arithmetic:
+        raise RuntimeError(f"failed to interpret {node!r}")
+
+    if isinstance(node.right_expression, Literal):
+        register = destination(context, target)
+        context.emit(ArithmeticK[Arithmetic[op]], register, lhs, context.constant(node.right_expression.value))
+        return register
+    rhs = expression(node.right_expression, context)
+    register = destination(context, target)
+    context.emit(Arithmetic[op], register, lhs, rhs)
+    return register
+
+
+@Expressions.register(LogicalExpression)
+def expression_logical_expression(node: LogicalExpression, context: LoweringContext, target: int) -> int:
+    lhs = left_operand(node, context)
+    rhs = expression(node.right_expression, context)
+    register = destination(context, target)
+    context.emit(Comparisons[node.op.token_type], register, lhs, rhs)
+    return register
+
+
+@Expressions.register(UnaryOp)
+def expression_unary_op(node: UnaryOp, context: LoweringContext, target: int) -> int:
+    value = expression(node.expression, context)
+    register = destination(context, target)
+    if node.op.token_type == TokenType.MINUS:
+        context.emit(Op.NEG, register, value)
+    elif node.op.token_type == TokenType.BANG:
+        context.emit(Op.NOT, register, value)
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
+    return register
+
+
+# arguments go to consecutive registers, the callee copies them into its frame
+@Expressions.register(Call)
+def expression_call(node: Call, context: LoweringContext, target: int) -> int:
+    name = node.callee.token.lexeme
+    index = context.function_indices.get(name)
+    if index is None:
+        context.fail(f"Tried calling undefined function '{name}'")
+        return destination(context, target)
+
+    base = context.next_temp
+    for _ in node.arguments:
+        context.temp()
+    for i, arg in enumerate(node.arguments):
+        expression(arg, context, base + i)
+    register = destination(context, target)
+    context.emit(Op.CALL, register, index, base)
+    return register
+
+
+# node class -> handler(node, context) lowering a statement
+Statements = DispatchTable(default=lambda node, context: None)
+
+
+# statement(s) of a block, the temporaries of each are free after it
+def lower(node: Node, context: LoweringContext):
+    if isinstance(node, Expression):
+        expression(node, context)
+    else:
+        Statements[type(node)](node, context)
+    context.next_temp = context.first_temp
+
+
+@Statements.register(Block)
+def lower_block(node: Block, context: LoweringContext):
+    for stmt in node.statements:
+        lower(stmt, context)
+
+
+# value into the register or the global of symbol, a declaration without a
+# value stores None like the interpreter
+def store(symbol: Symbol, value: Optional[Expression], context: LoweringContext):
+    if symbol.depth == 0 and not context.top_level:
+        if value is None:
+            register = context.temp()
+            context.emit(Op.LOADK, register, context.constant(None))
+        else:
+            register = expression(value, context)
+        context.emit(Op.SETGLOBAL, symbol.index, register)
+    elif value is None:
+        context.emit(Op.LOADK, symbol.index, context.constant(None))
+    else:
+        expression(value, context, symbol.index)
+
+
+@Statements.register(VarDeclaration, ConstDeclaration)
+def lower_declaration(node: Union[VarDeclaration, ConstDeclaration], context: LoweringContext):
+    store(node.symbol, node.expression, context)
+
+
+@Statements.register(Assignment)
+def lower_assignment(node: Assignment, context: LoweringContext):
+    if node.symbol is None:
+        context.fail(f"Tried to assign undeclared variable {node.name.lexeme}")
+        return
+    store(node.symbol, node.expression, context)
+
+
+@Statements.register(PrintStatement)
+def lower_print_statement(node: PrintStatement, context: LoweringContext):
+    context.emit(Op.PRINT, expression(node.expression, context))
+
+
+# Jump past the code that follows unless condition holds, returns the
+# instruction whose target is to be patched. Comparisons branch directly.
+def branch_unless(condition: Expression, context: LoweringContext) -> int:
+    while isinstance(condition, Grouping):
+        condition = condition.expression
+    if isinstance(condition, LogicalExpression):
+        lhs = left_operand(condition, context)
+        op, op_k = Branches[condition.op.token_type]
+        if isinstance(condition.right_expression, Literal):
+            return context.emit(op_k, lhs, context.constant(condition.right_expression.value))
+        return context.emit(op, lhs, expression(condition.right_expression, context))
+    return context.emit(Op.JUMPIFNOT, expression(condition, context))
+
+
+def patch_branch(context: LoweringContext, instruction: int, target: int):
+    context.patch(instruction, TargetOperand[context.code[instruction * 4]], target)
+
+
+@Statements.register(IfStatement)
+def lower_if_statement(node: IfStatement, context: LoweringContext):
+    skip_then = branch_unless(node.condition, context)
+    context.next_temp = context.first_temp
+    lower(node.then_branch, context)
+    if node.else_branch is None:
+        patch_branch(context, skip_then, context.here())
+        return
+
+    skip_else = context.emit(Op.JUMP)
+    patch_branch(context, skip_then, context.here())
+    lower(node.else_branch, context)
+    patch_branch(context, skip_else, context.here())
+
+
+@Statements.register(WhileStatement)
+def lower_while_statement(node: WhileStatement, context: LoweringContext):
+    start = context.here()
+    leave = branch_unless(node.condition, context)
+    context.next_temp = context.first_temp
+    context.loops.append((start, []))
+    lower(node.body, context)
+    _, breaks = context.loops.pop()
+    context.emit(Op.JUMP, start)
+    end = context.here()
+    patch_branch(context, leave, end)
+    for jump in breaks:
+        patch_branch(context, jump, end)
+
+
+@Statements.register(Break)
+def lower_break(node: Break, context: LoweringContext):
+    context.loops[-1][1].append(context.emit(Op.JUMP))
+
+
+@Statements.register(Continue)
+def lower_continue(node: Continue, context: LoweringContext):
+    context.emit(Op.JUMP, context.loops[-1][0])
+
+
+@Statements.register(Return)
+def lower_return(node: Return, context: LoweringContext):
+    context.emit(Op.RETURN, expression(node.expression, context))
+
+
+# bodies are lowered after the code around them, each into a Function
+@Statements.register(FunctionDeclaration)
+def lower_function_declaration(node: FunctionDeclaration, context: LoweringContext):
+    context.functions.append(node)
+
+
+def lower_function(node: FunctionDeclaration, outer: LoweringContext) -> Function:
+    context = LoweringContext(outer.constants, outer.constant_indices, outer.function_indices)
+    context.top_level = False
+    context.first_temp = context.next_temp = context.max_temp = node.frame_size
+    lower(node.body, context)
+    context.emit(Op.RETURNNONE)
+    return Function(node.name.lexeme, tuple(p.symbol.index for p in node.params), context.max_temp,
+                    array('i', context.code))
+
+
+# Lower a resolved, preferably type checked, program to register bytecode.
+# Functions are known from the start of the program on, not only once their
+# declaration ran.
+def compile_bytecode(block: Block) -> Program:
+    if not is_resolved(block):
+        resolve(block)
+    function_indices = {}
+    for stmt in block.statements:
+        if isinstance(stmt, FunctionDeclaration):
+            function_indices.setdefault(stmt.name.lexeme, len(function_indices))
+
+    context = LoweringContext([], {}, function_indices)
+    context.first_temp = context.next_temp = context.max_temp = block.frame_size
+    lower(block, context)
+    context.emit(Op.RETURNNONE)
+    main = Function('', (), context.max_temp, array('i', context.code))
+
+    functions = [None] * len(function_indices)
+    for node in context.functions:
+        functions[function_indices[node.name.lexeme]] = lower_function(node, context)
+    return Program(context.constants, functions, main)
+
+
+OPCODES = tuple(int(op) for op in Op)
+
+
+# instructions as (op, a, b, c) tuples, the form the dispatch loop indexes
+def decode(code: array) -> List[Tuple[int, int, int, int]]:
+    return list(zip(*[iter(code)] * 4))
+
+
+# The dispatch loop, running one function's code in the frame regs until it
+# returns. The opcodes are locals and the most frequent are tested first.
+def execute(code: List[Tuple[int, int, int, int]], regs: List, G: List, K: List, F: List):
+    (MOVE, LOADK, GETGLOBAL, SETGLOBAL, ADD, SUB, MUL, DIV_I, DIV_F, ADDK, SUBK, MULK, NEG, NOT,
+     EQ, NE, LT, LE, GT, GE, JUMP, JUMPIFNOT, JNEQ, JNNE, JNLT, JNLE, JNGT, JNGE,
+     JNEQK, JNNEK, JNLTK, JNLEK, JNGTK, JNGEK, CALL, RETURN, RETURNNONE, PRINT, FAIL) = OPCODES
+    pc = 0
+    while True:
+        op, a, b, c = code[pc]
+        pc += 1
+        if op == ADDK:
+            regs[a] = regs[b] + K[c]
+        elif op == JUMP:
+            pc = a
+        elif op == JNLT:
+            if not regs[a] < regs[b]:
+                pc = c
+        elif op == JNLTK:
+            if not regs[a] < K[b]:
+                pc = c
+        elif op == ADD:
+            regs[a] = regs[b] + regs[c]
+        elif op == MUL:
+            regs[a] = regs[b] * regs[c]
+        elif op == SUB:
+            regs[a] = regs[b] - regs[c]
+        elif op == MOVE:
+            regs[a] = regs[b]
+        elif op == LOADK:
+            regs[a] = K[b]
+        elif op == GETGLOBAL:
+            regs[a] = G[b]
+        elif op == MULK:
+            regs[a] = regs[b] * K[c]
+        elif op == SUBK:
+            regs[a] = regs[b] - K[c]
+        elif op == JNGTK:
+            if not regs[a] > K[b]:
+                pc = c
+        elif op == JNGT:
+            if not regs[a] > regs[b]:
+                pc = c
+        elif op == JNGEK:
+            if not regs[a] >= K[b]:
+                pc = c
+        elif op == JNGE:
+            if not regs[a] >= regs[b]:
+                pc = c
+        elif op == JNEQK:
+            if not regs[a] == K[b]:
+                pc = c
+        elif op == JNEQ:
+            if not regs[a] == regs[b]:
+                pc = c
+        elif op == JNLEK:
+            if not regs[a] <= K[b]:
+                pc = c
+        elif op == JNLE:
+            if not regs[a] <= regs[b]:
+                pc = c
+        elif op == JNNEK:
+            if not regs[a] != K[b]:
+                pc = c
+        elif op == JNNE:
+            if not regs[a] != regs[b]:
+                pc = c
+        elif op == JUMPIFNOT:
+            if not regs[a]:
+                pc = b
+        elif op == CALL:
+            callee_code, params, frame_size = F[b]
+            frame = [None] * frame_size
+            for i, index in enumerate(params):
+                frame[index] = regs[c + i]
+            regs[a] = execute(callee_code, frame, G, K, F)
+        elif op == RETURN:
+            return regs[a]
+        elif op == RETURNNONE:
+            return None
+        elif op == SETGLOBAL:
+            G[a] = regs[b]
+        elif op == DIV_F:
+            regs[a] = regs[b] / regs[c]
+        elif op == DIV_I:
+            regs[a] = divide(regs[b], regs[c])
+        elif op == PRINT:
+            print(regs[a])
+        elif op == LT:
+            regs[a] = regs[b] < regs[c]
+        elif op == GT:
+            regs[a] = regs[b] > regs[c]
+        elif op == EQ:
+            regs[a] = regs[b] == regs[c]
+        elif op == NE:
+            regs[a] = regs[b] != regs[c]
+        elif op == LE:
+            regs[a] = regs[b] <= regs[c]
+        elif op == GE:
+            regs[a] = regs[b] >= regs[c]
+        elif op == NEG:
+            regs[a] = -regs[b]
+        elif op == NOT:
+            regs[a] = not regs[b]
+        elif op == FAIL:
+            raise RuntimeError(K[a])
+        else:
+            raise RuntimeError(f"bad opcode {op}")
+
+
+# Run program like interpret() runs the tree, the top-level code in the
+# global frame
+def run_bytecode(program: Program):
+    functions = [(decode(f.code), f.params, f.frame_size) for f in program.functions]
+    frame = [None] * program.main.frame_size
+    return execute(decode(program.main.code), frame, frame, program.constants, functions)
+
+
+def to_bytes(program: Program) -> bytes:
+    functions = [(f.name, f.params, f.frame_size, f.code.tobytes()) for f in program.functions + [program.main]]
+    return marshal.dumps((program.constants, functions))
+
+
+def from_bytes(data: bytes) -> Program:
+    constants, functions = marshal.loads(data)
+    functions = [Function(name, params, frame_size, array('i', code)) for name, params, frame_size, code in functions]
+    return Program(constants, functions[:-1], functions[-1])
+
+
+# Bump when the instruction set or the layout changes, old files then simply
+# stop matching
+BYTECODE_VERSION = 1
+BYTECODE_SUFFIX = '.wbc'
+
+
+# Bytecode of a source file in a .wbc file next to it, like a .pyc. The file
+# starts with the hash of the source, the bytecode version and options, the
+# passes that changed the tree before lowering, so a changed source misses.
+# marshal's format depends on the Python version, which is hashed too.
+# Subclasses cache other compiled forms by overriding the suffix, the version
+# and dumps/loads.
+class BytecodeCache:
+    suffix = BYTECODE_SUFFIX
+    version = BYTECODE_VERSION
+
+    def __init__(self, filename: str, options: str=''):
+        self.path = os.path.splitext(filename)[0] + self.suffix
+        self.options = options
+
+    def dumps(self, program: Program) -> bytes:
+        return to_bytes(program)
+
+    def loads(self, data: bytes) -> Program:
+        return from_bytes(data)
+
+    def key(self, source: bytes) -> bytes:
+        prefix = f'{self.version}:{sys.implementation.cache_tag}:{self.options}:'.encode()
+        return hashlib.sha256(prefix + source).digest()
+
+    def load(self, source: bytes) -> Optional[Program]:
+        try:
+            with open(self.path, 'rb') as fid:
+                data = fid.read()
+        except FileNotFoundError:
+            return None
+        key = self.key(source)
+        if data[:len(key)] != key:
+            return None
+        try:
+            return self.loads(data[len(key):])
+        except (ValueError, TypeError, EOFError):
+            return None
+
+    def store(self, source: bytes, program: Program):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fid:
+                fid.write(self.key(source))
+                fid.write(self.dumps(program))
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -0,0 +1,85 @@
+from typing import Optional
+import hashlib
+import os
+import sys
+import tempfile
+from arena import NodeArena
+
+# Bump when the AST, the arena layout or the type checker annotations change,
+# old entries then simply stop matching
+CACHE_VERSION = 1
+CACHE_DIRECTORY = '__wbcache__'
+CACHE_SUFFIX = '.wba'
+DEFAULT_CACHE_SIZE = 256 << 20
+
+
+# Parsed and type checked programs as NodeArena buffers in a __wbcache__
+# directory next to the source, like __pycache__. An entry is named after the
+# hash of the source and the cache version, so a changed source or compiler
+# misses instead of being invalidated. Entries are written atomically and the
+# least recently used ones are evicted once the directory outgrows max_size.
+class ParseCache:
+    def __init__(self, directory: str, max_size: int=DEFAULT_CACHE_SIZE):
+        self.directory = os.path.join(directory, CACHE_DIRECTORY)
+        self.max_size = max_size
+
+    def path(self, source: bytes) -> str:
+        key = hashlib.sha256(f'{CACHE_VERSION}:{sys.implementation.cache_tag}:'.encode() + source)
+        return os.path.join(self.directory, key.hexdigest() + CACHE_SUFFIX)
+
+    def load(self, source: bytes) -> Optional[NodeArena]:
+        path = self.path(source)
+        try:
+            with open(path, 'rb') as fid:
+                data = fid.read()
+            arena = NodeArena.from_bytes(data)
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError, EOFError):
+            # unreadable entry, drop it and parse again
+            self.remove(path)
+            return None
+
+        # mtime is the last use for eviction
+        os.utime(path)
+        return arena
+
+    def store(self, source: bytes, arena: NodeArena):
+        data = arena.to_bytes()
+        if len(data) > self.max_size:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fid:
+                fid.write(data)
+            os.replace(temp_path, self.path(source))
+        except BaseException:
+            self.remove(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(CACHE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,276 @@
+from typing import Dict, Iterable, Set, Union
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+
+
+# node class -> handler(node, calls) adding the names of the functions called
+# below node to calls
+Callees = DispatchTable(default=lambda node, calls: None)
+
+
+def callees(node: Node, calls: Set[str]):
+    Callees[type(node)](node, calls)
+
+
+@Callees.register(Block)
+def callees_block(node: Block, calls: Set[str]):
+    for stmt in node.statements:
+        callees(stmt, calls)
+
+
+@Callees.register(Call)
+def callees_call(node: Call, calls: Set[str]):
+    calls.add(node.callee.token.lexeme)
+    for arg in node.arguments:
+        callees(arg, calls)
+
+
+@Callees.register(BinaryOp, LogicalExpression)
+def callees_binary_op(node: Union[BinaryOp, LogicalExpression], calls: Set[str]):
+    callees(node.left_expression, calls)
+    callees(node.right_expression, calls)
+
+
+@Callees.register(UnaryOp, Grouping, PrintStatement, Return, VarDeclaration, ConstDeclaration, Assignment)
+def callees_expression(node: Node, calls: Set[str]):
+    if node.expression is not None:
+        callees(node.expression, calls)
+
+
+@Callees.register(IfStatement)
+def callees_if_statement(node: IfStatement, calls: Set[str]):
+    callees(node.condition, calls)
+    callees(node.then_branch, calls)
+    if node.else_branch:
+        callees(node.else_branch, calls)
+
+
+@Callees.register(WhileStatement)
+def callees_while_statement(node: WhileStatement, calls: Set[str]):
+    callees(node.condition, calls)
+    callees(node.body, calls)
+
+
+# Functions of a program by name and the functions each one calls. The edges
+# of a function are only collected when it is first asked for, so bodies of
+# functions nothing reaches are never parsed when they are lazy.
+class CallGraph:
+    def __init__(self, block: Block):
+        self.block = block
+        self.functions: Dict[str, FunctionDeclaration] = {}
+        for stmt in block.statements:
+            if isinstance(stmt, FunctionDeclaration):
+                self.functions[stmt.name.lexeme] = stmt
+        self.edges: Dict[str, Set[str]] = {}
+
+    def calls(self, name: str) -> Set[str]:
+        calls = self.edges.get(name)
+        if calls is None:
+            calls = self.edges[name] = set()
+            callees(self.functions[name].body, calls)
+        return calls
+
+    # names of the functions reachable from roots and from the top-level
+    # statements, which always run
+    def reachable(self, roots: Iterable[str]) -> Set[str]:
+        pending = set()
+        for stmt in self.block.statements:
+            if not isinstance(stmt, FunctionDeclaration):
+                callees(stmt, pending)
+        pending.update(roots)
+
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen or name not in self.functions:
+                continue
+            seen.add(name)
+            pending.update(self.calls(name))
+        return seen
+
+
+# Drop the functions that nothing reachable from the exported roots calls.
+# Runs before type checking, so the dropped ones are neither checked nor
+# compiled. Returns the number of functions dropped.
+def eliminate_dead_functions(block: Block, roots: Iterable[str]) -> int:
+    live = CallGraph(block).reachable(roots)
+    statements = [stmt for stmt in block.statements
+                  if not isinstance(stmt, FunctionDeclaration) or stmt.name.lexeme in live]
+    dropped = len(block.statements) - len(statements)
+    block.statements = statements
+    return dropped
+
+
+# node class -> handler(node, function) returning a hashable description of
+# node that two functions share when they compute the same thing: locals are
+# their slots, calls of function itself are recursion whatever its name
+Shapes = DispatchTable()
+
+
+def shape(node: Node, function: str):
+    return Shapes[type(node)](node, function)
+
+
+def shape_symbol(symbol, name: str):
+    if symbol is None or symbol.depth == 0:
+        return name
+    return symbol.index
+
+
+@Shapes.register(Literal)
+def shape_literal(node: Literal, function: str):
+    # 1, 1.0 and true compare equal, the type keeps them apart
+    return Literal, type(node.value), node.value
+
+
+@Shapes.register(Name)
+def shape_name(node: Name, function: str):
+    return Name, shape_symbol(node.symbol, node.token.lexeme)
+
+
+@Shapes.register(Block)
+def shape_block(node: Block, function: str):
+    return Block, tuple(shape(stmt, function) for stmt in node.statements)
+
+
+@Shapes.register(BinaryOp, LogicalExpression)
+def shape_binary_op(node: Union[BinaryOp, LogicalExpression], function: str):
+    return (type(node), node.op.token_type, shape(node.left_expression, function),
+            shape(node.right_expression, function))
+
+
+@Shapes.register(UnaryOp)
+def shape_unary_op(node: UnaryOp, function: str):
+    return UnaryOp, node.op.token_type, shape(node.expression, function)
+
+
+@Shapes.register(Grouping, PrintStatement, Return)
+def shape_expression(node: Union[Grouping, PrintStatement, Return], function: str):
+    return type(node), shape(node.expression, function)
+
+
+@Shapes.register(VarDeclaration, ConstDeclaration)
+def shape_declaration(node: Union[VarDeclaration, ConstDeclaration], function: str):
+    expression = shape(node.expression, function) if node.expression is not None else None
+    return type(node), node.type_token.token_type, node.symbol.index, expression
+
+
+@Shapes.register(Assignment)
+def shape_assignment(node: Assignment, function: str):
+    return Assignment, shape_symbol(node.symbol, node.name.lexeme), shape(node.expression, function)
+
+
+@Shapes.register(Call)
+def shape_call(node: Call, function: str):
+    name = node.callee.token.lexeme
+    return Call, None if name == function else name, tuple(shape(arg, function) for arg in node.arguments)
+
+
+@Shapes.register(IfStatement)
+def shape_if_statement(node: IfStatement, function: str):
+    else_branch = shape(node.else_branch, function) if node.else_branch else None
+    return IfStatement, shape(node.condition, function), shape(node.then_branch, function), else_branch
+
+
+@Shapes.register(WhileStatement)
+def shape_while_statement(node: WhileStatement, function: str):
+    return WhileStatement, shape(node.condition, function), shape(node.body, function)
+
+
+@Shapes.register(Break, Continue)
+def shape_jump(node: Union[Break, Continue], function: str):
+    return type(node)
+
+
+def shape_function(node: FunctionDeclaration):
+    params = tuple(p.type_token.token_type for p in node.params)
+    return params, node.return_type.token_type, shape(node.body, node.name.lexeme)
+
+
+# node class -> handler(node, renames) pointing calls at the functions renames
+# maps their callee to
+Renamers = DispatchTable(default=lambda node, renames: None)
+
+
+def rename_calls(node: Node, renames: Dict[str, str]):
+    Renamers[type(node)](node, renames)
+
+
+@Renamers.register(Block)
+def rename_block(node: Block, renames: Dict[str, str]):
+    for stmt in node.statements:
+        rename_calls(stmt, renames)
+
+
+@Renamers.register(Call)
+def rename_call(node: Call, renames: Dict[str, str]):
+    token = node.callee.token
+    if token.lexeme in renames:
+        node.callee = Name(Token(TokenType.IDENTIFIER, renames[token.lexeme], token.line))
+    for arg in node.arguments:
+        rename_calls(arg, renames)
+
+
+@Renamers.register(BinaryOp, LogicalExpression)
+def rename_binary_op(node: Union[BinaryOp, LogicalExpression], renames: Dict[str, str]):
+    rename_calls(node.left_expression, renames)
+    rename_calls(node.right_expression, renames)
+
+
+@Renamers.register(UnaryOp, Grouping, PrintStatement, Return, VarDeclaration, ConstDeclaration, Assignment)
+def rename_expression(node: Node, renames: Dict[str, str]):
+    if node.expression is not None:
+        rename_calls(node.expression, renames)
+
+
+@Renamers.register(IfStatement)
+def rename_if_statement(node: IfStatement, renames: Dict[str, str]):
+    rename_calls(node.condition, renames)
+    rename_calls(node.then_branch, renames)
+    if node.else_branch:
+        rename_calls(node.else_branch, renames)
+
+
+@Renamers.register(WhileStatement)
+def rename_while_statement(node: WhileStatement, renames: Dict[str, str]):
+    rename_calls(node.condition, renames)
+    rename_calls(node.body, renames)
+
+
+@Renamers.register(FunctionDeclaration)
+def rename_function_declaration(node: FunctionDeclaration, renames: Dict[str, str]):
+    rename_calls(node.body, renames)
+
+
+# Merge functions with the same signature and body into the first of them:
+# calls of the others are pointed at it and the others are dropped unless
+# they are exported roots. Functions that become identical once their callees
+# are merged get merged in turn. Runs on a type checked block. Returns the
+# number of functions dropped.
+def merge_identical_functions(block: Block, roots: Iterable[str]) -> int:
+    roots = set(roots)
+    merged = 0
+    previous = None
+    while True:
+        first = {}
+        renames = {}
+        for stmt in block.statements:
+            if isinstance(stmt, FunctionDeclaration):
+                key = shape_function(stmt)
+                name = stmt.name.lexeme
+                if key in first:
+                    renames[name] = first[key]
+                else:
+                    first[key] = name
+        # exported duplicates stay and are found again, done once nothing new is
+        if renames == previous or not renames:
+            return merged
+        previous = renames
+
+        rename_calls(block, renames)
+        statements = [stmt for stmt in block.statements
+                      if not isinstance(stmt, FunctionDeclaration) or stmt.name.lexeme not in renames
+                      or stmt.name.lexeme in roots]
+        merged += len(block.statements) - len(statements)
+        block.statements = statements
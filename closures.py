@@ -0,0 +1,350 @@
+from typing import Callable, Dict, List, Union
+import operator
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from Resolver import *
+
+# Second tree-walking engine: every node is translated once into a Python
+# closure specialized for its operator and, where the TypeChecker annotated
+# them, its operand types. Running the program is then a chain of closure
+# calls with no dispatch on node classes or token types. Expressions take
+# the frame (the list of slots of the function being run) and return their
+# value. Statements take the frame and return None, or BREAK, CONTINUE or
+# RETURN to leave the loops and the call they are in; a return leaves its
+# value in the last slot of the frame.
+BREAK = 'break'
+CONTINUE = 'continue'
+RETURN = 'return'
+
+
+class ClosureContext:
+    def __init__(self, frame_size: int=0):
+        # slots of the globals, shared by every closure
+        self.globals = [None] * frame_size
+        # name -> compiled function, filled when the declaration runs
+        self.functions: Dict[str, Callable] = {}
+
+
+# node class -> handler(node, context) returning the closure for node
+Closures = DispatchTable()
+
+
+def closure(node: Node, context: ClosureContext) -> Callable:
+    return Closures[type(node)](node, context)
+
+
+# closure for a statement, the value of an expression used as one is dropped
+def statement(node: Node, context: ClosureContext) -> Callable:
+    run = closure(node, context)
+    # literals are no Expression
+    if not isinstance(node, (Expression, Literal)):
+        return run
+
+    def expression_statement(frame):
+        run(frame)
+    return expression_statement
+
+
+# a return, break or continue somewhere below stmt, the blocks without one
+# need not look at what their statements return
+def jumps(stmt: Node) -> bool:
+    if isinstance(stmt, (Return, Break, Continue)):
+        return True
+    if isinstance(stmt, IfStatement):
+        return jumps(stmt.then_branch) or (stmt.else_branch is not None and jumps(stmt.else_branch))
+    if isinstance(stmt, WhileStatement):
+        return jumps(stmt.body)
+    if isinstance(stmt, Block):
+        return any(jumps(s) for s in stmt.statements)
+    return False
+
+
+# TokenType of expression from the TypeChecker's annotations, None when it
+# was not type checked
+def static_type(expression: Expression) -> TokenType:
+    if isinstance(expression, Literal):
+        return expression.type_token.token_type
+    if isinstance(expression, (Name, UnaryOp)):
+        return getattr(expression, 'token_type', None)
+    if isinstance(expression, Call):
+        return getattr(expression, 'type_token', None)
+    if isinstance(expression, Grouping):
+        return static_type(expression.expression)
+    if isinstance(expression, BinaryOp):
+        return static_type(expression.left_expression)
+    return None
+
+
+@Closures.register(Literal)
+def closure_literal(node: Literal, context: ClosureContext) -> Callable:
+    value = node.value
+    return lambda frame: value
+
+
+@Closures.register(Name)
+def closure_name(node: Name, context: ClosureContext) -> Callable:
+    symbol = node.symbol
+    if symbol is None:
+        return lambda frame: None
+    index = symbol.index
+    if symbol.depth == 0:
+        slots = context.globals
+        return lambda frame: slots[index]
+    return lambda frame: frame[index]
+
+
+@Closures.register(Grouping)
+def closure_grouping(node: Grouping, context: ClosureContext) -> Callable:
+    return closure(node.expression, context)
+
+
+BinaryOperators = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.EQUAL_EQUAL: operator.eq,
+    TokenType.BANG_EQUAL: operator.ne,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+}
+
+
+# lhs op rhs with the common operators inlined into the closure and a
+# literal right operand held as a value
+def binary_closure(op: TokenType, lhs: Callable, rhs: Callable, constant) -> Callable:
+    if constant is not None:
+        value = constant.value
+        if op == TokenType.PLUS:
+            return lambda frame: lhs(frame) + value
+        if op == TokenType.MINUS:
+            return lambda frame: lhs(frame) - value
+        if op == TokenType.STAR:
+            return lambda frame: lhs(frame) * value
+        if op == TokenType.LESS:
+            return lambda frame: lhs(frame) < value
+        if op == TokenType.GREATER:
+            return lambda frame: lhs(frame) > value
+        if op == TokenType.EQUAL_EQUAL:
+            return lambda frame: lhs(frame) == value
+    else:
+        if op == TokenType.PLUS:
+            return lambda frame: lhs(frame) + rhs(frame)
+        if op == TokenType.MINUS:
+            return lambda frame: lhs(frame) - rhs(frame)
+        if op == TokenType.STAR:
+            return lambda frame: lhs(frame) * rhs(frame)
+        if op == TokenType.LESS:
+            return lambda frame: lhs(frame) < rhs(frame)
+        if op == TokenType.GREATER:
+            return lambda frame: lhs(frame) > rhs(frame)
+        if op == TokenType.EQUAL_EQUAL:
+            return lambda frame: lhs(frame) == rhs(frame)
+
+    function = BinaryOperators[op]
+    return lambda frame: function(lhs(frame), rhs(frame))
+
+
+@Closures.register(BinaryOp)
+def closure_binary_op(node: BinaryOp, context: ClosureContext) -> Callable:
+    lhs = closure(node.left_expression, context)
+    rhs = closure(node.right_expression, context)
+    op = node.op.token_type
+    if op == TokenType.SLASH:
+        # floats divide, ints truncate toward zero
+        if static_type(node) == TokenType.TYPENAME_FLOAT:
+            return lambda frame: lhs(frame) / rhs(frame)
+        return lambda frame: divide(lhs(frame), rhs(frame))
+    if op not in BinaryOperators:
+        raise RuntimeError(f"failed to interpret {node!r}")
+    constant = node.right_expression if isinstance(node.right_expression, Literal) else None
+    return binary_closure(op, lhs, rhs, constant)
+
+
+@Closures.register(LogicalExpression)
+def closure_logical_expression(node: LogicalExpression, context: ClosureContext) -> Callable:
+    lhs = closure(node.left_expression, context)
+    rhs = closure(node.right_expression, context)
+    constant = node.right_expression if isinstance(node.right_expression, Literal) else None
+    return binary_closure(node.op.token_type, lhs, rhs, constant)
+
+
+@Closures.register(UnaryOp)
+def closure_unary_op(node: UnaryOp, context: ClosureContext) -> Callable:
+    expression = closure(node.expression, context)
+    if node.op.token_type == TokenType.MINUS:
+        return lambda frame: -expression(frame)
+    elif node.op.token_type == TokenType.BANG:
+        return lambda frame: not expression(frame)
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
+
+
+# stores the value of expression into the slot of symbol
+def store_closure(symbol: Symbol, expression: Callable, context: ClosureContext) -> Callable:
+    index = symbol.index
+    if symbol.depth == 0:
+        slots = context.globals
+
+        def store_global(frame):
+            slots[index] = expression(frame)
+        return store_global
+
+    def store_local(frame):
+        frame[index] = expression(frame)
+    return store_local
+
+
+@Closures.register(VarDeclaration, ConstDeclaration)
+def closure_declaration(node: Union[VarDeclaration, ConstDeclaration], context: ClosureContext) -> Callable:
+    if node.expression is None:
+        expression = lambda frame: None
+    else:
+        expression = closure(node.expression, context)
+    return store_closure(node.symbol, expression, context)
+
+
+@Closures.register(Assignment)
+def closure_assignment(node: Assignment, context: ClosureContext) -> Callable:
+    if node.symbol is None:
+        raise RuntimeError(f"Tried to assign undeclared variable {node.name.lexeme}")
+    return store_closure(node.symbol, closure(node.expression, context), context)
+
+
+@Closures.register(PrintStatement)
+def closure_print_statement(node: PrintStatement, context: ClosureContext) -> Callable:
+    expression = closure(node.expression, context)
+
+    def print_statement(frame):
+        print(expression(frame))
+    return print_statement
+
+
+@Closures.register(Block)
+def closure_block(node: Block, context: ClosureContext) -> Callable:
+    statements = tuple(statement(stmt, context) for stmt in node.statements)
+    if not jumps(node):
+        def block(frame):
+            for stmt in statements:
+                stmt(frame)
+        return block
+
+    def jumping_block(frame):
+        for stmt in statements:
+            signal = stmt(frame)
+            if signal is not None:
+                return signal
+    return jumping_block
+
+
+@Closures.register(IfStatement)
+def closure_if_statement(node: IfStatement, context: ClosureContext) -> Callable:
+    condition = closure(node.condition, context)
+    then_branch = closure(node.then_branch, context)
+    if node.else_branch is None:
+        def if_statement(frame):
+            if condition(frame):
+                return then_branch(frame)
+        return if_statement
+
+    else_branch = closure(node.else_branch, context)
+
+    def if_else_statement(frame):
+        if condition(frame):
+            return then_branch(frame)
+        return else_branch(frame)
+    return if_else_statement
+
+
+@Closures.register(WhileStatement)
+def closure_while_statement(node: WhileStatement, context: ClosureContext) -> Callable:
+    condition = closure(node.condition, context)
+    body = closure(node.body, context)
+    if not jumps(node.body):
+        def while_statement(frame):
+            while condition(frame):
+                body(frame)
+        return while_statement
+
+    def jumping_while_statement(frame):
+        while condition(frame):
+            signal = body(frame)
+            if signal is BREAK:
+                break
+            if signal is RETURN:
+                return signal
+    return jumping_while_statement
+
+
+@Closures.register(Break)
+def closure_break(node: Break, context: ClosureContext) -> Callable:
+    return lambda frame: BREAK
+
+
+@Closures.register(Continue)
+def closure_continue(node: Continue, context: ClosureContext) -> Callable:
+    return lambda frame: CONTINUE
+
+
+@Closures.register(Return)
+def closure_return(node: Return, context: ClosureContext) -> Callable:
+    expression = closure(node.expression, context)
+
+    def return_statement(frame):
+        frame[-1] = expression(frame)
+        return RETURN
+    return return_statement
+
+
+# The function runs in a frame of its own with a slot for the return value
+# after its locals. Its name is bound when the declaration runs, like in the
+# interpreter.
+@Closures.register(FunctionDeclaration)
+def closure_function_declaration(node: FunctionDeclaration, context: ClosureContext) -> Callable:
+    name = node.name.lexeme
+    body = closure(node.body, context)
+    size = node.frame_size + 1
+    indices = tuple(p.symbol.index for p in node.params)
+    functions = context.functions
+
+    def function(*args):
+        frame = [None] * size
+        for index, arg in zip(indices, args):
+            frame[index] = arg
+        if body(frame) is RETURN:
+            return frame[-1]
+        return None
+
+    def function_declaration(frame):
+        functions[name] = function
+    return function_declaration
+
+
+@Closures.register(Call)
+def closure_call(node: Call, context: ClosureContext) -> Callable:
+    name = node.callee.token.lexeme
+    functions = context.functions
+    arguments = tuple(closure(arg, context) for arg in node.arguments)
+
+    def call(frame):
+        function = functions.get(name)
+        if function is None:
+            raise RuntimeError(f"Tried calling undefined function '{name}'")
+        return function(*[arg(frame) for arg in arguments])
+    return call
+
+
+# Run node like interpret(): translate it into closures, then call them with
+# the global frame
+def execute(node: Node):
+    block = node if isinstance(node, Block) else Block([node])
+    if not is_resolved(block):
+        resolve(block)
+    context = ClosureContext(block.frame_size)
+    # the top-level statements run in the global frame, with a slot for a
+    # return outside any function
+    frame = context.globals + [None]
+    context.globals = frame
+    return statement(node, context)(frame)
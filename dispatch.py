@@ -0,0 +1,29 @@
+from typing import Callable
+
+
+# Handler table keyed on the exact node class, filled once when a pass is
+# defined. A class without an entry of its own (a subclass such as
+# LazyFunctionDeclaration or an arena view) resolves through its MRO on first
+# use and is cached, so every later visit is a single dict lookup.
+class DispatchTable(dict):
+    def __init__(self, default: Callable=None):
+        super().__init__()
+        self.default = default
+
+    def register(self, *classes) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            for cls in classes:
+                self[cls] = handler
+            return handler
+        return decorator
+
+    def __missing__(self, cls) -> Callable:
+        for base in cls.__mro__[1:]:
+            if base in self:
+                handler = self[cls] = dict.__getitem__(self, base)
+                return handler
+
+        if self.default is None:
+            raise KeyError(cls)
+        self[cls] = self.default
+        return self.default
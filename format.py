@@ -1,6 +1,7 @@
 from Model import *
 from dataclasses import dataclass
 from typing import Union
+from dispatch import DispatchTable
 
 @dataclass
 class FormatContext:
@@ -25,109 +26,164 @@ class StringBuilder:
 
 
 
+def format_unknown(node, ctx: FormatContext):
+    raise ValueError(f"Unknown node {node!r}")
+
+# node class -> handler(node, ctx) returning the formatted source
+Formatters = DispatchTable(default=format_unknown)
+
 
 def format_wabbit(node: Union[Expression,Statement], ctx: FormatContext):
+    return Formatters[type(node)](node, ctx)
+
+
+@Formatters.register(PrintStatement)
+def format_print_statement(node: PrintStatement, ctx: FormatContext):
     indent = ' '*ctx.indent
-    if isinstance(node, PrintStatement):
-        return indent + 'print ' + format_wabbit(node.expression, ctx) + ';\n'
-    elif isinstance(node, Integer):
-        return str(node)
-    elif isinstance(node, Char):
-        return str(node)
-    elif isinstance(node, Float):
-        return str(node)
-    elif isinstance(node, Bool):
-        return str(node)
-    elif isinstance(node, (BinaryOp, LogicalExpression)):
-        return f'{format_wabbit(node.left_expression, ctx)} {node.op.lexeme} {format_wabbit(node.right_expression, ctx)}'
-    elif isinstance(node, Block):
-        return ''.join([f'{format_wabbit(stmt, ctx)}' for stmt in node.statements])
-    elif isinstance(node, UnaryOp):
-        return f'{node.op.lexeme}{format_wabbit(node.expression, ctx)}'
-    elif isinstance(node, VarDeclaration):
-        s = indent + f'var {node.name.lexeme}'
-        if node.type_token is not None:
-            s += f' {node.type_token.lexeme}'
-        if node.expression is None:
-            s +=';\n'
-        else:
-            s += f' = {format_wabbit(node.expression, ctx)};\n'
-        return s
-    elif isinstance(node, ConstDeclaration):
-        s = indent + f'const {node.name.lexeme}'
-        if node.type_token is not None:
-            s += f' {node.type_token.lexeme}'
-
-        if node.expression is None:
-            s +=';\n'
-        else:
-            s += f' = {format_wabbit(node.expression, ctx)};\n'
-
-        return s
-    elif isinstance(node, Assignment):
-        return indent + f'{node.name.lexeme} = {format_wabbit(node.expression, ctx)};\n'
-    elif isinstance(node, Name):
-        return f'{node.token.lexeme}'
-    elif isinstance(node, IfStatement):
-        s = indent + f'if {format_wabbit(node.condition, ctx)}'
-        s += ' {\n'
-        ctx.indent += 4
-        s += f'{format_wabbit(node.then_branch, ctx)}'
-        ctx.indent -= 4
-        s += indent + '}\n'
-
-        if node.else_branch:
-            s += '{\n'
-            ctx.indent += 4
-            s += f'{format_wabbit(node.else_branch, ctx)}'
-            ctx.indent += 4
-            s += '}\n'
-        return s
-
-    elif isinstance(node, WhileStatement):
-        s = indent + f'while {format_wabbit(node.condition, ctx)}'
-        s += ' {\n'
-        if node.body:
-            ctx.indent += 4
-            s += f'{format_wabbit(node.body, ctx)}'
-            ctx.indent -= 4
-        s += indent + '}\n'
-
-        return s
-
-    elif isinstance(node, FunctionDeclaration):
-        s = indent + f'func {node.name.token.lexeme}('
-
-        for ii,p in enumerate(node.params):
-            s += f'{p.name.token.lexeme} {p.type_token.lexeme}'
-            if (ii + 1) < node.arity:
-                s += ', '
-        s += f') {node.return_type.lexeme}'
+    return indent + 'print ' + format_wabbit(node.expression, ctx) + ';\n'
+
+
+@Formatters.register(Integer, Char, Float, Bool)
+def format_literal(node: Literal, ctx: FormatContext):
+    return str(node)
+
+
+@Formatters.register(BinaryOp, LogicalExpression)
+def format_binary_op(node: Union[BinaryOp, LogicalExpression], ctx: FormatContext):
+    return f'{format_wabbit(node.left_expression, ctx)} {node.op.lexeme} {format_wabbit(node.right_expression, ctx)}'
+
+
+@Formatters.register(Block)
+def format_block(node: Block, ctx: FormatContext):
+    return ''.join([f'{format_wabbit(stmt, ctx)}' for stmt in node.statements])
+
+
+@Formatters.register(UnaryOp)
+def format_unary_op(node: UnaryOp, ctx: FormatContext):
+    return f'{node.op.lexeme}{format_wabbit(node.expression, ctx)}'
+
+
+@Formatters.register(VarDeclaration)
+def format_var_declaration(node: VarDeclaration, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'var {node.name.lexeme}'
+    if node.type_token is not None:
+        s += f' {node.type_token.lexeme}'
+    if node.expression is None:
+        s +=';\n'
+    else:
+        s += f' = {format_wabbit(node.expression, ctx)};\n'
+    return s
+
+
+@Formatters.register(ConstDeclaration)
+def format_const_declaration(node: ConstDeclaration, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'const {node.name.lexeme}'
+    if node.type_token is not None:
+        s += f' {node.type_token.lexeme}'
+
+    if node.expression is None:
+        s +=';\n'
+    else:
+        s += f' = {format_wabbit(node.expression, ctx)};\n'
+
+    return s
+
+
+@Formatters.register(Assignment)
+def format_assignment(node: Assignment, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    return indent + f'{node.name.lexeme} = {format_wabbit(node.expression, ctx)};\n'
+
+
+@Formatters.register(Name)
+def format_name(node: Name, ctx: FormatContext):
+    return f'{node.token.lexeme}'
+
+
+@Formatters.register(IfStatement)
+def format_if_statement(node: IfStatement, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'if {format_wabbit(node.condition, ctx)}'
+    s += ' {\n'
+    ctx.indent += 4
+    s += f'{format_wabbit(node.then_branch, ctx)}'
+    ctx.indent -= 4
+    s += indent + '}\n'
+
+    if node.else_branch:
         s += '{\n'
         ctx.indent += 4
-        s += format_wabbit(node.body, ctx)
-        ctx.indent -= 4
+        s += f'{format_wabbit(node.else_branch, ctx)}'
+        ctx.indent += 4
         s += '}\n'
-        return s
-
-    elif isinstance(node, Call):
-        s = indent + f'{format_wabbit(node.callee, ctx)}('
-        arity = len(node.arguments)
-        for ii,arg in enumerate(node.arguments):
-            if (ii + 1) < arity:
-                s += ', '
-            s += f'{format_wabbit(arg, ctx)}'
-        s += ')'
-        return s
-    elif isinstance(node, Return):
-        return indent + f'return {format_wabbit(node.expression, ctx)};\n'
-    elif isinstance(node, Break):
-        return indent + 'break;\n'
-    elif isinstance(node, Continue):
-        return indent + 'continue;\n'
+    return s
 
-    else:
-        raise ValueError(f"Unknown node {node!r}")
 
+@Formatters.register(WhileStatement)
+def format_while_statement(node: WhileStatement, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'while {format_wabbit(node.condition, ctx)}'
+    s += ' {\n'
+    if node.body:
+        ctx.indent += 4
+        s += f'{format_wabbit(node.body, ctx)}'
+        ctx.indent -= 4
+    s += indent + '}\n'
+
+    return s
 
 
+@Formatters.register(FunctionDeclaration)
+def format_function_declaration(node: FunctionDeclaration, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'func {node.name.lexeme}('
+
+    for ii,p in enumerate(node.params):
+        s += f'{p.name.token.lexeme} {p.type_token.lexeme}'
+        if (ii + 1) < node.arity:
+            s += ', '
+    s += f') {node.return_type.lexeme}'
+    s += '{\n'
+    ctx.indent += 4
+    s += format_wabbit(node.body, ctx)
+    ctx.indent -= 4
+    s += '}\n'
+    return s
+
+
+@Formatters.register(Call)
+def format_call(node: Call, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    s = indent + f'{format_wabbit(node.callee, ctx)}('
+    arity = len(node.arguments)
+    for ii,arg in enumerate(node.arguments):
+        if (ii + 1) < arity:
+            s += ', '
+        s += f'{format_wabbit(arg, ctx)}'
+    s += ')'
+    return s
+
+
+@Formatters.register(Grouping)
+def format_grouping(node: Grouping, ctx: FormatContext):
+    return f'({format_wabbit(node.expression, ctx)})'
+
+
+@Formatters.register(Return)
+def format_return(node: Return, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    return indent + f'return {format_wabbit(node.expression, ctx)};\n'
+
+
+@Formatters.register(Break)
+def format_break(node: Break, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    return indent + 'break;\n'
+
+
+@Formatters.register(Continue)
+def format_continue(node: Continue, ctx: FormatContext):
+    indent = ' '*ctx.indent
+    return indent + 'continue;\n'
@@ -0,0 +1,394 @@
+from typing import Dict, List, Union
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from Resolver import Symbol
+from callgraph import callees
+from purity import has_effects
+
+
+# functions whose body has at most this many nodes get inlined
+DEFAULT_INLINE_BUDGET = 60
+
+
+class InlineContext:
+    def __init__(self, budget: int=DEFAULT_INLINE_BUDGET):
+        self.budget = budget
+        # name -> declaration of the functions whose calls get inlined
+        self.candidates: Dict[str, FunctionDeclaration] = {}
+        # calls replaced by the body of their function
+        self.inlined = 0
+        # function the calls are inlined into, its frame grows by the locals
+        # of every body inlined
+        self.function: FunctionDeclaration = None
+
+    def __repr__(self):
+        return f"candidates {len(self.candidates)}, inlined {self.inlined}"
+
+
+# node class -> handler(node) returning the number of nodes below and
+# including node
+Sizes = DispatchTable(default=lambda node: 1)
+
+
+def size(node: Node) -> int:
+    return Sizes[type(node)](node)
+
+
+@Sizes.register(Block)
+def size_block(node: Block) -> int:
+    return 1 + sum(size(stmt) for stmt in node.statements)
+
+
+@Sizes.register(BinaryOp, LogicalExpression)
+def size_binary_op(node: Union[BinaryOp, LogicalExpression]) -> int:
+    return 1 + size(node.left_expression) + size(node.right_expression)
+
+
+@Sizes.register(UnaryOp, Grouping, PrintStatement, Return, VarDeclaration, ConstDeclaration, Assignment)
+def size_expression(node: Node) -> int:
+    return 1 + (size(node.expression) if node.expression is not None else 0)
+
+
+@Sizes.register(Call)
+def size_call(node: Call) -> int:
+    return 1 + sum(size(arg) for arg in node.arguments)
+
+
+@Sizes.register(IfStatement)
+def size_if_statement(node: IfStatement) -> int:
+    else_size = size(node.else_branch) if node.else_branch else 0
+    return 1 + size(node.condition) + size(node.then_branch) + else_size
+
+
+@Sizes.register(WhileStatement)
+def size_while_statement(node: WhileStatement) -> int:
+    return 1 + size(node.condition) + size(node.body)
+
+
+# Leaf functions (calling nothing, so never recursive) up to the size budget.
+# Functions returning char are left alone, the result variable would need a
+# char initializer the Compiler cannot build. So are functions with effects:
+# their hoisted body would run before the operands to the left of the call.
+def inlinable(node: FunctionDeclaration, budget: int) -> bool:
+    if node.return_type.token_type == TokenType.TYPENAME_CHAR or has_effects(node.body):
+        return False
+    calls = set()
+    callees(node.body, calls)
+    return not calls and size(node.body) <= budget
+
+
+# a return somewhere below stmt
+def returns(stmt: Statement) -> bool:
+    if isinstance(stmt, Return):
+        return True
+    if isinstance(stmt, IfStatement):
+        return returns(stmt.then_branch) or (stmt.else_branch is not None and returns(stmt.else_branch))
+    if isinstance(stmt, WhileStatement):
+        return returns(stmt.body)
+    if isinstance(stmt, Block):
+        return any(returns(s) for s in stmt.statements)
+    return False
+
+
+# a return other than the last statement of body, the statements after it
+# have to be skipped once it ran
+def returns_early(body: Block) -> bool:
+    statements = body.statements
+    for i, stmt in enumerate(statements):
+        if returns(stmt) and not (i == len(statements) - 1 and isinstance(stmt, Return)):
+            return True
+    return False
+
+
+Zeros = {
+    TokenType.TYPENAME_INTEGER: 0,
+    TokenType.TYPENAME_FLOAT: 0.0,
+    TokenType.TYPENAME_BOOL: False,
+}
+
+
+def name(symbol: Symbol) -> Name:
+    node = Name(Token(TokenType.IDENTIFIER, symbol.name))
+    node.symbol = symbol
+    node.token_type = symbol.token_type
+    return node
+
+
+def assign(symbol: Symbol, expression: Expression) -> Assignment:
+    node = Assignment(Token(TokenType.IDENTIFIER, symbol.name), expression)
+    node.symbol = symbol
+    node.type_token = symbol.token_type
+    return node
+
+
+# One call being inlined: the callee's locals mapped to fresh locals of the
+# caller, the variables taking the return value and recording that a return
+# ran, and how many of the callee's loops the copy is in.
+class Expansion:
+    def __init__(self, context: InlineContext, callee: FunctionDeclaration):
+        self.context = context
+        self.prefix = f"__{callee.name.lexeme}_{context.inlined}"
+        self.symbols: Dict[Symbol, Symbol] = {}
+        self.result: Symbol = None
+        self.done: Symbol = None
+        self.loops = 0
+
+    # local of the caller, unique among the inlined bodies
+    def declare(self, lexeme: str, node: Union[VarDeclaration, ConstDeclaration]) -> Symbol:
+        function = self.context.function
+        node.name = Token(TokenType.IDENTIFIER, lexeme, node.name.line)
+        node.symbol = Symbol(lexeme, 1, function.frame_size, isinstance(node, ConstDeclaration), node)
+        function.frame_size += 1
+        return node.symbol
+
+    def rename(self, lexeme: str) -> str:
+        return f"{self.prefix}_{lexeme}"
+
+
+# node class -> handler(node, expansion) returning a copy of node from the
+# callee's body with the callee's locals replaced by the caller's
+Copiers = DispatchTable()
+
+
+def copy(node: Node, expansion: Expansion) -> Node:
+    return Copiers[type(node)](node, expansion)
+
+
+# literals are never changed in place, break and continue hold nothing
+@Copiers.register(Literal, Break, Continue)
+def copy_shared(node: Node, expansion: Expansion) -> Node:
+    return node
+
+
+@Copiers.register(Name)
+def copy_name(node: Name, expansion: Expansion) -> Name:
+    return name(expansion.symbols.get(node.symbol, node.symbol))
+
+
+@Copiers.register(Grouping)
+def copy_grouping(node: Grouping, expansion: Expansion) -> Grouping:
+    return Grouping(copy(node.expression, expansion))
+
+
+@Copiers.register(UnaryOp)
+def copy_unary_op(node: UnaryOp, expansion: Expansion) -> UnaryOp:
+    result = UnaryOp(node.op, copy(node.expression, expansion))
+    # unset on the initializers of declarations with a type
+    token_type = getattr(node, 'token_type', None)
+    if token_type is not None:
+        result.token_type = token_type
+    return result
+
+
+@Copiers.register(BinaryOp, LogicalExpression)
+def copy_binary_op(node: Union[BinaryOp, LogicalExpression], expansion: Expansion) -> Expression:
+    return type(node)(copy(node.left_expression, expansion), node.op, copy(node.right_expression, expansion))
+
+
+@Copiers.register(VarDeclaration, ConstDeclaration)
+def copy_declaration(node: Union[VarDeclaration, ConstDeclaration], expansion: Expansion) -> Statement:
+    expression = copy(node.expression, expansion) if node.expression is not None else None
+    result = type(node)(node.name, expression, node.type_token)
+    expansion.symbols[node.symbol] = expansion.declare(expansion.rename(node.name.lexeme), result)
+    return result
+
+
+@Copiers.register(Assignment)
+def copy_assignment(node: Assignment, expansion: Expansion) -> Assignment:
+    return assign(expansion.symbols.get(node.symbol, node.symbol), copy(node.expression, expansion))
+
+
+@Copiers.register(PrintStatement)
+def copy_print_statement(node: PrintStatement, expansion: Expansion) -> PrintStatement:
+    return PrintStatement(copy(node.expression, expansion))
+
+
+@Copiers.register(IfStatement)
+def copy_if_statement(node: IfStatement, expansion: Expansion) -> IfStatement:
+    else_branch = copy(node.else_branch, expansion) if node.else_branch else None
+    return IfStatement(copy(node.condition, expansion), copy(node.then_branch, expansion), else_branch)
+
+
+@Copiers.register(WhileStatement)
+def copy_while_statement(node: WhileStatement, expansion: Expansion) -> WhileStatement:
+    condition = copy(node.condition, expansion)
+    expansion.loops += 1
+    body = copy(node.body, expansion)
+    expansion.loops -= 1
+    return WhileStatement(condition, body)
+
+
+@Copiers.register(Block)
+def copy_block(node: Block, expansion: Expansion) -> Block:
+    return Block(copy_statements(node.statements, expansion))
+
+
+# A return stores its value and leaves the loops of the callee, the
+# statements after one that may have returned only run if it did not.
+def copy_statements(statements: List[Statement], expansion: Expansion) -> List[Statement]:
+    result = []
+    for i, stmt in enumerate(statements):
+        if isinstance(stmt, Return):
+            result.append(assign(expansion.result, copy(stmt.expression, expansion)))
+            if expansion.done is not None:
+                result.append(assign(expansion.done, literal(True)))
+            if expansion.loops:
+                result.append(Break(Token(TokenType.BREAK, 'break')))
+            break
+
+        result.append(copy(stmt, expansion))
+        if expansion.done is None or not returns(stmt):
+            continue
+        # a return in a loop of the callee breaks out of it, an inner loop
+        # has to pass that on to the one it is in
+        if expansion.loops:
+            if isinstance(stmt, WhileStatement):
+                result.append(IfStatement(name(expansion.done), Block([Break(Token(TokenType.BREAK, 'break'))])))
+        else:
+            rest = copy_statements(statements[i + 1:], expansion)
+            if rest:
+                not_done = LogicalExpression(name(expansion.done), Token(TokenType.EQUAL_EQUAL, '=='), literal(False))
+                result.append(IfStatement(not_done, Block(rest)))
+            break
+    return result
+
+
+# Statements computing the call of callee with the already inlined arguments
+# into a fresh local, and the Name of that local
+def expand(callee: FunctionDeclaration, arguments: List[Expression], context: InlineContext):
+    expansion = Expansion(context, callee)
+    context.inlined += 1
+
+    return_type = callee.return_type.token_type
+    result = VarDeclaration(Token(TokenType.IDENTIFIER, ''), literal(Zeros[return_type]), TypeTokens[return_type])
+    expansion.result = expansion.declare(expansion.prefix, result)
+    statements = [result]
+    if returns_early(callee.body):
+        done = VarDeclaration(Token(TokenType.IDENTIFIER, ''), literal(False), TypeTokens[TokenType.TYPENAME_BOOL])
+        expansion.done = expansion.declare(expansion.rename(''), done)
+        statements.append(done)
+
+    # parameters are locals the callee may assign
+    body = []
+    for param, arg in zip(callee.params, arguments):
+        declaration = VarDeclaration(param.name.token, arg, param.type_token)
+        expansion.symbols[param.symbol] = expansion.declare(expansion.rename(param.name.token.lexeme), declaration)
+        body.append(declaration)
+    body.extend(copy_statements(callee.body.statements, expansion))
+    statements.append(Block(body))
+    return statements, name(expansion.result)
+
+
+# node class -> handler(node, context, statements) returning the node taking
+# the place of node once the calls below it are inlined. The statements that
+# have to run before it are appended to statements in evaluation order,
+# statements are changed in place.
+Inliners = DispatchTable(default=lambda node, context, statements: node)
+
+
+def inline(node: Node, context: InlineContext, statements: List[Statement]) -> Node:
+    return Inliners[type(node)](node, context, statements)
+
+
+# Only hoists the calls of an expression out of it when all of them get
+# inlined, a call left in place could otherwise run after one it preceded.
+def inline_expression(expression: Expression, context: InlineContext, statements: List[Statement]) -> Expression:
+    calls = set()
+    callees(expression, calls)
+    if not calls or not calls <= context.candidates.keys():
+        return expression
+    return inline(expression, context, statements)
+
+
+def inline_statements(statements: List[Statement], context: InlineContext) -> List[Statement]:
+    result = []
+    for stmt in statements:
+        if isinstance(stmt, Expression):
+            stmt = inline_expression(stmt, context, result)
+            # the value of a call used as a statement is dropped
+            if isinstance(stmt, Name):
+                continue
+        else:
+            stmt = inline(stmt, context, result)
+        result.append(stmt)
+    return result
+
+
+@Inliners.register(Call)
+def inline_call(node: Call, context: InlineContext, statements: List[Statement]) -> Expression:
+    arguments = [inline(arg, context, statements) for arg in node.arguments]
+    expanded, result = expand(context.candidates[node.callee.token.lexeme], arguments, context)
+    statements.extend(expanded)
+    return result
+
+
+@Inliners.register(BinaryOp, LogicalExpression)
+def inline_binary_op(node: Union[BinaryOp, LogicalExpression], context: InlineContext,
+                     statements: List[Statement]) -> Expression:
+    node.left_expression = inline(node.left_expression, context, statements)
+    node.right_expression = inline(node.right_expression, context, statements)
+    return node
+
+
+@Inliners.register(UnaryOp, Grouping)
+def inline_unary_op(node: Union[UnaryOp, Grouping], context: InlineContext, statements: List[Statement]) -> Expression:
+    node.expression = inline(node.expression, context, statements)
+    return node
+
+
+@Inliners.register(Block)
+def inline_block(node: Block, context: InlineContext, statements: List[Statement]) -> Block:
+    node.statements = inline_statements(node.statements, context)
+    return node
+
+
+@Inliners.register(VarDeclaration, ConstDeclaration, Assignment, PrintStatement, Return)
+def inline_expression_statement(node: Union[VarDeclaration, ConstDeclaration, Assignment, PrintStatement, Return],
+                                context: InlineContext, statements: List[Statement]) -> Statement:
+    if node.expression is not None:
+        node.expression = inline_expression(node.expression, context, statements)
+    return node
+
+
+@Inliners.register(IfStatement)
+def inline_if_statement(node: IfStatement, context: InlineContext, statements: List[Statement]) -> Statement:
+    node.condition = inline_expression(node.condition, context, statements)
+    inline(node.then_branch, context, statements)
+    if isinstance(node.else_branch, IfStatement):
+        # the condition of an else if runs only when the first one is false,
+        # what it hoists goes in the else arm
+        hoisted = []
+        else_branch = inline(node.else_branch, context, hoisted)
+        node.else_branch = Block(hoisted + [else_branch]) if hoisted else else_branch
+    elif node.else_branch:
+        inline(node.else_branch, context, statements)
+    return node
+
+
+# the condition runs before every iteration, calls in it stay
+@Inliners.register(WhileStatement)
+def inline_while_statement(node: WhileStatement, context: InlineContext, statements: List[Statement]) -> Statement:
+    inline(node.body, context, statements)
+    return node
+
+
+# Replace the calls of small leaf functions inside function bodies by a copy
+# of the callee's body, with its parameters and locals renamed into fresh
+# slots of the caller and its returns turned into an assignment of the
+# result. Runs on a type checked block and keeps it annotated, so the
+# interpreter, the optimizer and the Compiler all take the result. Calls at
+# the top level stay, their globals have no function frame to grow. The
+# inlined functions stay too, they may still be called from there.
+def inline_functions(block: Block, budget: int=DEFAULT_INLINE_BUDGET) -> InlineContext:
+    context = InlineContext(budget)
+    for stmt in block.statements:
+        if isinstance(stmt, FunctionDeclaration) and inlinable(stmt, budget):
+            context.candidates[stmt.name.lexeme] = stmt
+
+    for stmt in block.statements:
+        if isinstance(stmt, FunctionDeclaration) and stmt.name.lexeme not in context.candidates:
+            context.function = stmt
+            inline(stmt.body, context, [])
+            context.function = None
+    return context
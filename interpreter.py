@@ -1,122 +1,297 @@
-from typing import Union, List
+from typing import Dict, Union, List
 from Token import *
 from Model import *
+from dispatch import DispatchTable
+from Resolver import *
+from purity import MemoCache, pure_functions
 
+# Variables live in the slots the Resolver assigned to their symbols, globals
+# in the frame of the top-level block and locals in the frame of the call,
+# parameters first
 class InterpreterContext:
-    def __init__(self, enclosing: "InterpreterContext"=None):
-        self.env = {}
-        self.enclosing_context = None
+    def __init__(self, frame_size: int=0, enclosing: "InterpreterContext"=None):
+        self.slots = [None] * frame_size
+        self.enclosing_context = enclosing
+        # value of the return that left the call
+        self.value = None
+        # declaration of the function being run, None for the top level
+        self.function = None
+        if enclosing is None:
+            self.globals = self.slots
+            self.functions = {}
+            # frame size -> frames of finished calls, taken by the next calls
+            self.frames: Dict[int, List["InterpreterContext"]] = {}
+            # results of the calls of the pure functions, when memoizing
+            self.memo = None
+            self.pure = set()
+            # limits the loop iterations and calls, when evaluating at
+            # compile time
+            self.budget = None
+            # counts calls and loop iterations and runs the hot functions
+            # natively, when tiering
+            self.tiers = None
+        else:
+            self.globals = enclosing.globals
+            self.functions = enclosing.functions
+            self.frames = enclosing.frames
+            self.memo = enclosing.memo
+            self.pure = enclosing.pure
+            self.budget = enclosing.budget
+            self.tiers = enclosing.tiers
 
-    def define(self, name:str, value: Literal):
-        self.env[name] = value
+    def define(self, symbol: Symbol, value: Literal):
+        (self.slots if symbol.depth else self.globals)[symbol.index] = value
 
-    def lookup(self, name: str) -> Literal:
-        if name in self.env:
-            return self.env[name]
+    def lookup(self, symbol: Symbol) -> Literal:
+        return (self.slots if symbol.depth else self.globals)[symbol.index]
+
+
+# What return, break and continue evaluate to. Blocks and ifs hand it up to
+# the loop or call it leaves, a return leaves its value in the frame.
+class Jump:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+BREAK = Jump('break')
+CONTINUE = Jump('continue')
+RETURN = Jump('return')
 
-        return None
 
+class BudgetExceeded(Exception):
+    pass
 
-def interpret(node: Node):
-    context = InterpreterContext()
+
+# Loop iterations and calls an evaluation may still take
+class StepBudget:
+    def __init__(self, steps: int):
+        self.steps = steps
+
+    def spend(self):
+        self.steps -= 1
+        if self.steps < 0:
+            raise BudgetExceeded()
+
+
+# memo: cache for the results of calls of pure functions, which then only run
+# once for the same arguments
+# tiers: a tiered.TieredRuntime calls go through
+def interpret(node: Node, memo: MemoCache=None, tiers=None):
+    block = node if isinstance(node, Block) else Block([node])
+    if not is_resolved(block):
+        resolve(block)
+    context = InterpreterContext(block.frame_size)
+    if memo is not None:
+        context.memo = memo
+        context.pure = pure_functions(block)
+    context.tiers = tiers
     return interpret_node(node, context)
 
 
+# node class -> handler(node, context), nodes without one evaluate to None
+Interpreters = DispatchTable(default=lambda node, context: None)
+
 
 def interpret_node(node: Node, context: InterpreterContext):
-    if isinstance(node, (Literal)):
-        return node.value
-    elif isinstance(node, PrintStatement):
-        value = interpret_node(node.expression, context)
-        print(value)
-        return None
-    elif isinstance(node, BinaryOp):
-        lhs = interpret_node(node.left_expression, context)
-        rhs = interpret_node(node.right_expression, context)
-        if node.op.token_type == TokenType.PLUS:
-            return lhs + rhs
-        elif node.op.token_type ==TokenType.MINUS:
-            return lhs - rhs
-        elif node.op.token_type ==TokenType.STAR:
-            return lhs * rhs
-        elif node.op.token_type ==TokenType.SLASH:
-            return lhs / rhs
-        else:
-            raise RuntimeError(f"failed to interpret {node!r}")
-    elif isinstance(node, UnaryOp):
-        if node.op.token_type ==TokenType.MINUS:
-            expr = interpret_node(node.expression, context)
-            assert(isinstance(node, (int, float)))
-            return -expr
-        elif node.op.token_type ==TokenType.BANG:
-            expr = interpret_node(node.expression, context)
-            assert(isinstance(node, bool))
-            return not expr
-        else:
-            raise RuntimeError(f"failed to interpret {node!r}")
-
-    elif isinstance(node, LogicalExpression):
-        lhs = interpret_node(node.left_expression, context)
-        rhs = interpret_node(node.right_expression, context)
-        if node.op.token_type == TokenType.EQUAL_EQUAL:
-            return lhs == rhs
-        elif node.op.token_type ==TokenType.LESS:
-            return lhs < rhs
-        elif node.op.token_type ==TokenType.LESS_EQUAL:
-            return lhs <= rhs
-        elif node.op.token_type ==TokenType.GREATER:
-            return lhs > rhs
-        elif node.op.token_type ==TokenType.GREATER_EQUAL:
-            return lhs >= rhs
-        elif node.op.token_type ==TokenType.BANG_EQUAL:
-            return lhs != rhs
+    return Interpreters[type(node)](node, context)
 
-        else:
-            raise RuntimeError(f"failed to interpret {node!r}")
 
-    # elif isinstance(node, IfStatement):
+@Interpreters.register(Literal)
+def interpret_literal(node: Literal, context: InterpreterContext):
+    return node.value
 
-    elif isinstance(node, ConstDeclaration):
-        name = node.name.lexeme
-        value = interpret_node(node.expression, context)
-        context.define(name, value)
-        return None
 
-    elif isinstance(node, Name):
-        name = node.token.lexeme
-        return context.lookup(name)
+@Interpreters.register(Grouping)
+def interpret_grouping(node: Grouping, context: InterpreterContext):
+    return interpret_node(node.expression, context)
 
-    elif isinstance(node, VarDeclaration):
-        name = node.name.lexeme
-        value = interpret_node(node.expression, context)
-        context.define(name, value)
-        return None
 
-    elif isinstance(node, IfStatement):
-        condition = interpret_node(node.condition, context)
-        if condition:
-            return interpret_node(node.then_branch, context)
-        else:
-            if node.else_branch:
-                return interpret_node(node.else_branch, context)
+@Interpreters.register(PrintStatement)
+def interpret_print_statement(node: PrintStatement, context: InterpreterContext):
+    value = interpret_node(node.expression, context)
+    print(value)
+    return None
 
-    elif isinstance(node, Block):
-        for stmt in node.statements:
-            interpret_node(stmt, context)
-        return None
 
-    elif isinstance(node, Assignment):
-        name = node.name.lexeme
-        if name not in context.env:
-            raise RuntimeError(f"Tried to assign undeclared variable {name}")
+@Interpreters.register(BinaryOp)
+def interpret_binary_op(node: BinaryOp, context: InterpreterContext):
+    lhs = interpret_node(node.left_expression, context)
+    rhs = interpret_node(node.right_expression, context)
+    if node.op.token_type == TokenType.PLUS:
+        return lhs + rhs
+    elif node.op.token_type ==TokenType.MINUS:
+        return lhs - rhs
+    elif node.op.token_type ==TokenType.STAR:
+        return lhs * rhs
+    elif node.op.token_type ==TokenType.SLASH:
+        return divide(lhs, rhs)
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
+
+
+@Interpreters.register(UnaryOp)
+def interpret_unary_op(node: UnaryOp, context: InterpreterContext):
+    if node.op.token_type ==TokenType.MINUS:
+        expr = interpret_node(node.expression, context)
+        assert(isinstance(expr, (int, float)))
+        return -expr
+    elif node.op.token_type ==TokenType.BANG:
+        expr = interpret_node(node.expression, context)
+        assert(isinstance(expr, bool))
+        return not expr
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
+
+
+@Interpreters.register(LogicalExpression)
+def interpret_logical_expression(node: LogicalExpression, context: InterpreterContext):
+    lhs = interpret_node(node.left_expression, context)
+    rhs = interpret_node(node.right_expression, context)
+    if node.op.token_type == TokenType.EQUAL_EQUAL:
+        return lhs == rhs
+    elif node.op.token_type ==TokenType.LESS:
+        return lhs < rhs
+    elif node.op.token_type ==TokenType.LESS_EQUAL:
+        return lhs <= rhs
+    elif node.op.token_type ==TokenType.GREATER:
+        return lhs > rhs
+    elif node.op.token_type ==TokenType.GREATER_EQUAL:
+        return lhs >= rhs
+    elif node.op.token_type ==TokenType.BANG_EQUAL:
+        return lhs != rhs
+
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
 
-        value = interpret_node(node.expression, context)
-        context.define(name, value)
-        return None
 
-    elif isinstance(node, WhileStatement):
-        while interpret_node(node.condition, context):
-            interpret_node(node.body, context)
+@Interpreters.register(ConstDeclaration)
+def interpret_const_declaration(node: ConstDeclaration, context: InterpreterContext):
+    value = interpret_node(node.expression, context)
+    context.define(node.symbol, value)
+    return None
 
+
+@Interpreters.register(Name)
+def interpret_name(node: Name, context: InterpreterContext):
+    if node.symbol is None:
         return None
+    return context.lookup(node.symbol)
+
+
+@Interpreters.register(VarDeclaration)
+def interpret_var_declaration(node: VarDeclaration, context: InterpreterContext):
+    value = interpret_node(node.expression, context)
+    context.define(node.symbol, value)
+    return None
+
+
+@Interpreters.register(IfStatement)
+def interpret_if_statement(node: IfStatement, context: InterpreterContext):
+    condition = interpret_node(node.condition, context)
+    if condition:
+        return interpret_node(node.then_branch, context)
+    else:
+        if node.else_branch:
+            return interpret_node(node.else_branch, context)
+
+
+@Interpreters.register(Block)
+def interpret_block(node: Block, context: InterpreterContext):
+    for stmt in node.statements:
+        signal = interpret_node(stmt, context)
+        # expression statements evaluate to their value
+        if signal is not None and signal.__class__ is Jump:
+            return signal
+    return None
+
+
+@Interpreters.register(Assignment)
+def interpret_assignment(node: Assignment, context: InterpreterContext):
+    if node.symbol is None:
+        raise RuntimeError(f"Tried to assign undeclared variable {node.name.lexeme}")
+
+    value = interpret_node(node.expression, context)
+    context.define(node.symbol, value)
+    return None
+
+
+@Interpreters.register(WhileStatement)
+def interpret_while_statement(node: WhileStatement, context: InterpreterContext):
+    budget = context.budget
+    iterations = 0
+    signal = None
+    while interpret_node(node.condition, context):
+        iterations += 1
+        if budget is not None:
+            budget.spend()
+        signal = interpret_node(node.body, context)
+        if signal is BREAK or signal is RETURN:
+            break
+
+    if context.tiers is not None and context.function is not None:
+        context.tiers.back_edges(context.function, iterations)
+    return signal if signal is RETURN else None
+
+
+@Interpreters.register(Break)
+def interpret_break(node: Break, context: InterpreterContext):
+    return BREAK
+
+
+@Interpreters.register(Continue)
+def interpret_continue(node: Continue, context: InterpreterContext):
+    return CONTINUE
+
+
+@Interpreters.register(FunctionDeclaration)
+def interpret_function_declaration(node: FunctionDeclaration, context: InterpreterContext):
+    context.functions[node.name.lexeme] = node
+    return None
+
+
+@Interpreters.register(Call)
+def interpret_call(node: Call, context: InterpreterContext):
+    func = context.functions.get(node.callee.token.lexeme)
+    if func is None:
+        raise RuntimeError(f"Tried calling undefined function '{node.callee.token.lexeme}'")
+
+    args = [interpret_node(arg, context) for arg in node.arguments]
+    if context.tiers is not None:
+        return context.tiers.call(func, args, context)
+    if context.memo is None or func.name.lexeme not in context.pure:
+        return call_function(func, args, context)
+
+    # -0.0 == 0.0 and they hash alike, floats are keyed by their repr
+    key = (func.name.lexeme, *[(float, repr(arg)) if type(arg) is float else arg for arg in args])
+    found, value = context.memo.lookup(key)
+    if not found:
+        value = call_function(func, args, context)
+        context.memo.store(key, value)
+    return value
+
+
+# The callee runs in a frame from the pool for its size, the arguments go in
+# its first slots. The other slots hold what the last call left in them, each
+# is declared before it is read.
+def call_function(func: FunctionDeclaration, args: List, context: InterpreterContext):
+    if context.budget is not None:
+        context.budget.spend()
+    size = func.frame_size
+    pool = context.frames.get(size)
+    if pool is None:
+        pool = context.frames[size] = []
+    frame = pool.pop() if pool else InterpreterContext(size, context)
+    frame.slots[:len(args)] = args
+    frame.function = func
+    value = frame.value if interpret_node(func.body, frame) is RETURN else None
+    pool.append(frame)
+    return value
+
 
+@Interpreters.register(Return)
+def interpret_return(node: Return, context: InterpreterContext):
+    context.value = interpret_node(node.expression, context)
+    return RETURN
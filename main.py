@@ -5,7 +5,20 @@ from Parser import *
 from TypeChecker import *
 from format import format_wabbit, FormatContext
 from interpreter import *
+from parallel import parse_parallel, check_parallel
+from arena import NodeArena
+from cache import ParseCache, DEFAULT_CACHE_SIZE
+import os
 from Compiler import *
+from optimize import fold_constants, eliminate_dead_code
+from callgraph import eliminate_dead_functions, merge_identical_functions
+from inline import inline_functions, DEFAULT_INLINE_BUDGET
+from purity import MemoCache, DEFAULT_MEMO_SIZE
+from closures import execute
+from bytecode import BytecodeCache, compile_bytecode, run_bytecode
+from transpile import CodeCache, compile_python, run_python
+from tiered import TieredRuntime, DEFAULT_TIER_THRESHOLD
+import sys
 import argparse
 
 
@@ -14,6 +27,16 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument('-f', '--filename', required=False)
 parser.add_argument('--print_tokens', action='store_true')
+parser.add_argument('--scanner', choices=sorted(Scanners), default='default')
+parser.add_argument('--parser', choices=sorted(Parsers), default='default')
+parser.add_argument('--stream', action='store_true')
+parser.add_argument('--jobs', type=int, default=1)
+parser.add_argument('--compact', action='store_true')
+parser.add_argument('--lazy', action='store_true')
+parser.add_argument('--check_function', action='append')
+parser.add_argument('--arena', action='store_true')
+parser.add_argument('--cache', action='store_true')
+parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE)
 parser.add_argument('--print_statements', action='store_true')
 
 parser.add_argument('--log_level',
@@ -22,6 +45,26 @@ parser.add_argument('--test_format', action='store_true')
 parser.add_argument('--test_interpreter', action='store_true')
 parser.add_argument('--run_type_checker', action='store_true')
 parser.add_argument('--compile', action='store_true')
+parser.add_argument('--interpret', action='store_true')
+# tree walks the AST, closures translates it into Python closures first, vm
+# lowers it to register bytecode, cached in a .wbc file next to the source,
+# python transpiles it to a Python code object, cached in a .wbpy file,
+# tiered walks the tree and compiles the functions that get hot through the
+# JIT once they ran tier_threshold calls and loop iterations
+parser.add_argument('--engine', choices=['tree', 'closures', 'vm', 'python', 'tiered'], default='tree')
+parser.add_argument('--tier_threshold', type=int, default=DEFAULT_TIER_THRESHOLD)
+# cache the results of calls of pure functions while interpreting, the hit
+# and miss counts go to stderr
+parser.add_argument('--memoize', action='store_true')
+parser.add_argument('--memo_size', type=int, default=DEFAULT_MEMO_SIZE)
+parser.add_argument('--optimize', action='store_true')
+# substitute the bodies of small leaf functions at their calls, budget is the
+# largest body in nodes
+parser.add_argument('--inline', action='store_true')
+parser.add_argument('--inline_budget', type=int, default=DEFAULT_INLINE_BUDGET)
+# functions called from outside (e.g. mandel from main.c), when given the
+# functions none of them reach are dropped and identical ones merged
+parser.add_argument('--export', action='append')
 
 
 
@@ -180,33 +223,141 @@ def test_interpreter():
 
 
 
+def parse_file(fid) -> Block:
+    if args.compact:
+        scanner = CompactScanner.from_file(args.filename)
+        return CompactParser(scanner.scan_tokens(), args.lazy).parse()
+    elif args.stream:
+        scanner = StreamScanner(fid)
+        return StreamingParser(scanner.stream_tokens()).parse()
+
+    source = fid.read()
+    if args.jobs > 1:
+        return parse_parallel(source, args.jobs, Parsers[args.parser])
+
+    scanner = Scanners[args.scanner](source)
+    tokens = scanner.scan_tokens()
+    if args.print_tokens:
+        scanner.print_tokens()
+    parser = Parsers[args.parser](tokens, args.lazy)
+    return parser.parse()
+
+
+# Parsed and type checked program, loaded from the parse cache when the source
+# is unchanged, otherwise parsed, checked and stored for the next run
+def cached_block(fid) -> Block:
+    with open(args.filename, 'rb') as binary:
+        source = binary.read()
+    cache = ParseCache(os.path.dirname(os.path.abspath(args.filename)), args.cache_size)
+    arena = cache.load(source)
+    if arena is None:
+        block = parse_file(fid)
+        run_type_checker(block)
+        arena = NodeArena.from_tree(block)
+        cache.store(source, arena)
+    return arena.block()
+
+
+# engine -> (cache, compile(block), run(compiled)) of the engines whose
+# compiled programs are cached next to the source
+CompiledEngines = {
+    'vm': (BytecodeCache, compile_bytecode, run_bytecode),
+    'python': (CodeCache, compile_python, run_python),
+}
+
+
+# Cache of the compiled source, keyed on the passes that change the program
+# before it is compiled
+def compiled_cache() -> BytecodeCache:
+    options = f'optimize={args.optimize},inline={args.inline and args.inline_budget},' \
+              f'export={sorted(args.export or [])},checked={args.run_type_checker}'
+    return CompiledEngines[args.engine][0](args.filename, options)
+
+
 args = parser.parse_args()
 def main():
+    # these rewrite the tree, arena views are read only
+    if (args.optimize or args.export or args.inline) and (args.arena or args.cache):
+        parser.error("--optimize, --export and --inline do not work with --arena or --cache")
+    if args.memoize and args.engine != 'tree':
+        parser.error("--memoize needs --engine tree")
     if args.test_format:
         test_format()
     elif args.test_interpreter:
         test_interpreter()
     else:
+        # a cached program needs neither parsing nor the passes
+        compiled_engine = args.interpret and args.engine in CompiledEngines
+        if compiled_engine and not args.compile:
+            with open(args.filename, 'rb') as binary:
+                source = binary.read()
+            program = compiled_cache().load(source)
+            if program is not None:
+                CompiledEngines[args.engine][2](program)
+                return
+
         with open(args.filename, 'r') as fid:
-            source = fid.read()
-            scanner = Scanner(source)
-            tokens = scanner.scan_tokens()
-            if args.print_tokens:
-                scanner.print_tokens()
-            parser = Parser(tokens)
-            block = parser.parse()
+            if args.cache:
+                block = cached_block(fid)
+            else:
+                block = parse_file(fid)
+                if args.arena:
+                    block = NodeArena.from_tree(block).block()
+            if args.export:
+                eliminate_dead_functions(block, args.export)
             if args.print_statements:
                 for s in block.statements:
                     print(s)
 
-            if args.run_type_checker or args.compile:
+            # a cached block was type checked before it was stored
+            tiered = args.interpret and args.engine == 'tiered'
+            if (args.run_type_checker or args.compile or args.optimize or args.inline or tiered) and not args.cache:
                 # TypeChecker mutates block and adds type token attribute to expression nodes
-                run_type_checker(block)
-
-                if args.compile:
-                    compiler = Compiler()
-                    compiler.compile(block)
-                    compiler.print()
+                # the compiler needs every function body checked and annotated
+                if args.jobs > 1 and not (args.compile or args.inline or tiered) and not args.check_function:
+                    check_parallel(block, args.jobs)
+                else:
+                    run_type_checker(block, None if args.compile or args.inline or tiered else args.check_function)
+
+            # before optimizing, so the inlined bodies get folded with the
+            # arguments they were given
+            if args.inline:
+                inline_functions(block, args.inline_budget)
+            if args.optimize:
+                fold_constants(block)
+                eliminate_dead_code(block)
+            # only worth it for code generation
+            if args.export and args.compile:
+                merge_identical_functions(block, args.export)
+
+            program = None
+            if compiled_engine:
+                _, compile_program, run_program = CompiledEngines[args.engine]
+                try:
+                    program = compile_program(block)
+                except SyntaxError as e:
+                    # CPython caps how deeply blocks nest, such programs run on closures
+                    print(f"{args.engine}: {e.msg}, running on closures", file=sys.stderr)
+            if program is not None:
+                if not args.compile:
+                    compiled_cache().store(source, program)
+                run_program(program)
+            elif args.interpret and (compiled_engine or args.engine == 'closures'):
+                execute(block)
+            elif tiered:
+                tiers = TieredRuntime(block, args.tier_threshold)
+                interpret(block, tiers=tiers)
+                print(f"tiers: {tiers}", file=sys.stderr)
+            elif args.interpret:
+                memo = MemoCache(args.memo_size) if args.memoize else None
+                interpret(block, memo)
+                if memo is not None:
+                    print(f"memo: {memo}", file=sys.stderr)
+
+            if args.compile:
+                compiler = Compiler()
+                compiler.compile(block)
+                compiler.print()
 
 
 
@@ -0,0 +1,475 @@
+from typing import Union, List, Set
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from callgraph import CallGraph
+from purity import MemoCache, closed_under_calls, pure_functions
+from interpreter import InterpreterContext, StepBudget, BudgetExceeded, call_function
+
+
+# loop iterations and calls a single call may take when evaluated while folding
+DEFAULT_EVAL_BUDGET = 100000
+
+
+class FoldContext:
+    def __init__(self):
+        # expressions replaced by their value
+        self.folded = 0
+        # names of constants replaced by their value
+        self.propagated = 0
+        # if and while statements with a constant condition resolved
+        self.branches = 0
+        # calls with literal arguments replaced by their result
+        self.evaluated = 0
+        # functions whose calls get evaluated, by name, with the results
+        # of the calls already evaluated
+        self.evaluable: Set[str] = set()
+        self.functions = {}
+        self.memo = None
+        self.budget = DEFAULT_EVAL_BUDGET
+
+    def __repr__(self):
+        return f"folded {self.folded}, propagated {self.propagated}, branches {self.branches}, " \
+               f"evaluated {self.evaluated}"
+
+
+# node class -> handler(node, context) returning the node that takes its place,
+# a Literal once an expression's value is known. Statements are changed in
+# place and returned.
+Folders = DispatchTable(default=lambda node, context: node)
+
+
+def fold(node: Node, context: FoldContext) -> Node:
+    return Folders[type(node)](node, context)
+
+
+# statements directly in block declare names only visible inside it
+def declares(block: Block) -> bool:
+    return any(isinstance(stmt, (VarDeclaration, ConstDeclaration, FunctionDeclaration))
+               for stmt in block.statements)
+
+
+# Statements that take the place of an if or while whose condition is a
+# literal, None when the condition is not known or when the taken branch
+# declares names and has to stay a block of its own
+def constant_branch(stmt: Statement) -> List[Statement]:
+    if isinstance(stmt, IfStatement) and isinstance(stmt.condition, Literal):
+        branch = stmt.then_branch if stmt.condition.value else stmt.else_branch
+        if branch is None:
+            return []
+        # an else if
+        if not isinstance(branch, Block):
+            return [branch]
+        if not declares(branch):
+            return branch.statements
+    elif isinstance(stmt, WhileStatement) and isinstance(stmt.condition, Literal) and not stmt.condition.value:
+        return []
+    return None
+
+
+def fold_statements(statements: List[Statement], context: FoldContext) -> List[Statement]:
+    result = []
+    for stmt in statements:
+        stmt = fold(stmt, context)
+        # an expression statement folded to its value, calls included, does
+        # nothing at run time
+        if isinstance(stmt, Literal):
+            continue
+        replacement = constant_branch(stmt)
+        if replacement is None:
+            result.append(stmt)
+        else:
+            context.branches += 1
+            result.extend(replacement)
+    return result
+
+
+@Folders.register(Block)
+def fold_block(node: Block, context: FoldContext) -> Block:
+    node.statements = fold_statements(node.statements, context)
+    return node
+
+
+@Folders.register(Name)
+def fold_name(node: Name, context: FoldContext) -> Expression:
+    symbol = node.symbol
+    if symbol is None or not symbol.is_const:
+        return node
+
+    # declarations come before their uses, so the initializer is folded
+    value = symbol.declaration.expression
+    if isinstance(value, Literal) and value.type_token.token_type == symbol.token_type:
+        context.propagated += 1
+        return value
+    return node
+
+
+@Folders.register(Grouping)
+def fold_grouping(node: Grouping, context: FoldContext) -> Expression:
+    node.expression = fold(node.expression, context)
+    if isinstance(node.expression, Literal):
+        context.folded += 1
+        return node.expression
+    return node
+
+
+@Folders.register(UnaryOp)
+def fold_unary_op(node: UnaryOp, context: FoldContext) -> Expression:
+    node.expression = expression = fold(node.expression, context)
+    if not isinstance(expression, Literal):
+        return node
+
+    context.folded += 1
+    if node.op.token_type == TokenType.MINUS:
+        return literal(-expression.value)
+    else:
+        return literal(not expression.value)
+
+
+@Folders.register(BinaryOp)
+def fold_binary_op(node: BinaryOp, context: FoldContext) -> Expression:
+    node.left_expression = lhs = fold(node.left_expression, context)
+    node.right_expression = rhs = fold(node.right_expression, context)
+    if not isinstance(lhs, Literal) or not isinstance(rhs, Literal):
+        return node
+    # chars and bools are left to run time
+    if type(lhs.value) not in (int, float) or type(rhs.value) not in (int, float):
+        return node
+
+    op = node.op.token_type
+    if op == TokenType.PLUS:
+        value = lhs + rhs
+    elif op == TokenType.MINUS:
+        value = lhs - rhs
+    elif op == TokenType.STAR:
+        value = lhs * rhs
+    elif op == TokenType.SLASH and rhs.value != 0:
+        value = lhs / rhs
+    else:
+        # division by zero is left to fail at run time
+        return node
+
+    context.folded += 1
+    return value
+
+
+@Folders.register(LogicalExpression)
+def fold_logical_expression(node: LogicalExpression, context: FoldContext) -> Expression:
+    node.left_expression = lhs = fold(node.left_expression, context)
+    node.right_expression = rhs = fold(node.right_expression, context)
+    if not isinstance(lhs, Literal) or not isinstance(rhs, Literal):
+        return node
+
+    op = node.op.token_type
+    if op == TokenType.EQUAL_EQUAL:
+        value = lhs == rhs
+    elif op == TokenType.BANG_EQUAL:
+        value = lhs != rhs
+    elif op == TokenType.LESS:
+        value = lhs < rhs
+    elif op == TokenType.LESS_EQUAL:
+        value = lhs <= rhs
+    elif op == TokenType.GREATER:
+        value = lhs > rhs
+    else:
+        value = lhs >= rhs
+
+    context.folded += 1
+    return literal(value)
+
+
+@Folders.register(VarDeclaration, ConstDeclaration, Assignment, PrintStatement, Return)
+def fold_expression_statement(node: Union[VarDeclaration, ConstDeclaration, Assignment, PrintStatement, Return],
+                              context: FoldContext) -> Statement:
+    if node.expression is not None:
+        node.expression = fold(node.expression, context)
+    return node
+
+
+# the callee is a function name, never a constant
+@Folders.register(Call)
+def fold_call(node: Call, context: FoldContext) -> Expression:
+    node.arguments = arguments = [fold(arg, context) for arg in node.arguments]
+    if node.callee.token.lexeme not in context.evaluable or \
+            not all(isinstance(arg, Literal) for arg in arguments):
+        return node
+
+    value = evaluate(context.functions[node.callee.token.lexeme], [arg.value for arg in arguments], context)
+    if value is None:
+        return node
+    context.evaluated += 1
+    return value
+
+
+# Result of calling function with args as a Literal, None when the call fails
+# or runs out of budget, it then fails or runs at run time. Ints that do not
+# fit the Compiler's i32 are left to run time too.
+def evaluate(function: FunctionDeclaration, args: List, context: FoldContext) -> Literal:
+    frame = InterpreterContext()
+    frame.functions = context.functions
+    frame.memo = context.memo
+    frame.pure = context.evaluable
+    frame.budget = StepBudget(context.budget)
+    try:
+        value = call_function(function, args, frame)
+    except Exception:
+        return None
+
+    if LiteralTypes.get(type(value)) != function.return_type.token_type:
+        return None
+    if type(value) is int and not -2**31 <= value < 2**31:
+        return None
+    return literal(value)
+
+
+# Pure functions that read no global either, constants included, once their
+# bodies are folded. Their result only depends on the arguments.
+def evaluable_functions(block: Block) -> Set[str]:
+    graph = CallGraph(block)
+    names = set()
+    for name in pure_functions(block):
+        body = graph.functions[name].body
+        context = DeadCodeContext()
+        usage(body, context, body)
+        if all(symbol is not None and symbol.depth for symbol in context.reads):
+            names.add(name)
+    return closed_under_calls(graph, names)
+
+
+@Folders.register(IfStatement)
+def fold_if_statement(node: IfStatement, context: FoldContext) -> Statement:
+    node.condition = fold(node.condition, context)
+    fold(node.then_branch, context)
+    if node.else_branch:
+        fold(node.else_branch, context)
+    return node
+
+
+@Folders.register(WhileStatement)
+def fold_while_statement(node: WhileStatement, context: FoldContext) -> Statement:
+    node.condition = fold(node.condition, context)
+    fold(node.body, context)
+    return node
+
+
+@Folders.register(FunctionDeclaration)
+def fold_function_declaration(node: FunctionDeclaration, context: FoldContext) -> Statement:
+    fold(node.body, context)
+    return node
+
+
+# Fold constant subexpressions, replace the names of constants whose value is
+# a literal by that literal and drop if/while statements whose condition is
+# known. Runs on a type checked block, the passes after it see the folded
+# tree. Declarations of the constants stay.
+# A second round evaluates the calls of pure functions with literal
+# arguments, each taking at most budget steps (0 turns that off), and folds
+# what their results make constant.
+def fold_constants(block: Block, budget: int=DEFAULT_EVAL_BUDGET) -> FoldContext:
+    context = FoldContext()
+    fold(block, context)
+    if budget > 0:
+        context.evaluable = evaluable_functions(block)
+        if context.evaluable:
+            context.functions = CallGraph(block).functions
+            context.memo = MemoCache()
+            context.budget = budget
+            fold(block, context)
+    return context
+
+
+class DeadCodeContext:
+    def __init__(self):
+        # statements after a return, break or continue
+        self.unreachable = 0
+        # declarations of and assignments to locals that are never read
+        self.unused = 0
+        # if and while statements with a constant condition resolved
+        self.branches = 0
+        # reads of every symbol, while eliminating unused locals
+        self.reads = {}
+        # symbol -> declaration and assignments, with the block holding them
+        self.writes = {}
+
+    def __repr__(self):
+        return f"unreachable {self.unreachable}, unused {self.unused}, branches {self.branches}"
+
+
+# control never gets past a statement that returns or leaves the loop, or an
+# if whose branches all do
+def terminates(stmt: Statement) -> bool:
+    if isinstance(stmt, (Return, Break, Continue)):
+        return True
+    if isinstance(stmt, IfStatement):
+        # the else branch of an else if is the IfStatement itself
+        return stmt.else_branch is not None and terminates(stmt.then_branch) and terminates(stmt.else_branch)
+    if isinstance(stmt, Block):
+        return ends(stmt)
+    return False
+
+
+def ends(block: Block) -> bool:
+    return len(block.statements) > 0 and terminates(block.statements[-1])
+
+
+# Evaluating expression has no effect besides its value: no calls, which may
+# print, and no division that may fail
+def is_pure(expression: Expression) -> bool:
+    if isinstance(expression, (Literal, Name)):
+        return True
+    if isinstance(expression, (Grouping, UnaryOp)):
+        return is_pure(expression.expression)
+    if isinstance(expression, BinaryOp):
+        if expression.op.token_type == TokenType.SLASH and \
+                not (isinstance(expression.right_expression, Literal) and expression.right_expression.value != 0):
+            return False
+        return is_pure(expression.left_expression) and is_pure(expression.right_expression)
+    if isinstance(expression, LogicalExpression):
+        return is_pure(expression.left_expression) and is_pure(expression.right_expression)
+    return False
+
+
+# node class -> handler(node, context) dropping the unreachable statements and
+# the constant branches of the blocks below node
+Eliminators = DispatchTable(default=lambda node, context: None)
+
+
+def eliminate(node: Node, context: DeadCodeContext):
+    Eliminators[type(node)](node, context)
+
+
+@Eliminators.register(Block)
+def eliminate_block(node: Block, context: DeadCodeContext):
+    statements = []
+    for stmt in node.statements:
+        eliminate(stmt, context)
+        replacement = constant_branch(stmt)
+        if replacement is None:
+            statements.append(stmt)
+        else:
+            context.branches += 1
+            statements.extend(replacement)
+
+    for i, stmt in enumerate(statements):
+        if terminates(stmt):
+            context.unreachable += len(statements) - i - 1
+            del statements[i + 1:]
+            break
+    node.statements = statements
+
+
+@Eliminators.register(IfStatement)
+def eliminate_if_statement(node: IfStatement, context: DeadCodeContext):
+    eliminate(node.then_branch, context)
+    if node.else_branch:
+        eliminate(node.else_branch, context)
+
+
+@Eliminators.register(WhileStatement)
+def eliminate_while_statement(node: WhileStatement, context: DeadCodeContext):
+    eliminate(node.body, context)
+
+
+@Eliminators.register(FunctionDeclaration)
+def eliminate_function_declaration(node: FunctionDeclaration, context: DeadCodeContext):
+    eliminate(node.body, context)
+    # every dropped local may leave the ones its value was computed from
+    # unread, repeat until nothing changes
+    while eliminate_unused(node.body, context):
+        pass
+
+
+# node class -> handler(node, context, block) counting the reads of symbols
+# and noting the statements that write them, block is the one holding node
+Usages = DispatchTable(default=lambda node, context, block: None)
+
+
+def usage(node: Node, context: DeadCodeContext, block: Block):
+    Usages[type(node)](node, context, block)
+
+
+@Usages.register(Block)
+def usage_block(node: Block, context: DeadCodeContext, block: Block):
+    for stmt in node.statements:
+        usage(stmt, context, node)
+
+
+@Usages.register(Name)
+def usage_name(node: Name, context: DeadCodeContext, block: Block):
+    reads = context.reads
+    reads[node.symbol] = reads.get(node.symbol, 0) + 1
+
+
+@Usages.register(VarDeclaration, ConstDeclaration, Assignment)
+def usage_write(node: Union[VarDeclaration, ConstDeclaration, Assignment], context: DeadCodeContext, block: Block):
+    context.writes.setdefault(node.symbol, []).append((block, node))
+    if node.expression is not None:
+        usage(node.expression, context, block)
+
+
+@Usages.register(BinaryOp, LogicalExpression)
+def usage_binary_op(node: Union[BinaryOp, LogicalExpression], context: DeadCodeContext, block: Block):
+    usage(node.left_expression, context, block)
+    usage(node.right_expression, context, block)
+
+
+@Usages.register(UnaryOp, Grouping, PrintStatement, Return)
+def usage_expression(node: Union[UnaryOp, Grouping, PrintStatement, Return], context: DeadCodeContext, block: Block):
+    usage(node.expression, context, block)
+
+
+@Usages.register(Call)
+def usage_call(node: Call, context: DeadCodeContext, block: Block):
+    for arg in node.arguments:
+        usage(arg, context, block)
+
+
+@Usages.register(IfStatement)
+def usage_if_statement(node: IfStatement, context: DeadCodeContext, block: Block):
+    usage(node.condition, context, block)
+    usage(node.then_branch, context, block)
+    if node.else_branch:
+        usage(node.else_branch, context, block)
+
+
+@Usages.register(WhileStatement)
+def usage_while_statement(node: WhileStatement, context: DeadCodeContext, block: Block):
+    usage(node.condition, context, block)
+    usage(node.body, context, block)
+
+
+# Drop the declaration and the assignments of every local of the function
+# body that is never read, as long as all their values are pure. Returns
+# whether anything was dropped.
+def eliminate_unused(body: Block, context: DeadCodeContext) -> bool:
+    context.reads = {}
+    context.writes = {}
+    usage(body, context, body)
+
+    dead = {}
+    for symbol, writes in context.writes.items():
+        if symbol is None or symbol.depth == 0 or symbol in context.reads:
+            continue
+        if all(stmt.expression is None or is_pure(stmt.expression) for _, stmt in writes):
+            for block, stmt in writes:
+                dead.setdefault(block, set()).add(id(stmt))
+
+    # by identity, literals left as statements compare by value and are not
+    # hashable
+    for block, stmts in dead.items():
+        block.statements = [stmt for stmt in block.statements if id(stmt) not in stmts]
+        context.unused += len(stmts)
+    context.reads = {}
+    context.writes = {}
+    return len(dead) > 0
+
+
+# Remove the statements that can never run: the ones after a return, break or
+# continue and the untaken branch of a constant if or while, then the locals
+# of every function that are declared or assigned but never read. Runs on a
+# type checked block, after fold_constants it also drops the constants that
+# were propagated into all their uses.
+def eliminate_dead_code(block: Block) -> DeadCodeContext:
+    context = DeadCodeContext()
+    eliminate(block, context)
+    return context
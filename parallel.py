@@ -0,0 +1,188 @@
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import gc
+import multiprocessing
+import os
+from Token import *
+from Model import *
+from Scanner import *
+from Parser import *
+from TypeChecker import check_signatures, check_function_bodies
+from Resolver import ResolverContext, _resolve
+
+# Sources smaller than this are parsed serially, process start-up and
+# shipping the AST back would cost more than the parse itself
+PARALLEL_MIN_SOURCE_BYTES = 1 << 20
+# Programs with fewer functions are type checked serially
+PARALLEL_MIN_FUNCTIONS = 256
+
+
+# Brace-matching pass over a TokenBuffer. Returns the index of the first token
+# of every top-level statement. A statement ends with ';' at brace depth 0, or
+# with the '}' that gets back to depth 0 unless an 'else' follows it.
+def top_level_statements(tokens: TokenBuffer) -> List[int]:
+    types = tokens.types
+    left_brace = TokenType.LEFT_BRACE.value
+    right_brace = TokenType.RIGHT_BRACE.value
+    semicolon = TokenType.SEMICOLON.value
+    else_ = TokenType.ELSE.value
+    eof = TokenType.EOF.value
+
+    boundaries = [0] if types[0] != eof else []
+    depth = 0
+    for i, code in enumerate(types):
+        if code == left_brace:
+            depth += 1
+        elif code == right_brace:
+            depth -= 1
+            if depth == 0 and types[i + 1] != else_ and types[i + 1] != eof:
+                boundaries.append(i + 1)
+        elif code == semicolon and depth == 0 and types[i + 1] != eof:
+            boundaries.append(i + 1)
+
+    return boundaries
+
+
+# Runs in the worker: scan and parse one run of top-level statements whose
+# first token is on `line`
+def parse_segment(source: bytes, line: int, parser_class) -> List[Statement]:
+    with gc_paused():
+        scanner = RegexScanner(source.decode())
+        tokens = list(scanner.iter_tokens(0, line))
+        tokens.append(Token(TokenType.EOF, "", scanner.line))
+        return parser_class(tokens).parse().statements
+
+
+# The AST has no reference cycles, but building or unpickling millions of
+# nodes keeps triggering full collections that dominate the run time
+@contextmanager
+def gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# Splits the top-level statements into `count` runs of about the same size in
+# bytes. Returns (start, end, line) of each run.
+def split_segments(tokens: TokenBuffer, count: int) -> List[Tuple[int, int, int]]:
+    boundaries = top_level_statements(tokens)
+    end = len(tokens.source)
+    target = end / count
+    segments = []
+    first = None
+    for index in boundaries:
+        start = tokens.starts[index]
+        if first is None:
+            first = index
+        elif start - tokens.starts[first] >= target:
+            segments.append((tokens.starts[first], start, tokens.lines[first]))
+            first = index
+
+    if first is not None:
+        segments.append((tokens.starts[first], end, tokens.lines[first]))
+    return segments
+
+
+# Parse source with top-level statements spread over a process pool. The
+# Block is reassembled in source order, so the first error in the source is
+# the one raised, with the same line numbers a serial parse reports.
+def parse_parallel(source: str, workers: int=None, parser_class=PrattParser,
+                   min_source_bytes: int=PARALLEL_MIN_SOURCE_BYTES) -> Block:
+    workers = workers or os.cpu_count() or 1
+    encoded = source.encode()
+    if workers == 1 or len(encoded) < min_source_bytes:
+        return parser_class(RegexScanner(source).scan_tokens()).parse()
+
+    tokens = CompactScanner(encoded).scan_tokens()
+    segments = split_segments(tokens, workers * 4)
+    if len(segments) < 2:
+        return parser_class(RegexScanner(source).scan_tokens()).parse()
+
+    statements = []
+    with ProcessPoolExecutor(max_workers=workers) as executor, gc_paused():
+        futures = [executor.submit(parse_segment, encoded[start:end], line, parser_class)
+                   for start, end, line in segments]
+        for future in futures:
+            statements.extend(future.result())
+
+    return Block(statements)
+
+
+# Block being checked, inherited by the forked workers instead of pickled
+_check_block: Block = None
+
+
+def init_check_worker(block: Block):
+    global _check_block
+    _check_block = block
+
+
+# Runs in the worker: check the function bodies at `indices`, returns the
+# index and error of the first failure
+def check_chunk(indices: List[int]) -> Tuple[int, Exception]:
+    with gc_paused():
+        _, failed, error = check_function_bodies(_check_block, indices)
+        return failed, error
+
+
+# Resolve the function bodies at `indices` of block.statements like
+# check_function_bodies does, without checking them
+def resolve_function_bodies(block: Block, indices: List[int]):
+    resolver = ResolverContext()
+    statements = block.statements
+    position = 0
+    for index in indices:
+        for stmt in statements[position:index]:
+            if isinstance(stmt, (VarDeclaration, ConstDeclaration)):
+                resolver.names[stmt.name.lexeme] = stmt.symbol
+        position = index
+        _resolve(statements[index], resolver)
+
+
+# Type check a block in two phases: the top-level statements and function
+# signatures serially, then the function bodies, which only depend on those,
+# spread over a process pool. The error raised is the one a serial check
+# raises first. Workers are forked so that the block is never pickled, and
+# only report errors: the top-level statements are annotated, the function
+# bodies are only resolved again in this process so the interpreter finds
+# their slots (shipping annotated bodies back costs several times what
+# checking them does), run_type_checker annotates them for the later passes.
+# Without fork, or with few functions, the bodies are checked in process.
+def check_parallel(block: Block, workers: int=None, min_functions: int=PARALLEL_MIN_FUNCTIONS):
+    workers = workers or os.cpu_count() or 1
+    statements = block.statements
+    failed, error = check_signatures(block)
+    end = failed if failed is not None else len(statements)
+    indices = [i for i in range(end) if isinstance(statements[i], FunctionDeclaration)]
+
+    if workers == 1 or len(indices) < min_functions or 'fork' not in multiprocessing.get_all_start_methods():
+        _, body_failed, body_error = check_function_bodies(block, indices)
+    else:
+        count = workers * 4
+        chunks = [indices[len(indices) * k // count:len(indices) * (k + 1) // count] for k in range(count)]
+        body_error = None
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_check_worker,
+                                 initargs=(block,)) as executor:
+            futures = [executor.submit(check_chunk, chunk) for chunk in chunks if chunk]
+            # chunks are in source order, the first failing one holds the
+            # error a serial check stops at
+            for future in futures:
+                body_failed, body_error = future.result()
+                if body_error is not None:
+                    for future in futures:
+                        future.cancel()
+                    break
+        if body_error is None and error is None:
+            resolve_function_bodies(block, indices)
+
+    # functions before a failed top-level statement were all checked first
+    if body_error is not None:
+        raise body_error
+    if error is not None:
+        raise error
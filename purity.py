@@ -0,0 +1,124 @@
+from typing import Dict, Hashable, Set, Tuple, Union
+from collections import OrderedDict
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from callgraph import CallGraph
+
+
+DEFAULT_MEMO_SIZE = 4096
+
+
+# node class -> handler(node) returning whether running node does something
+# besides computing values in its own frame and calling functions: printing,
+# assigning a global or reading a global variable another call may change
+Effects = DispatchTable(default=lambda node: False)
+
+
+def has_effects(node: Node) -> bool:
+    return Effects[type(node)](node)
+
+
+@Effects.register(Block)
+def effects_block(node: Block) -> bool:
+    return any(has_effects(stmt) for stmt in node.statements)
+
+
+@Effects.register(PrintStatement)
+def effects_print_statement(node: PrintStatement) -> bool:
+    return True
+
+
+# unresolved names are not known to be locals
+@Effects.register(Name)
+def effects_name(node: Name) -> bool:
+    symbol = node.symbol
+    return symbol is None or (symbol.depth == 0 and not symbol.is_const)
+
+
+@Effects.register(Assignment)
+def effects_assignment(node: Assignment) -> bool:
+    return node.symbol is None or node.symbol.depth == 0 or has_effects(node.expression)
+
+
+@Effects.register(UnaryOp, Grouping, Return, VarDeclaration, ConstDeclaration)
+def effects_expression(node: Node) -> bool:
+    return node.expression is not None and has_effects(node.expression)
+
+
+@Effects.register(BinaryOp, LogicalExpression)
+def effects_binary_op(node: Union[BinaryOp, LogicalExpression]) -> bool:
+    return has_effects(node.left_expression) or has_effects(node.right_expression)
+
+
+@Effects.register(Call)
+def effects_call(node: Call) -> bool:
+    return any(has_effects(arg) for arg in node.arguments)
+
+
+@Effects.register(IfStatement)
+def effects_if_statement(node: IfStatement) -> bool:
+    return has_effects(node.condition) or has_effects(node.then_branch) or \
+        (node.else_branch is not None and has_effects(node.else_branch))
+
+
+@Effects.register(WhileStatement)
+def effects_while_statement(node: WhileStatement) -> bool:
+    return has_effects(node.condition) or has_effects(node.body)
+
+
+# Largest subset of names whose functions only call functions of the subset
+def closed_under_calls(graph: CallGraph, names: Set[str]) -> Set[str]:
+    names = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(names):
+            if not graph.calls(name) <= names:
+                names.discard(name)
+                changed = True
+    return names
+
+
+# Names of the functions whose result only depends on their arguments: no
+# effects of their own and only calls of pure functions. Starts from every
+# function without effects and drops the ones calling a dropped or unknown
+# function, so recursion between pure functions stays pure. Runs on a
+# resolved block.
+def pure_functions(block: Block) -> Set[str]:
+    graph = CallGraph(block)
+    return closed_under_calls(graph, {name for name, node in graph.functions.items() if not has_effects(node.body)})
+
+
+# Results of pure calls by (function name, arguments). Holds max_size entries
+# and evicts the least recently used one beyond that.
+class MemoCache:
+    def __init__(self, max_size: int=DEFAULT_MEMO_SIZE):
+        self.entries: Dict[Hashable, object] = OrderedDict()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # (whether key was cached, its value)
+    def lookup(self, key: Hashable) -> Tuple[bool, object]:
+        entries = self.entries
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return True, entries[key]
+        self.misses += 1
+        return False, None
+
+    def store(self, key: Hashable, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"hits {self.hits}, misses {self.misses}, evictions {self.evictions}, size {len(self)}"
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scanner import Scanner
+from Parser import Parser
+from TypeChecker import run_type_checker
+from interpreter import interpret
+from arena import NodeArena
+from cache import ParseCache, CACHE_DIRECTORY
+
+# A program stored in a NodeArena, in memory or serialized, reads back as the
+# tree it was built from and runs like it
+PROGRAMS = os.path.join(ROOT, 'tests', 'programs')
+NAMES = sorted(f for f in os.listdir(PROGRAMS) if f.endswith('.wb'))
+
+
+def parse(name: str):
+    with open(os.path.join(PROGRAMS, name)) as fid:
+        source = fid.read()
+    block = Parser(Scanner(source).scan_tokens()).parse()
+    run_type_checker(block)
+    return source, block
+
+
+def output(block) -> str:
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        interpret(block)
+    return stdout.getvalue()
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_arena_views(name):
+    _, block = parse(name)
+    arena = NodeArena.from_tree(block)
+    for view in (arena.block(), NodeArena.from_bytes(arena.to_bytes()).block()):
+        assert repr(view) == repr(block)
+        assert output(view) == output(parse(name)[1])
+
+
+# entries miss for another source, and the least recently used go once the
+# directory outgrows its size
+def test_parse_cache(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    stored = {}
+    for name in NAMES[:3]:
+        source, block = parse(name)
+        assert cache.load(source.encode()) is None
+        cache.store(source.encode(), NodeArena.from_tree(block))
+        stored[name] = source
+    for name, source in stored.items():
+        arena = cache.load(source.encode())
+        assert repr(arena.block()) == repr(parse(name)[1])
+        assert output(arena.block()) == output(parse(name)[1])
+    assert cache.load(b'print 1;') is None
+
+    sizes = [entry.stat().st_size for entry in os.scandir(tmp_path / CACHE_DIRECTORY)]
+    small = ParseCache(str(tmp_path), sum(sizes) - 1)
+    for i, source in enumerate(stored.values()):
+        os.utime(small.path(source.encode()), (i, i))
+    # the first one is used last
+    small.load(stored[NAMES[0]].encode())
+    small.evict()
+    assert small.load(stored[NAMES[0]].encode()) is not None
+    assert len(os.listdir(tmp_path / CACHE_DIRECTORY)) < len(sizes)
+
+
+# an unreadable entry is a miss and gets removed
+def test_parse_cache_corrupt(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    source, block = parse(NAMES[0])
+    cache.store(source.encode(), NodeArena.from_tree(block))
+    with open(cache.path(source.encode()), 'wb') as fid:
+        fid.write(b'not an arena')
+    assert cache.load(source.encode()) is None
+    assert not os.path.exists(cache.path(source.encode()))
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Model import *
+from Scanner import Scanner
+from Parser import Parser
+from TypeChecker import run_type_checker
+from interpreter import interpret
+from callgraph import eliminate_dead_functions, merge_identical_functions
+
+SOURCE = '''
+func sq(n int) int {
+    return n * n;
+}
+func square(x int) int {
+    return x * x;
+}
+func quad(n int) int {
+    return sq(sq(n));
+}
+func fourth(n int) int {
+    return square(square(n));
+}
+func helper() int {
+    return 1;
+}
+func dead() int {
+    return helper();
+}
+func exported(n int) int {
+    return n + 1;
+}
+func count(n int) int {
+    if n == 0 {
+        return 0;
+    }
+    return count(n - 1) + 1;
+}
+func tally(n int) int {
+    if n == 0 {
+        return 0;
+    }
+    return tally(n - 1) + 1;
+}
+print quad(2);
+print fourth(3);
+print count(4) + tally(5);
+'''
+
+
+def parse() -> Block:
+    return Parser(Scanner(SOURCE).scan_tokens()).parse()
+
+
+def functions(block: Block) -> list:
+    return [stmt.name.lexeme for stmt in block.statements if isinstance(stmt, FunctionDeclaration)]
+
+
+def output(block: Block) -> str:
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        interpret(block)
+    return stdout.getvalue()
+
+
+# the top-level code and the exported functions are the roots
+def test_eliminate_dead_functions():
+    block = parse()
+    assert eliminate_dead_functions(block, ['exported']) == 2
+    assert functions(block) == ['sq', 'square', 'quad', 'fourth', 'exported', 'count', 'tally']
+    assert output(block) == output(parse())
+
+
+# calls of square go to sq, though exported square stays, then fourth merges
+# into quad, and tally, whose recursion is itself under another name, into
+# count
+def test_merge_identical_functions():
+    block = parse()
+    run_type_checker(block)
+    assert merge_identical_functions(block, ['square']) == 2
+    assert functions(block) == ['sq', 'square', 'quad', 'helper', 'dead', 'exported', 'count']
+    assert output(block) == output(parse())
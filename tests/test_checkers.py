@@ -0,0 +1,97 @@
+import contextlib
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Model import *
+from Scanner import Scanner
+from Parser import Parser
+from TypeChecker import run_type_checker, IncrementalTypeChecker
+from Incremental import IncrementalFrontEnd
+from interpreter import interpret
+from parallel import check_parallel
+
+PROGRAMS = os.path.join(ROOT, 'tests', 'programs')
+NAMES = sorted(f for f in os.listdir(PROGRAMS) if f.endswith('.wb'))
+SOURCE = '''var g int = 1;
+func sq(n int) int {
+    return n * n;
+}
+func twice(n int) int {
+    return sq(n) + sq(n);
+}
+func other(x float) float {
+    return x * 2.0;
+}
+print twice(3);
+print other(1.5);
+'''
+
+
+def output(block: Block) -> str:
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        interpret(block)
+    return stdout.getvalue()
+
+
+# output of the source checked from scratch
+def checked_output(source: str) -> str:
+    block = Parser(Scanner(source).scan_tokens()).parse()
+    run_type_checker(block)
+    return output(block)
+
+
+# Only the edited functions and the ones whose globals or callees changed
+# are checked again, and the result runs like a program checked from scratch
+def test_incremental_type_checker():
+    front_end = IncrementalFrontEnd(SOURCE)
+    checker = IncrementalTypeChecker(front_end.block)
+
+    def edit(at: str, deleted: int, inserted: str) -> list:
+        front_end.edit(front_end.source.index(at), deleted, inserted)
+        return [node.name.lexeme for node in checker.recheck()]
+
+    assert [node.name.lexeme for node in checker.recheck()] == ['sq', 'twice', 'other']
+    assert checker.recheck() == []
+
+    assert edit('n * n', 5, 'n * n + g') == ['sq']
+    assert output(front_end.block) == checked_output(front_end.source)
+    # same type, the symbol is kept
+    assert edit('var g int = 1', 13, 'var g int = 2') == []
+    assert output(front_end.block) == checked_output(front_end.source)
+    # twice is unchanged but its callee is not
+    old = 'func sq(n int) int {\n    return n * n + g;\n}'
+    with pytest.raises(ValueError, match='on parameter 0 in function'):
+        edit(old, len(old), 'func sq(n float) float {\n    return n * n;\n}')
+
+
+def parse(source: str) -> Block:
+    return Parser(Scanner(source).scan_tokens()).parse()
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_check_parallel(name):
+    with open(os.path.join(PROGRAMS, name)) as fid:
+        source = fid.read()
+    block = parse(source)
+    check_parallel(block, 2, min_functions=0)
+    assert output(block) == checked_output(source)
+
+
+# with errors in several bodies and at the top level the one raised is the
+# one a serial check stops at
+@pytest.mark.parametrize('source', [
+    SOURCE + 'func bad(n int) int { return 1.5; }\nfunc worse() int { return sq(1.0); }\n',
+    SOURCE.replace('return x * 2.0;', 'return x * 2;') + 'func bad(n int) int { return 1.5; }\n',
+    'var h int = 1.5;\n' + SOURCE.replace('return n * n;', 'return n * 1.5;'),
+], ids=['bodies', 'first body', 'top level'])
+def test_check_parallel_errors(source):
+    with pytest.raises(ValueError) as serial:
+        run_type_checker(parse(source))
+    with pytest.raises(ValueError) as parallel:
+        check_parallel(parse(source), 2, min_functions=0)
+    assert str(parallel.value) == str(serial.value)
@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scanner import RegexScanner
+from Parser import Parser
+from bytecode import BytecodeCache, compile_bytecode, run_bytecode
+from transpile import CodeCache, compile_python, run_python
+
+SOURCE = b'''
+func fib(n int) int {
+    if n < 2 {
+        return n;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+var i int = 0;
+while i < 10 {
+    print fib(i);
+    i = i + 1;
+}
+'''
+
+# engine -> (cache, compile(block), run(compiled)) as in main
+CompiledEngines = {
+    'vm': (BytecodeCache, compile_bytecode, run_bytecode),
+    'python': (CodeCache, compile_python, run_python),
+}
+
+
+def run(filename, engine, *options, cwd=None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '-f', filename, '--interpret',
+                           '--engine', engine, *options], capture_output=True, text=True, cwd=cwd)
+
+
+# CPython refuses more than 20 nested blocks, the python engine falls back
+# to closures for such programs
+def test_deep_loops(tmp_path):
+    depth = 22
+    lines = [f'var i{k} int = 0;' for k in range(depth)]
+    for k in range(depth):
+        lines.append(f'while i{k} < 2 {{ i{k} = i{k} + 1;')
+    lines.append('print 1;' + '}' * depth)
+    filename = tmp_path / 'deep.wb'
+    filename.write_text('\n'.join(lines))
+    assert run(filename, 'python').stdout == run(filename, 'tree').stdout == '1\n' * 2
+
+
+# Native ints overflow and divide by zero without raising, calls that do
+# run again in the interpreter
+def test_tiered_ints(tmp_path):
+    pytest.importorskip('llvmlite')
+    # the Compiler loads wabbit/print_char.so
+    os.symlink(ROOT, tmp_path / 'wabbit')
+    filename = tmp_path / 'ints.wb'
+    filename.write_text('''
+        func fact(n int) int {
+            if n < 2 {
+                return 1;
+            }
+            return n * fact(n - 1);
+        }
+        func divide(a int, b int) int {
+            return a / b;
+        }
+        var i int = 0;
+        while i < 20 {
+            print fact(i + 12) + divide(-7, 2);
+            i = i + 1;
+        }
+        print fact(fact(3));
+    ''')
+    tiered = run(filename, 'tiered', '--tier_threshold', '5', cwd=tmp_path)
+    assert 'native divide, fact' in tiered.stderr
+    assert tiered.stdout == run(filename, 'tree', cwd=tmp_path).stdout
+
+    with open(filename, 'a') as source:
+        source.write('print divide(1, 0);')
+    tiered = run(filename, 'tiered', '--tier_threshold', '5', cwd=tmp_path)
+    assert 'ZeroDivisionError' in tiered.stderr
+
+
+# A stored program loads back for the same source and options only, and runs
+# like the program it was compiled from
+@pytest.mark.parametrize('engine', CompiledEngines)
+def test_cache_round_trip(tmp_path, engine):
+    cache_class, compile_program, run_program = CompiledEngines[engine]
+    filename = str(tmp_path / 'fib.wb')
+    cache = cache_class(filename, 'optimize=False')
+    assert cache.load(SOURCE) is None
+    program = compile_program(Parser(RegexScanner(SOURCE.decode()).scan_tokens()).parse())
+    cache.store(SOURCE, program)
+
+    outputs = []
+    for program in (program, cache.load(SOURCE)):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        outputs.append(output.getvalue())
+    assert outputs[0] == outputs[1] == '0\n1\n1\n2\n3\n5\n8\n13\n21\n34\n'
+    assert cache.load(SOURCE + b'print 1;') is None
+    assert cache_class(filename, 'optimize=True').load(SOURCE) is None
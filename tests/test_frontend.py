@@ -0,0 +1,154 @@
+import io
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Token import *
+from Model import *
+from Scanner import Scanner, RegexScanner, StreamScanner, CompactScanner
+from Parser import Parser, StreamingParser, CompactParser, PrattParser
+from Incremental import IncrementalFrontEnd
+from parallel import parse_parallel
+
+# Every scanner and parser variant reads a source like Scanner and Parser do
+PROGRAMS = os.path.join(ROOT, 'tests', 'programs')
+FILES = [os.path.join(ROOT, 'testfile.wb')] + \
+        sorted(os.path.join(PROGRAMS, f) for f in os.listdir(PROGRAMS) if f.endswith('.wb'))
+SNIPPETS = [
+    'print 1;\n\n0² + y1xé\n',
+    'var a = 12²3 + 4.5²;',
+    'x = 1.² ;',
+    'ifé = 1.5 + x1é;',
+    "print 'a'; print '\\n'; // comment\nprint 2.5e;",
+    'while x <= 1 && y != 2 || !z { x = -1; }',
+]
+
+
+def sources():
+    for filename in FILES:
+        with open(filename) as fid:
+            yield os.path.basename(filename), fid.read()
+    for i, snippet in enumerate(SNIPPETS):
+        yield f'snippet{i}', snippet
+
+
+SOURCES = dict(sources())
+# the sources that parse
+PARSED = {os.path.basename(filename): SOURCES[os.path.basename(filename)] for filename in FILES}
+
+
+def tokens(tokens) -> list:
+    return [(t.token_type, t.lexeme, t.line) for t in tokens]
+
+
+def tree(source: str) -> str:
+    return repr(Parser(Scanner(source).scan_tokens()).parse())
+
+
+@pytest.mark.parametrize('name', SOURCES)
+def test_regex_scanner(name):
+    source = SOURCES[name]
+    assert tokens(RegexScanner(source).scan_tokens()) == tokens(Scanner(source).scan_tokens())
+
+
+# chunks of a few characters split most lexemes
+@pytest.mark.parametrize('name', SOURCES)
+def test_stream_scanner(name):
+    source = SOURCES[name]
+    assert tokens(StreamScanner(io.StringIO(source), 3).scan_tokens()) == tokens(Scanner(source).scan_tokens())
+
+
+@pytest.mark.parametrize('name', PARSED)
+def test_streaming_parser(name):
+    source = PARSED[name]
+    block = StreamingParser(StreamScanner(io.StringIO(source), 5).stream_tokens()).parse()
+    assert repr(block) == tree(source)
+
+
+@pytest.mark.parametrize('name', SOURCES)
+def test_compact_scanner(name):
+    source = SOURCES[name]
+    buffer = CompactScanner(source.encode()).scan_tokens()
+    assert tokens(buffer[i] for i in range(len(buffer))) == tokens(Scanner(source).scan_tokens())
+
+
+# over the memory mapped file
+@pytest.mark.parametrize('filename', FILES, ids=os.path.basename)
+def test_compact_parser(filename):
+    block = CompactParser(CompactScanner.from_file(filename).scan_tokens()).parse()
+    assert repr(block) == tree(PARSED[os.path.basename(filename)])
+
+
+# (text the edit starts at, characters deleted, text inserted), applied in turn
+EDITS = [
+    ('return 1;', 8, '10'),
+    ('func find', 0, 'var added int = 2;\n\n'),
+    ('i = i + 1;', 10, 'i = i +\n 1;'),
+    ('var added', 20, ''),
+    ('find(limit int', 14, 'find(limit float'),
+    ('', 0, '// leading\n'),
+]
+
+
+# After every edit the front end holds the tree and the tokens, lines
+# included, that scanning and parsing the edited source give
+def test_incremental_edits():
+    with open(os.path.join(PROGRAMS, 'early_returns.wb')) as fid:
+        source = fid.read()
+    front_end = IncrementalFrontEnd(source)
+    for at, deleted, inserted in EDITS:
+        offset = source.index(at)
+        source = source[:offset] + inserted + source[offset + deleted:]
+        front_end.edit(offset, deleted, inserted)
+        assert front_end.source == source
+        assert repr(front_end.block) == tree(source)
+        scanned = [token for segment in front_end.segments for token in segment.tokens]
+        assert tokens(scanned) == tokens(Scanner(source).scan_tokens())[:-1]
+
+
+EXPRESSIONS = [
+    '1 + 2 * 3 - 4 / 5',
+    '(1 + 2) * -3',
+    'a < b == c >= d',
+    'a && b || c && !d',
+    'f(1, g(2 * x), (y)) - -z',
+    '1 - 2 - 3 + 4',
+]
+
+
+@pytest.mark.parametrize('source', list(PARSED.values()) + [f'print {e};' for e in EXPRESSIONS],
+                         ids=list(PARSED) + EXPRESSIONS)
+def test_pratt_parser(source):
+    assert repr(PrattParser(Scanner(source).scan_tokens()).parse()) == tree(source)
+
+
+# every program parsed in several worker processes at once, each worker
+# parsing a run of top-level statements
+@pytest.mark.parametrize('parser_class', [Parser, PrattParser], ids=['default', 'pratt'])
+def test_parse_parallel(parser_class):
+    source = '\n'.join(PARSED.values())
+    block = parse_parallel(source, 2, parser_class, min_source_bytes=0)
+    assert repr(block) == tree(source)
+    expected = Parser(Scanner(source).scan_tokens()).parse()
+    assert [stmt.name.line for stmt in block.statements if isinstance(stmt, FunctionDeclaration)] == \
+           [stmt.name.line for stmt in expected.statements if isinstance(stmt, FunctionDeclaration)]
+
+
+@pytest.mark.parametrize('parser_class', [Parser, PrattParser], ids=['default', 'pratt'])
+@pytest.mark.parametrize('name', PARSED)
+def test_lazy_bodies(name, parser_class):
+    source = PARSED[name]
+    block = parser_class(Scanner(source).scan_tokens(), lazy=True).parse()
+    functions = [stmt for stmt in block.statements if isinstance(stmt, FunctionDeclaration)]
+    assert not any(function.is_parsed() for function in functions)
+    assert repr(block) == tree(source)
+
+
+# a syntax error in a body only surfaces when the body is first accessed
+def test_lazy_body_error():
+    block = Parser(Scanner('func f() int { return 1 } print 2;').scan_tokens(), lazy=True).parse()
+    assert len(block.statements) == 2
+    with pytest.raises(ValueError):
+        block.statements[0].body
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Scanner import RegexScanner
+from Parser import Parser
+from TypeChecker import run_type_checker
+from interpreter import interpret
+from purity import MemoCache
+from closures import execute
+from bytecode import compile_bytecode, run_bytecode
+from transpile import compile_python, run_python
+from optimize import fold_constants, eliminate_dead_code
+from inline import inline_functions
+from tiered import TieredRuntime
+
+# Every program in programs/ prints the same on every engine, with the passes
+# that rewrite the tree or without them, as on the tree interpreter alone
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+
+# engine name -> run(block)
+ENGINES = {
+    'tree': interpret,
+    'memoized': lambda block: interpret(block, MemoCache()),
+    'closures': execute,
+    'vm': lambda block: run_bytecode(compile_bytecode(block)),
+    'python': lambda block: run_python(compile_python(block)),
+}
+
+
+# every function called twice gets compiled
+def run_tiered(block):
+    run_type_checker(block)
+    interpret(block, tiers=TieredRuntime(block, 2))
+
+
+try:
+    import llvmlite
+    ENGINES['tiered'] = run_tiered
+except ImportError:
+    pass
+
+
+# the Compiler loads wabbit/print_char.so from the working directory
+@pytest.fixture(scope='module')
+def wabbit_directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('tiered')
+    os.symlink(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), directory / 'wabbit')
+    return directory
+
+
+def run(name: str, engine: str='tree', inline: bool=False, optimize: bool=False) -> str:
+    with open(os.path.join(PROGRAMS, name)) as fid:
+        block = Parser(RegexScanner(fid.read()).scan_tokens()).parse()
+    if inline or optimize:
+        run_type_checker(block)
+    if inline:
+        inline_functions(block)
+    if optimize:
+        fold_constants(block)
+        eliminate_dead_code(block)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        ENGINES[engine](block)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('passes', [{}, {'optimize': True}, {'inline': True}, {'inline': True, 'optimize': True}],
+                         ids=['plain', 'optimize', 'inline', 'inline+optimize'])
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', sorted(f for f in os.listdir(PROGRAMS) if f.endswith('.wb')))
+def test_passes_keep_output(name, engine, passes, wabbit_directory, monkeypatch):
+    monkeypatch.chdir(wabbit_directory)
+    assert run(name, engine, **passes) == run(name)
@@ -0,0 +1,135 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import ctypes
+import time
+from Token import *
+from Model import *
+from callgraph import CallGraph
+from optimize import evaluable_functions
+from interpreter import InterpreterContext, call_function
+
+# Tiered execution: every function starts in the interpreter, which counts its
+# calls and the iterations of its loops. Once a function has run
+# `threshold` of them it is compiled with the Compiler through the MCJIT, and
+# its later calls go to the native code through ctypes. LLVM is only
+# initialized when the first function gets hot, so code that runs once never
+# pays for it.
+#
+# Only functions whose result depends on their arguments alone are compiled
+# (see optimize.evaluable_functions): they print nothing and touch no
+# globals, which live in the interpreter. Floats are compiled as doubles and
+# ints as checked i64 (see Compiler): a call whose ints leave the i64 range
+# or that divides by zero fails and runs again in the interpreter, which
+# gets the big int or raises. Functions the Compiler cannot handle stay
+# interpreted.
+DEFAULT_TIER_THRESHOLD = 1000
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+# ctypes of the values a native function takes and returns, chars are
+# interpreted as str and have none
+CTypes = {
+    TokenType.TYPENAME_INTEGER: ctypes.c_int64,
+    TokenType.TYPENAME_FLOAT: ctypes.c_double,
+    TokenType.TYPENAME_BOOL: ctypes.c_bool,
+}
+
+
+# ctypes prototype of the native function, None when a type has no ctype
+def prototype(node: FunctionDeclaration) -> Optional[type]:
+    types = [node.return_type.token_type] + [p.type_token.token_type for p in node.params]
+    if not all(t in CTypes for t in types):
+        return None
+    return ctypes.CFUNCTYPE(*[CTypes[t] for t in types])
+
+
+class TieredRuntime:
+    def __init__(self, block: Block, threshold: int=DEFAULT_TIER_THRESHOLD):
+        self.graph = CallGraph(block)
+        self.threshold = threshold
+        self.candidates: Set[str] = {name for name in evaluable_functions(block)
+                                     if prototype(self.graph.functions[name]) is not None}
+        # name -> calls and loop iterations so far
+        self.counts: Dict[str, int] = {}
+        # name -> (native entry point, failure flag of its engine)
+        self.native: Dict[str, Tuple[Callable, ctypes.c_bool]] = {}
+        # (name, seconds spent compiling) of each compilation, successful or not
+        self.compiled: List[Tuple[str, float]] = []
+        self.failed: Set[str] = set()
+        # the engines own the code of the entry points
+        self.engines = []
+
+    def call(self, func: FunctionDeclaration, args: List, context: InterpreterContext):
+        name = func.name.lexeme
+        native = self.native.get(name)
+        if native is None:
+            count = self.counts.get(name, 0) + 1
+            self.counts[name] = count
+            if count >= self.threshold and name in self.candidates:
+                native = self.compile(name)
+        # ctypes silently wraps ints beyond the i64 range
+        if native is not None and all(type(arg) is not int or INT64_MIN <= arg <= INT64_MAX for arg in args):
+            function, failed = native
+            value = function(*args)
+            if not failed.value:
+                return value
+            failed.value = False
+        return call_function(func, args, context)
+
+    def back_edges(self, func: FunctionDeclaration, iterations: int):
+        name = func.name.lexeme
+        self.counts[name] = self.counts.get(name, 0) + iterations
+
+    # name and the functions it calls, directly or not, in declaration order
+    # so every callee is compiled before its callers
+    def module_functions(self, name: str) -> List[FunctionDeclaration]:
+        pending = [name]
+        seen = {name}
+        while pending:
+            for callee in self.graph.calls(pending.pop()):
+                if callee not in seen:
+                    seen.add(callee)
+                    pending.append(callee)
+        return [node for callee, node in self.graph.functions.items() if callee in seen]
+
+    # Compiles name with its callees into an engine of its own and swaps the
+    # calls of all of them to the native code. None when the Compiler fails
+    # on one, they then stay interpreted.
+    def compile(self, name: str) -> Optional[Tuple[Callable, ctypes.c_bool]]:
+        import llvmlite.binding as llvm
+        from llvmlite import ir
+        from Compiler import Compiler
+        start = time.perf_counter()
+        functions = self.module_functions(name)
+        try:
+            if not self.engines:
+                llvm.initialize()
+                llvm.initialize_native_target()
+                llvm.initialize_native_asmprinter()
+            block = Block(functions)
+            # the functions are resolved already, they read no globals
+            block.frame_size = 0
+            compiler = Compiler(ir.DoubleType(), checked=True)
+            compiler.build(block)
+            # the engine owns the target machine
+            target_machine = llvm.Target.from_default_triple().create_target_machine()
+            engine = llvm.create_mcjit_compiler(llvm.parse_assembly(str(compiler.module)), target_machine)
+            engine.finalize_object()
+        except (ValueError, KeyError, AssertionError, AttributeError):
+            self.candidates -= {node.name.lexeme for node in functions}
+            self.failed.add(name)
+            self.compiled.append((name, time.perf_counter() - start))
+            return None
+
+        self.engines.append(engine)
+        failed = ctypes.c_bool.from_address(engine.get_global_value_address(Compiler.FAILED))
+        for node in functions:
+            callee = node.name.lexeme
+            if callee in self.candidates:
+                self.native[callee] = prototype(node)(engine.get_function_address(callee)), failed
+        self.compiled.append((name, time.perf_counter() - start))
+        return self.native[name]
+
+    def __repr__(self):
+        compiled = ', '.join(f"{name}{' (failed)' if name in self.failed else ''} in {seconds * 1000:.1f}ms"
+                             for name, seconds in self.compiled)
+        return f"native {', '.join(sorted(self.native)) or 'none'}; compiled {compiled or 'nothing'}"
@@ -0,0 +1,286 @@
+from typing import List, Set, Union
+from types import CodeType
+import marshal
+import math
+import sys
+from Token import *
+from Model import *
+from dispatch import DispatchTable
+from Resolver import *
+from closures import static_type
+from bytecode import BytecodeCache
+
+# Third engine: the resolved, optionally type checked tree is written out as
+# Python source and compiled with compile(), so CPython's own bytecode runs
+# the program. Functions become module level defs named f_<name>, variables
+# are named after their slots, l<index>_<name> for locals and g<index>_<name>
+# for globals, and the top-level code is the function _main so its globals
+# are loaded like the functions load them. The code runs in a namespace with
+# the helpers below.
+TRANSPILE_VERSION = 1
+TRANSPILE_SUFFIX = '.wbpy'
+DEFAULT_PRINT_BUFFER = 4096
+
+
+class TranspileContext:
+    def __init__(self, functions: Set[str]):
+        # names of the declared functions
+        self.functions = functions
+        self.declarations: List[FunctionDeclaration] = []
+        # source of the function being written
+        self.lines: List[str] = []
+        self.indent = 0
+        # globals the function being written assigns, declared global in it
+        self.assigned: Set[str] = set()
+
+    def line(self, text: str):
+        self.lines.append('    ' * self.indent + text)
+
+
+def variable(symbol: Symbol) -> str:
+    return f"{'l' if symbol.depth else 'g'}{symbol.index}_{symbol.name}"
+
+
+# node class -> handler(node, context) returning the Python expression for node
+Expressions = DispatchTable()
+
+
+def expression(node: Expression, context: TranspileContext) -> str:
+    return Expressions[type(node)](node, context)
+
+
+# folding can overflow floats, whose repr is then no Python expression
+@Expressions.register(Literal)
+def expression_literal(node: Literal, context: TranspileContext) -> str:
+    if isinstance(node.value, float) and not math.isfinite(node.value):
+        return f"float('{node.value}')"
+    return repr(node.value)
+
+
+@Expressions.register(Name)
+def expression_name(node: Name, context: TranspileContext) -> str:
+    return 'None' if node.symbol is None else variable(node.symbol)
+
+
+@Expressions.register(Grouping)
+def expression_grouping(node: Grouping, context: TranspileContext) -> str:
+    return expression(node.expression, context)
+
+
+Operators = {
+    TokenType.PLUS: '+',
+    TokenType.MINUS: '-',
+    TokenType.STAR: '*',
+    TokenType.EQUAL_EQUAL: '==',
+    TokenType.BANG_EQUAL: '!=',
+    TokenType.LESS: '<',
+    TokenType.LESS_EQUAL: '<=',
+    TokenType.GREATER: '>',
+    TokenType.GREATER_EQUAL: '>=',
+}
+
+
+@Expressions.register(BinaryOp, LogicalExpression)
+def expression_binary_op(node: Union[BinaryOp, LogicalExpression], context: TranspileContext) -> str:
+    lhs = expression(node.left_expression, context)
+    rhs = expression(node.right_expression, context)
+    op = node.op.token_type
+    if op == TokenType.SLASH and isinstance(node, BinaryOp):
+        # floats divide, ints truncate toward zero like Literal.__truediv__
+        if static_type(node) == TokenType.TYPENAME_FLOAT:
+            return f'({lhs} / {rhs})'
+        return f'_divide({lhs}, {rhs})'
+    if op not in Operators:
+        raise RuntimeError(f"failed to interpret {node!r}")
+    return f'({lhs} {Operators[op]} {rhs})'
+
+
+@Expressions.register(UnaryOp)
+def expression_unary_op(node: UnaryOp, context: TranspileContext) -> str:
+    if node.op.token_type == TokenType.MINUS:
+        return f'(-{expression(node.expression, context)})'
+    elif node.op.token_type == TokenType.BANG:
+        return f'(not {expression(node.expression, context)})'
+    else:
+        raise RuntimeError(f"failed to interpret {node!r}")
+
+
+@Expressions.register(Call)
+def expression_call(node: Call, context: TranspileContext) -> str:
+    name = node.callee.token.lexeme
+    if name not in context.functions:
+        return f'_undefined({name!r})'
+    return f"f_{name}({', '.join(expression(arg, context) for arg in node.arguments)})"
+
+
+# node class -> handler(node, context) writing the lines of node
+Statements = DispatchTable()
+
+
+def statement(node: Node, context: TranspileContext):
+    # literals are no Expression
+    if isinstance(node, (Expression, Literal)):
+        context.line(expression(node, context))
+    else:
+        Statements[type(node)](node, context)
+
+
+# the statements of node indented one level, pass when there are none
+def body(node: Node, context: TranspileContext):
+    context.indent += 1
+    start = len(context.lines)
+    statement(node, context)
+    if len(context.lines) == start:
+        context.line('pass')
+    context.indent -= 1
+
+
+@Statements.register(Block)
+def statement_block(node: Block, context: TranspileContext):
+    for stmt in node.statements:
+        statement(stmt, context)
+
+
+def store(symbol: Symbol, value: str, context: TranspileContext):
+    name = variable(symbol)
+    if symbol.depth == 0:
+        context.assigned.add(name)
+    context.line(f'{name} = {value}')
+
+
+@Statements.register(VarDeclaration, ConstDeclaration)
+def statement_declaration(node: Union[VarDeclaration, ConstDeclaration], context: TranspileContext):
+    value = 'None' if node.expression is None else expression(node.expression, context)
+    store(node.symbol, value, context)
+
+
+@Statements.register(Assignment)
+def statement_assignment(node: Assignment, context: TranspileContext):
+    if node.symbol is None:
+        message = f"Tried to assign undeclared variable {node.name.lexeme}"
+        context.line(f'raise RuntimeError({message!r})')
+    else:
+        store(node.symbol, expression(node.expression, context), context)
+
+
+@Statements.register(PrintStatement)
+def statement_print(node: PrintStatement, context: TranspileContext):
+    context.line(f'_print({expression(node.expression, context)})')
+
+
+@Statements.register(IfStatement)
+def statement_if(node: IfStatement, context: TranspileContext):
+    context.line(f'if {expression(node.condition, context)}:')
+    body(node.then_branch, context)
+    if node.else_branch is not None:
+        context.line('else:')
+        body(node.else_branch, context)
+
+
+@Statements.register(WhileStatement)
+def statement_while(node: WhileStatement, context: TranspileContext):
+    context.line(f'while {expression(node.condition, context)}:')
+    body(node.body, context)
+
+
+@Statements.register(Break)
+def statement_break(node: Break, context: TranspileContext):
+    context.line('break')
+
+
+@Statements.register(Continue)
+def statement_continue(node: Continue, context: TranspileContext):
+    context.line('continue')
+
+
+@Statements.register(Return)
+def statement_return(node: Return, context: TranspileContext):
+    context.line(f'return {expression(node.expression, context)}')
+
+
+# written after the function they are declared in, at module level
+@Statements.register(FunctionDeclaration)
+def statement_function_declaration(node: FunctionDeclaration, context: TranspileContext):
+    context.declarations.append(node)
+
+
+# def line, global line and body of a function
+def function(name: str, params: List[str], node: Node, context: TranspileContext) -> List[str]:
+    context.lines = []
+    context.assigned = set()
+    body(node, context)
+    lines = [f"def {name}({', '.join(params)}):"]
+    if context.assigned:
+        lines.append(f"    global {', '.join(sorted(context.assigned))}")
+    return lines + context.lines
+
+
+# Python source of a block, defining _main and a function per declaration
+def transpile(block: Block) -> str:
+    if not is_resolved(block):
+        resolve(block)
+    context = TranspileContext(set())
+    declarations = [stmt for stmt in block.statements if isinstance(stmt, FunctionDeclaration)]
+    context.functions.update(stmt.name.lexeme for stmt in declarations)
+
+    lines = function('_main', [], block, context)
+    while context.declarations:
+        node = context.declarations.pop(0)
+        context.functions.add(node.name.lexeme)
+        lines.append('')
+        lines += function(f'f_{node.name.lexeme}', [variable(p.symbol) for p in node.params], node.body, context)
+    return '\n'.join(lines) + '\n'
+
+
+def compile_python(block: Block, filename: str='<wabbit>') -> CodeType:
+    return compile(transpile(block), filename, 'exec')
+
+
+def undefined(name: str):
+    raise RuntimeError(f"Tried calling undefined function '{name}'")
+
+
+# Prints like print(), a line per value, but writes them to stdout
+# `size` lines at a time
+class PrintBuffer:
+    def __init__(self, size: int=DEFAULT_PRINT_BUFFER):
+        self.lines: List[str] = []
+        self.size = size
+
+    def print(self, value):
+        lines = self.lines
+        lines.append(str(value))
+        if len(lines) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            sys.stdout.write('\n'.join(self.lines) + '\n')
+            self.lines.clear()
+
+
+# Run code like interpret() runs the tree
+def run_python(code: CodeType):
+    output = PrintBuffer()
+    namespace = {'__name__': 'wabbit', '_divide': divide, '_print': output.print, '_undefined': undefined}
+    exec(code, namespace)
+    try:
+        return namespace['_main']()
+    finally:
+        output.flush()
+
+
+# Compiled code objects of a source file in a .wbpy file next to it, keyed
+# like the bytecode files
+class CodeCache(BytecodeCache):
+    suffix = TRANSPILE_SUFFIX
+    version = TRANSPILE_VERSION
+
+    def dumps(self, code: CodeType) -> bytes:
+        return marshal.dumps(code)
+
+    def loads(self, data: bytes) -> CodeType:
+        code = marshal.loads(data)
+        if not isinstance(code, CodeType):
+            raise TypeError(f"{self.path} holds no code object")
+        return code